@@ -0,0 +1,136 @@
+"""
+Local SQLite store of scraped sources and articles.
+Every run records each article by canonical URL with first-seen/last-seen timestamps,
+so generation can ask for only the articles first seen since the last newsletter
+and trends across issues can be queried without re-scraping.
+"""
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import ARTICLE_STORE_PATH
+from dedup import canonical_url
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    url          TEXT PRIMARY KEY,
+    first_seen   TEXT NOT NULL,
+    last_seen    TEXT NOT NULL,
+    scrape_count INTEGER NOT NULL DEFAULT 1,
+    last_text    TEXT
+);
+CREATE TABLE IF NOT EXISTS articles (
+    url        TEXT PRIMARY KEY,  -- canonical URL
+    source     TEXT NOT NULL,
+    title      TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen  TEXT NOT NULL,
+    seen_count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_articles_source ON articles (source, first_seen);
+CREATE INDEX IF NOT EXISTS idx_articles_first_seen ON articles (first_seen);
+"""
+
+
+class ArticleStore:
+    """Thin wrapper around the SQLite database at ARTICLE_STORE_PATH."""
+
+    def __init__(self, path: str = ARTICLE_STORE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def record_scrape(self, items: List[Dict], seen_at: Optional[datetime] = None) -> None:
+        """Upsert successfully scraped sources and their articles."""
+        ts = (seen_at or datetime.now()).isoformat()
+        sources = []
+        articles = []
+        for item in items:
+            if not item.get('success'):
+                continue
+            sources.append((item['url'], ts, ts, item.get('text', '')))
+            for article in item.get('articles', []):
+                articles.append((canonical_url(article['url']), item['url'], article['title'], ts, ts))
+        with self.conn:
+            self.conn.executemany(
+                """INSERT INTO sources (url, first_seen, last_seen, last_text) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(url) DO UPDATE SET last_seen = excluded.last_seen,
+                       scrape_count = scrape_count + 1, last_text = excluded.last_text""",
+                sources,
+            )
+            self.conn.executemany(
+                """INSERT INTO articles (url, source, title, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(url) DO UPDATE SET last_seen = excluded.last_seen,
+                       title = excluded.title, seen_count = seen_count + 1""",
+                articles,
+            )
+        logger.info("Article store: recorded %d source(s), %d article(s)", len(sources), len(articles))
+
+    def first_seen(self, urls: List[str]) -> Dict[str, str]:
+        """Map canonical URL -> first-seen timestamp for the URLs present in the store."""
+        found = {}
+        keys = list({canonical_url(u) for u in urls})
+        for start in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            batch = keys[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.conn.execute(
+                f"SELECT url, first_seen FROM articles WHERE url IN ({placeholders})", batch
+            )
+            found.update(rows)
+        return found
+
+    def filter_new_since(self, items: List[Dict], since: datetime) -> List[Dict]:
+        """Return copies of `items` keeping only articles first seen after `since`.
+
+        Articles not yet in the store count as new. Page text is kept as is.
+        """
+        cutoff = since.isoformat()
+        first_seen = self.first_seen([a['url'] for item in items for a in item.get('articles', [])])
+        filtered = []
+        kept = total = 0
+        for item in items:
+            articles = [
+                a for a in item.get('articles', [])
+                if first_seen.get(canonical_url(a['url']), '9999') > cutoff
+            ]
+            kept += len(articles)
+            total += len(item.get('articles', []))
+            filtered.append({**item, 'articles': articles})
+        logger.info("Article store: %d/%d article(s) are new since %s", kept, total, cutoff)
+        return filtered
+
+    def trends(self, since: datetime, limit: int = 20) -> List[Dict]:
+        """Sources ranked by how many new articles they published since `since`."""
+        rows = self.conn.execute(
+            """SELECT source, COUNT(*) AS new_articles, MIN(first_seen), MAX(first_seen)
+               FROM articles WHERE first_seen > ? GROUP BY source
+               ORDER BY new_articles DESC LIMIT ?""",
+            (since.isoformat(), limit),
+        )
+        return [
+            {'source': source, 'new_articles': count, 'first': first, 'last': last}
+            for source, count, first, last in rows
+        ]
+
+    def recurring_articles(self, min_runs: int = 2, limit: int = 20) -> List[Dict]:
+        """Articles that stayed on a source page across several scrapes (long-running stories)."""
+        rows = self.conn.execute(
+            """SELECT title, url, source, seen_count, first_seen, last_seen FROM articles
+               WHERE seen_count >= ? ORDER BY seen_count DESC, last_seen DESC LIMIT ?""",
+            (min_runs, limit),
+        )
+        keys = ('title', 'url', 'source', 'seen_count', 'first_seen', 'last_seen')
+        return [dict(zip(keys, row)) for row in rows]
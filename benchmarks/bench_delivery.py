@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Benchmark smtp_delivery against a local SMTP sink that delays every reply to stand in
+for a remote server: one session (the previous send loop) vs several parallel sessions.
+Each run uses a fresh journal, and every recipient must be delivered exactly once.
+
+    python benchmarks/bench_delivery.py                          # 2,000 recipients, 5ms replies
+    python benchmarks/bench_delivery.py --recipients 500 --latency 0.02 --sessions 1 8 16
+"""
+import argparse
+import smtplib
+import tempfile
+
+from fixtures import SmtpSink, sample_newsletter, synthetic_recipients
+
+import email_sender
+from smtp_delivery import deliver
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipients', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds per SMTP reply")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--per-connection', type=int, default=100)
+    args = parser.parse_args()
+
+    recipients = synthetic_recipients(args.recipients)
+    rendered = email_sender.render_message(sample_newsletter(), "MBT Newsletter - Benchmark")
+
+    print(f"{'sessions':>8} {'sent':>7} {'connections':>11} {'seconds':>8} {'msgs/s':>8}")
+    baseline = None
+    for sessions in args.sessions:
+        with SmtpSink(latency=args.latency) as sink, tempfile.TemporaryDirectory() as journal_dir:
+            report = deliver(rendered, recipients, 'bench', connect_fn=lambda: smtplib.SMTP(*sink.address),
+                             concurrency=sessions, max_per_minute=0,
+                             max_messages_per_connection=args.per_connection, journal_dir=journal_dir)
+            assert sink.delivered == {r: 1 for r in recipients}, "every recipient exactly once"
+        rate = report['sent'] / report['seconds']
+        baseline = baseline or rate
+        print(f"{sessions:>8} {report['sent']:>7} {report['connections']:>11} {report['seconds']:>8.2f} "
+              f"{rate:>8.0f}  ({rate / baseline:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark HTML extraction: the previous BeautifulSoup/html.parser path vs the
+single-pass extractor backends, on saved copies of the NEWS_SOURCES pages.
+
+    python benchmarks/bench_extract.py --fetch    # save fresh snapshots first
+    python benchmarks/bench_extract.py            # run on saved (or synthetic) pages
+"""
+import argparse
+import os
+import time
+
+from fixtures import PAGES_DIR, load_pages, snapshot_path
+
+from config import NEWS_SOURCES
+import extractor
+
+
+def legacy_parse(content: bytes, url: str) -> dict:
+    """The pre-extractor scrape_source parsing path, kept as the benchmark reference."""
+    from bs4 import BeautifulSoup
+    from urllib.parse import urljoin
+
+    soup = BeautifulSoup(content, 'html.parser')
+    for script in soup(["script", "style", "nav", "footer", "header"]):
+        script.decompose()
+    text = soup.get_text(separator=' ', strip=True)
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = ' '.join(chunk for chunk in chunks if chunk)
+    articles = []
+    for link in soup.find_all('a', href=True):
+        title = link.get_text(strip=True)
+        href = link.get('href', '')
+        if title and len(title) > 10 and len(title) < 200:
+            if href.startswith('/'):
+                href = urljoin(url, href)
+            articles.append({'title': title, 'url': href})
+    return {'text': text[:5000], 'articles': articles[:20]}
+
+
+def fetch_snapshots(directory: str) -> None:
+    import http_transport
+
+    os.makedirs(directory, exist_ok=True)
+    for url in NEWS_SOURCES:
+        try:
+            response = http_transport.get(url, timeout=30, headers={'User-Agent': 'Mozilla/5.0'})
+            response.raise_for_status()
+        except Exception as e:
+            print(f"skip {url}: {e}")
+            continue
+        with open(snapshot_path(url, directory), 'wb') as f:
+            f.write(response.content)
+        print(f"saved {url} ({len(response.content)} bytes)")
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', default=PAGES_DIR, help='directory with saved page snapshots')
+    parser.add_argument('--fetch', action='store_true', help='download fresh snapshots before benchmarking')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch_snapshots(args.pages)
+
+    totals = {'bs4': 0.0, 'lxml': 0.0, 'stream': 0.0}
+    print(f"{'page':<45} {'KB':>6} {'bs4 ms':>8} {'lxml ms':>8} {'stream ms':>9} {'speedup':>8}")
+    for url, body, is_snapshot in load_pages(NEWS_SOURCES, args.pages):
+        timings = {
+            'bs4': best_of(lambda: legacy_parse(body, url), args.repeat),
+            'lxml': best_of(lambda: extractor.extract(body.decode('utf-8', 'replace'), url, 'lxml'), args.repeat),
+            'stream': best_of(lambda: extractor.extract(body.decode('utf-8', 'replace'), url, 'stream'), args.repeat),
+        }
+        for name, value in timings.items():
+            totals[name] += value
+        label = url if is_snapshot else f"{url} (synthetic)"
+        print(f"{label[:45]:<45} {len(body) / 1024:>6.0f} {timings['bs4'] * 1000:>8.1f} "
+              f"{timings['lxml'] * 1000:>8.1f} {timings['stream'] * 1000:>9.1f} "
+              f"{timings['bs4'] / timings['lxml']:>7.1f}x")
+    print(f"{'TOTAL':<45} {'':>6} {totals['bs4'] * 1000:>8.1f} {totals['lxml'] * 1000:>8.1f} "
+          f"{totals['stream'] * 1000:>9.1f} {totals['bs4'] / totals['lxml']:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
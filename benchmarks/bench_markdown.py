@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Check and benchmark the newsletter markdown parser (newsletter_markdown.parse) on the
+hand-written example outputs in benchmarks/newsletters/*.md (the SYSTEM_PROMPT format and
+common drift from it), plus the synthetic newsletter of fixtures.py.
+
+For every output the parser must find the expected structure (EXPECTED), keep every word
+of the text, produce balanced inline HTML, and give back the same AST when its own text
+rendering is parsed again. Parse time is compared with the line-by-line parser it replaced.
+Exits non-zero if a check fails.
+
+Record a new output with `python main.py --test 2>/dev/null > benchmarks/newsletters/<name>.md`
+(the log goes to stderr) and add its expected shape to EXPECTED.
+
+    python benchmarks/bench_markdown.py
+    python benchmarks/bench_markdown.py --repeat 5000
+"""
+import argparse
+import re
+import sys
+import time
+from html.parser import HTMLParser
+
+from fixtures import load_newsletters, sample_newsletter
+
+from newsletter_markdown import inline_html, parse, plain_text, render_text
+
+# (intro paragraphs, stories, stories with both insight and move, takeaways)
+EXPECTED = {
+    'canonical.md': (0, 3, 3, 3),
+    'drift_bold_labels.md': (1, 2, 2, 2),
+    'drift_headings.md': (1, 2, 2, 2),
+    'unstructured.md': (2, 0, 0, 0),
+    'synthetic': (0, 5, 5, 3),
+}
+
+_WORD_RE = re.compile(r"\w+")
+_NUMBERING_RE = re.compile(r"^\s*\d+[.)]\s")
+# Words the parser turns into structure instead of text
+_STRUCTURE_WORDS = {'key', 'takeaway', 'takeaways', 'strategic', 'insight', 'your', 'move'}
+
+
+def legacy_parse(content: str):
+    """The line-by-line parser email_sender used before newsletter_markdown."""
+    sections = []
+    current_section = {'title': None, 'content': [], 'insight': None, 'action': None}
+    in_key_takeaways = False
+    key_takeaways = []
+    for line in content.split('\n'):
+        line = line.strip()
+        if 'Key takeaways:' in line:
+            in_key_takeaways = True
+            remainder = line.split(':', 1)[1].strip()
+            if remainder:
+                key_takeaways.append(remainder)
+        elif in_key_takeaways:
+            if line:
+                key_takeaways.append(line)
+        elif line.startswith('**') and line.endswith('**') and len(line) > 4:
+            if current_section['title']:
+                sections.append(current_section)
+            current_section = {'title': line.strip('*').strip(), 'content': [], 'insight': None, 'action': None}
+        elif line.startswith('Strategic insight:'):
+            current_section['insight'] = line.replace('Strategic insight:', '').strip()
+        elif line.startswith('Your move:'):
+            current_section['action'] = line.replace('Your move:', '').strip()
+        elif line and current_section['title']:
+            current_section['content'].append(line)
+    if current_section['title']:
+        sections.append(current_section)
+    return sections, key_takeaways
+
+
+class _TagBalance(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.open = []
+        self.ok = True
+
+    def handle_starttag(self, tag, attrs):
+        self.open.append(tag)
+
+    def handle_endtag(self, tag):
+        self.ok = self.ok and bool(self.open) and self.open.pop() == tag
+
+
+def check(name: str, content: str) -> list:
+    """Problems found in the parse of one output (empty if none)."""
+    problems = []
+    doc = parse(content)
+    shape = (len(doc.intro), len(doc.sections),
+             sum(1 for s in doc.sections if s.insight and s.action), len(doc.takeaways))
+    if name in EXPECTED and shape != EXPECTED[name]:
+        problems.append(f"structure {shape}, expected {EXPECTED[name]}")
+    text = render_text(doc)
+    if parse(text) != doc:
+        problems.append("text rendering does not parse back to the same AST")
+    # Every word must survive, except the masthead, list numbers and labels turned into structure
+    body = '\n'.join(_NUMBERING_RE.sub('', line) for line in content.split('\n')
+                     if not line.lstrip().startswith('# '))
+    kept = set(_WORD_RE.findall(text.lower()))
+    lost = {w for w in _WORD_RE.findall(body.lower()) if w not in kept} - _STRUCTURE_WORDS
+    if lost:
+        problems.append(f"words lost: {sorted(lost)[:10]}")
+    spans = list(doc.intro) + list(doc.takeaways)
+    for s in doc.sections:
+        spans += [s.title, s.insight, s.action] + s.paragraphs
+    for span in spans:
+        balance = _TagBalance()
+        balance.feed(inline_html(span))
+        if not balance.ok or balance.open:
+            problems.append(f"unbalanced HTML for {plain_text(span)[:40]!r}")
+            break
+    return problems
+
+
+def per_call_us(fn, repeat: int, rounds: int = 7) -> float:
+    """Median CPU time per call over several rounds (steadier than wall time on busy machines)."""
+    fn()
+    samples = []
+    for _ in range(rounds):
+        started = time.thread_time()
+        for _ in range(repeat):
+            fn()
+        samples.append((time.thread_time() - started) / repeat * 1e6)
+    return sorted(samples)[rounds // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+
+    outputs = load_newsletters()
+    outputs.append(('synthetic', sample_newsletter()))
+
+    failed = False
+    print(f"{'output':<24} {'KB':>5} {'stories':>7} {'legacy':>7} {'legacy us':>10} {'parse us':>9}  checks")
+    for name, content in outputs:
+        problems = check(name, content)
+        failed = failed or bool(problems)
+        legacy_stories = len(legacy_parse(content)[0])
+        legacy = per_call_us(lambda: legacy_parse(content), args.repeat)
+        new = per_call_us(lambda: parse(content), args.repeat)
+        print(f"{name:<24} {len(content) / 1024:>5.1f} {len(parse(content).sections):>7} {legacy_stories:>7} "
+              f"{legacy:>10.1f} {new:>9.1f}  {'; '.join(problems) or 'ok'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark message building for a newsletter send: the previous per-recipient
+MIMEMultipart + send_message path vs rendering once and prepending the To header.
+"build" times only producing each recipient's message bytes; "send" also delivers
+them to a local SMTP sink (CPU time of the sending thread, so SMTP protocol overhead
+is included).
+
+    python benchmarks/bench_mime.py                     # 10,000 synthetic recipients
+    python benchmarks/bench_mime.py --recipients 1000
+"""
+import argparse
+import smtplib
+import time
+from email import policy
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from fixtures import SmtpSink, sample_newsletter, synthetic_recipients
+
+from config import EMAIL_ADDRESS
+import email_sender
+import smtp_delivery
+
+# What smtplib's send_message flattens with
+SMTP_POLICY = policy.compat32.clone(linesep='\r\n')
+
+
+def legacy_message(content: str, html_content: str, subject: str, recipient: str) -> MIMEMultipart:
+    """The pre-render_message per-recipient message, kept as the benchmark reference."""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = EMAIL_ADDRESS
+    msg['To'] = recipient
+    msg.attach(MIMEText(html_content, 'html'))
+    msg.attach(MIMEText(content, 'plain'))
+    return msg
+
+
+def build_cost(recipients, build) -> float:
+    """CPU seconds per recipient to produce the message bytes."""
+    cpu = time.thread_time()
+    for recipient in recipients:
+        build(recipient)
+    return (time.thread_time() - cpu) / len(recipients)
+
+
+def run(label: str, recipients, address, send, build_us: float) -> dict:
+    with smtplib.SMTP(*address) as server:
+        cpu, wall = time.thread_time(), time.perf_counter()
+        for recipient in recipients:
+            send(server, recipient)
+        cpu, wall = time.thread_time() - cpu, time.perf_counter() - wall
+    n = len(recipients)
+    print(f"{label:<10} {n:>7} {build_us:>13.1f} {cpu * 1e6 / n:>12.1f} {wall * 1e6 / n:>13.1f} {wall:>8.2f}")
+    return {'cpu_per_recipient': cpu / n, 'wall': wall}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipients', type=int, default=10000)
+    args = parser.parse_args()
+
+    content = sample_newsletter()
+    subject = "MBT Newsletter - Benchmark"
+    recipients = synthetic_recipients(args.recipients)
+
+    started = time.perf_counter()
+    html_content = email_sender.create_purdue_theme_html(content)
+    rendered = email_sender.render_message(content, subject, html_content)
+    render_ms = (time.perf_counter() - started) * 1000
+    print(f"HTML {len(html_content) / 1024:.1f} KB, text {len(content) / 1024:.1f} KB, "
+          f"rendered message {len(rendered) / 1024:.1f} KB in {render_ms:.1f} ms (once)")
+
+    legacy_build = lambda rcpt: legacy_message(content, html_content, subject, rcpt).as_bytes(policy=SMTP_POLICY)
+    current_build = lambda rcpt: smtp_delivery.message_for(rcpt, rendered)
+    legacy_us = build_cost(recipients, legacy_build) * 1e6
+    current_us = build_cost(recipients, current_build) * 1e6
+
+    print(f"{'path':<10} {'sent':>7} {'build us/rcpt':>13} {'cpu us/rcpt':>12} {'wall us/rcpt':>13} {'total s':>8}")
+    with SmtpSink() as sink:
+        legacy = run('legacy', recipients, sink.address, lambda server, rcpt: server.send_message(
+            legacy_message(content, html_content, subject, rcpt)), legacy_us)
+        current = run('render1x', recipients, sink.address, lambda server, rcpt: server.sendmail(
+            EMAIL_ADDRESS, [rcpt], current_build(rcpt)), current_us)
+        print(f"sink received {sink.messages} messages, {sink.bytes / 1e6:.1f} MB")
+    print(f"per-recipient build CPU: {legacy_us / current_us:.0f}x less; "
+          f"per-recipient send CPU: {legacy['cpu_per_recipient'] / current['cpu_per_recipient']:.1f}x less")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark end-to-end latency of the sequential run against the pipelined one (pipeline.py),
+with every stage's latency simulated: each source takes its own time to scrape (one of them
+a straggler), model calls sleep (map calls less than the final one) and SMTP sessions take
+time to connect to a local sink before the issue is delivered to a few recipients.
+Scraped items come from the page fixtures and the real selection code runs on them.
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --straggler 6 --deadline 3 --modes map_reduce
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import smtplib
+import tempfile
+import time
+
+from fixtures import SmtpSink, SnapshotResponse, load_pages, sample_newsletter, synthetic_recipients
+
+from config import NEWS_SOURCES
+import email_sender
+import llm_router
+import main as newsletter_main
+import map_reduce
+import pipeline
+import scraper
+from smtp_delivery import WarmConnections, deliver
+
+RECIPIENTS = 50
+
+
+def simulate(args) -> None:
+    """Replace the network-bound calls with sleeps of the configured lengths."""
+    pages = load_pages(NEWS_SOURCES)
+    items = {url: {'url': url, 'success': True, **scraper._stream_parse(SnapshotResponse(body), url)}
+             for url, body, _ in pages}
+    delays = {url: args.scrape * (1 + i / len(NEWS_SOURCES)) for i, url in enumerate(NEWS_SOURCES)}
+    delays[NEWS_SOURCES[-1]] = args.straggler
+
+    def scrape_source(url):
+        time.sleep(delays[url])
+        return dict(items[url])
+
+    def complete(system_prompt, user_prompt, max_tokens=None, on_chunk=None, **kwargs):
+        if max_tokens:
+            time.sleep(args.map_call)
+            titles = re.findall(r"^- (.+?)(?: \(|$)", user_prompt, re.M)[:3]
+            return json.dumps([{'title': t, 'url': '', 'summary': t, 'why': t, 'score': 3} for t in titles])
+        time.sleep(args.llm)
+        return sample_newsletter()
+
+    scraper.scrape_source = scrape_source
+    llm_router.complete = complete
+    pipeline.PIPELINE_DEADLINE_SEC = args.deadline
+
+
+def run(pipelined: bool, sink: SmtpSink, args, journal_dir: str) -> float:
+    def connect():
+        time.sleep(args.smtp_connect)
+        return smtplib.SMTP(*sink.address)
+
+    started = time.monotonic()
+    warm = WarmConnections(count=4, connect_fn=connect) if pipelined else None
+    try:
+        if pipelined:
+            _, content = newsletter_main._prepare_pipelined(on_generate=warm.start)
+        else:
+            _, content = newsletter_main._prepare()
+        rendered = email_sender.render_message(content, "MBT Newsletter - Benchmark")
+        deliver(rendered, synthetic_recipients(RECIPIENTS), f"bench-{pipelined}-{started}",
+                connect_fn=warm.connect if warm else connect, concurrency=4, max_per_minute=0,
+                journal_dir=journal_dir)
+    finally:
+        if warm:
+            warm.close()
+    return time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scrape', type=float, default=0.3, help='seconds for the fastest source')
+    parser.add_argument('--straggler', type=float, default=2.0, help='seconds for the slowest source')
+    parser.add_argument('--llm', type=float, default=2.0, help='seconds for a full (single or final) call')
+    parser.add_argument('--map-call', type=float, default=0.6, help='seconds for a map call')
+    parser.add_argument('--smtp-connect', type=float, default=0.5, help='seconds to connect and log in')
+    parser.add_argument('--deadline', type=float, default=pipeline.PIPELINE_DEADLINE_SEC)
+    parser.add_argument('--modes', nargs='+', default=['single', 'map_reduce'])
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    simulate(args)
+    print(f"{len(NEWS_SOURCES)} sources ({args.scrape:.1f}-{args.scrape * 2:.1f}s, straggler {args.straggler:.1f}s), "
+          f"model {args.llm:.1f}s (map {args.map_call:.1f}s), SMTP connect {args.smtp_connect:.1f}s")
+    print(f"{'mode':<12} {'sequential s':>12} {'pipelined s':>12} {'saved':>7}")
+    with tempfile.TemporaryDirectory() as workdir, SmtpSink() as sink:
+        # The article store, dedup index and delivery journals are written here
+        os.chdir(workdir)
+        for mode in args.modes:
+            map_reduce.GENERATION_MODE = mode
+            sequential = run(False, sink, args, workdir)
+            pipelined = run(True, sink, args, workdir)
+            print(f"{mode:<12} {sequential:>12.2f} {pipelined:>12.2f} {(1 - pipelined / sequential) * 100:>6.0f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark personalized rendering for a large list: recipients with random interest tags
+are grouped into segments, each segment is rendered once (email_sender.render_segments),
+and every recipient's message is produced by slot substitution (smtp_delivery.message_for).
+Rendering per recipient instead is estimated from the cost of one segment rendering.
+
+    python benchmarks/bench_segments.py                     # 50,000 recipients
+    python benchmarks/bench_segments.py --recipients 5000 --tags ai fintech
+"""
+import argparse
+import random
+import time
+
+from fixtures import sample_newsletter, synthetic_recipients
+
+import email_sender
+import smtp_delivery
+from segments import segment_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipients', type=int, default=50000)
+    parser.add_argument('--tags', nargs='+', default=['ai', 'fintech', 'devtools', 'startups'])
+    parser.add_argument('--max-tags', type=int, default=2, help="tags per recipient (0..max)")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    recipients = [(email, segment_key(rng.sample(args.tags, rng.randint(0, args.max_tags))))
+                  for email in synthetic_recipients(args.recipients)]
+    content = sample_newsletter()
+    subject = "MBT Newsletter - Benchmark"
+
+    started = time.perf_counter()
+    rendered = email_sender.render_segments(content, subject, recipients)
+    render_s = time.perf_counter() - started
+    segments = len({id(message) for message in rendered.values()})
+
+    cpu = time.thread_time()
+    total_bytes = sum(len(smtp_delivery.message_for(email, rendered[email])) for email, _ in recipients)
+    per_recipient_us = (time.thread_time() - cpu) / len(recipients) * 1e6
+
+    print(f"{len(recipients)} recipients in {segments} segments; {total_bytes / 1e6:.0f} MB of messages")
+    print(f"render: {render_s * 1000:.1f} ms total, {render_s / segments * 1000:.2f} ms per segment")
+    print(f"per-recipient fields: {per_recipient_us:.1f} us per recipient")
+    estimate = render_s / segments * len(recipients)
+    print(f"rendering per recipient instead: ~{estimate:.1f} s ({estimate / render_s:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark CLI startup: import time (python -X importtime), modules loaded and
+peak resident memory of fresh interpreters doing what main.py does before any work.
+
+- python:    a bare interpreter (the floor)
+- help:      `python main.py --help`
+- scheduler: what `python main.py --schedule` loads before it starts waiting
+- pipeline:  every module a full run imports, for comparison
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10 --top 15     # also list the slowest imports
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+from fixtures import REPO_DIR
+
+_REPORT = ("import json, resource, sys; print(json.dumps({'modules': len(sys.modules), "
+           "'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))")
+SCENARIOS = {
+    'python': "pass",
+    'help': "import runpy, sys; sys.argv = ['main.py', '--help']; runpy.run_path('main.py', run_name='__main__')",
+    'scheduler': "import main, scheduler, config",
+    'pipeline': "import main, metrics, scraper, article_store, dedup, ranking, map_reduce, "
+                "gemini_client, openai_client, email_sender",
+}
+# "import time: self [us] | cumulative | <indent>package"
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_once(code: str) -> dict:
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"{code}\n{_REPORT}"], cwd=REPO_DIR,
+                          capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    imports = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m:
+            imports.append((m.group(4), int(m.group(2)), len(m.group(3))))
+    # Top-level entries only: their cumulative times add up to the whole import time
+    result['import_ms'] = sum(cumulative for _, cumulative, depth in imports if depth == 1) / 1000
+    result['imports'] = imports
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help='list the N slowest top-level imports per scenario')
+    args = parser.parse_args()
+
+    print(f"{'scenario':<10} {'import ms':>10} {'modules':>8} {'peak RSS MB':>12}")
+    for name, code in SCENARIOS.items():
+        runs = sorted((run_once(code) for _ in range(args.repeat)), key=lambda r: r['import_ms'])
+        median = runs[len(runs) // 2]
+        print(f"{name:<10} {median['import_ms']:>10.1f} {median['modules']:>8} {median['rss_kb'] / 1024:>12.1f}")
+        if args.top:
+            top = sorted((i for i in median['imports'] if i[2] == 1), key=lambda i: -i[1])[:args.top]
+            for module, cumulative, _ in top:
+                print(f"    {cumulative / 1000:>8.1f} ms  {module}")
+
+
+if __name__ == '__main__':
+    main()
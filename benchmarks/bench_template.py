@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark newsletter HTML rendering (email_sender.create_purdue_theme_html) against the
+cost of its dynamic content alone: parsing the newsletter text (newsletter_markdown.parse)
+and rendering every piece of it as inline HTML. The difference is what assembling the
+template costs.
+
+    python benchmarks/bench_template.py
+    python benchmarks/bench_template.py --stories 12 --repeat 5000
+"""
+import argparse
+import time
+
+from fixtures import sample_newsletter
+
+import email_sender
+import newsletter_template
+from newsletter_markdown import inline_html, parse
+
+
+def per_call_us(fn, repeat: int, rounds: int = 7) -> float:
+    """Median CPU time per call over several rounds (steadier than wall time on busy machines)."""
+    fn()
+    samples = []
+    for _ in range(rounds):
+        started = time.thread_time()
+        for _ in range(repeat):
+            fn()
+        samples.append((time.thread_time() - started) / repeat * 1e6)
+    return sorted(samples)[rounds // 2]
+
+
+def dynamic_only(content: str) -> None:
+    doc = parse(content)
+    for p in doc.intro:
+        inline_html(p)
+    for section in doc.sections:
+        inline_html(section.title)
+        for p in section.paragraphs:
+            inline_html(p)
+        inline_html(section.insight)
+        inline_html(section.action)
+    for t in doc.takeaways:
+        inline_html(t)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stories', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+
+    content = sample_newsletter(args.stories)
+    floor = per_call_us(lambda: dynamic_only(content), args.repeat)
+    print(f"newsletter text {len(content) / 1024:.1f} KB, {args.stories} stories")
+    print(f"{'mode':<8} {'compile ms':>10} {'html KB':>8} {'render us':>10} {'dynamic us':>11} {'template us':>12}")
+    for inline in (False, True):
+        newsletter_template.load_template.cache_clear()
+        started = time.perf_counter()
+        newsletter_template.load_template(inline)
+        compile_ms = (time.perf_counter() - started) * 1000
+        # create_purdue_theme_html uses the configured mode; pin it for this run
+        email_sender.load_template = lambda inline=inline: newsletter_template.load_template(inline)
+        size = len(email_sender.create_purdue_theme_html(content)) / 1024
+        render = per_call_us(lambda: email_sender.create_purdue_theme_html(content), args.repeat)
+        print(f"{'inline' if inline else 'style':<8} {compile_ms:>10.2f} {size:>8.1f} {render:>10.1f} "
+              f"{floor:>11.1f} {render - floor:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+Fixtures for the offline benchmarks.
+- Pages: saved snapshots of NEWS_SOURCES live in benchmarks/pages/ (create them with
+  `python benchmarks/bench_extract.py --fetch`); when a snapshot is missing a
+  deterministic synthetic news-hub page of similar shape is generated instead.
+- SnapshotResponse: a saved page served like a streamed requests response, so the
+  scraper's parsing path runs on it without the network.
+- Model outputs: hand-written example newsletters in benchmarks/newsletters/, in the
+  SYSTEM_PROMPT format and in drifted ones (see bench_markdown.py), a synthetic newsletter
+  in the format SYSTEM_PROMPT asks for, and synthetic recipients.
+- SmtpSink: a minimal local SMTP server that accepts and discards mail, optionally
+  with a per-reply delay that stands in for a remote server's latency.
+"""
+import os
+import random
+import re
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+PAGES_DIR = os.path.join(BENCH_DIR, 'pages')
+NEWSLETTERS_DIR = os.path.join(BENCH_DIR, 'newsletters')
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+_WORDS = (
+    "ai model startup funding chip agent enterprise cloud fintech payments developer "
+    "platform revenue growth market launch acquisition open source inference training "
+    "robotics regulation data privacy security api tooling semiconductor nvidia openai "
+    "google microsoft apple amazon meta stripe series round valuation founders investors "
+    "customers pricing subscription ads retail consumer hardware battery energy climate"
+).split()
+
+
+def snapshot_path(url: str, directory: str = PAGES_DIR) -> str:
+    slug = re.sub(r'[^a-z0-9]+', '-', url.lower().split('://', 1)[-1]).strip('-')
+    return os.path.join(directory, f"{slug}.html")
+
+
+def _sentence(rng: random.Random, lo: int, hi: int) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(lo, hi))]
+    return ' '.join(words).capitalize()
+
+
+def synthetic_page(url: str, n_articles: int = 120, seed: int = 0) -> bytes:
+    """A news-hub shaped page: heavy head, nav/header/footer, article cards, inline scripts."""
+    rng = random.Random(f"{url}:{seed}")
+    parts = ['<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">',
+             f'<title>{_sentence(rng, 3, 6)}</title>',
+             '<style>' + ''.join(f'.c{i}{{margin:{i}px;padding:{i % 7}px;color:#{i:06x}}}' for i in range(400)) + '</style>',
+             '<script>' + 'window.__DATA__=' + repr([_sentence(rng, 5, 12) for _ in range(200)]) + ';</script>',
+             '</head><body>',
+             '<header><div class="logo">Brand</div><nav>']
+    for i in range(40):
+        parts.append(f'<a href="/section/{i}">{_sentence(rng, 2, 4)}</a>')
+    parts.append('</nav><a href="/subscribe">Subscribe to our newsletter today</a></header><main>')
+    for i in range(n_articles):
+        title = _sentence(rng, 6, 14)
+        href = f'/stories/{i}-{title.lower().replace(" ", "-")[:60]}' if i % 3 else f'https://cdn.example.com/a/{i}'
+        parts.append(
+            f'<article class="c{i % 400}"><div class="card"><a href="{href}"><h3>{title}</h3></a>'
+            f'<p class="dek">{_sentence(rng, 15, 40)}. {_sentence(rng, 10, 30)}.</p>'
+            f'<span class="meta">By {_sentence(rng, 2, 2)} &middot; {rng.randint(1, 28)} min read</span>'
+            '<!-- card end --></div></article>'
+        )
+        if i % 10 == 0:
+            parts.append(f'<script>track({i}, "{_sentence(rng, 3, 5)}");</script>')
+    parts.append('</main><footer>')
+    for i in range(30):
+        parts.append(f'<a href="/legal/{i}">{_sentence(rng, 2, 5)}</a>')
+    parts.append('</footer></body></html>')
+    return '\n'.join(parts).encode('utf-8')
+
+
+def load_pages(urls, directory: str = PAGES_DIR):
+    """[(url, body_bytes, is_snapshot)] for each url, synthetic when no snapshot exists."""
+    pages = []
+    for url in urls:
+        path = snapshot_path(url, directory)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                pages.append((url, f.read(), True))
+        else:
+            pages.append((url, synthetic_page(url), False))
+    return pages
+
+
+class SnapshotResponse:
+    """The parts of a streamed requests.Response that scraper._stream_parse reads."""
+
+    def __init__(self, body: bytes, content_type: str = 'text/html; charset=utf-8'):
+        self.body = body
+        self.headers = {'Content-Type': content_type}
+
+    def iter_content(self, chunk_size: int):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+def load_newsletters(directory: str = NEWSLETTERS_DIR):
+    """[(file name, text)] for the example model outputs, sorted by name."""
+    outputs = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.md'):
+            with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                outputs.append((name, f.read()))
+    return outputs
+
+
+def sample_newsletter(n_stories: int = 5, seed: int = 0) -> str:
+    """A newsletter in the SYSTEM_PROMPT format (bold titles, insight/move labels, takeaways)."""
+    rng = random.Random(f"newsletter:{seed}")
+    blocks = []
+    for _ in range(n_stories):
+        blocks.append(f"**{_sentence(rng, 5, 10)}**")
+        blocks.append('. '.join(_sentence(rng, 12, 25) for _ in range(4)) + '.')
+        blocks.append(f"Strategic insight: {_sentence(rng, 15, 30)}.")
+        blocks.append(f"Your move: {_sentence(rng, 12, 25)} \u2014 {_sentence(rng, 4, 8)}.")
+    blocks.append("Key takeaways:")
+    blocks.extend(f"- {_sentence(rng, 8, 15)}." for _ in range(3))
+    return '\n\n'.join(blocks)
+
+
+def synthetic_recipients(n: int):
+    return [f"reader{i}@example.com" for i in range(n)]
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.record_connection()
+        recipients = []
+        self.wfile.write(b"220 sink ESMTP\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if self.server.latency and command != b'QUIT':
+                time.sleep(self.server.latency)
+            if command == b'EHLO':
+                self.wfile.write(b"250-sink\r\n250 8BITMIME\r\n")
+            elif command == b'DATA':
+                self.wfile.write(b"354 go ahead\r\n")
+                size = 0
+                for data in iter(self.rfile.readline, b''):
+                    if data == b'.\r\n':
+                        break
+                    size += len(data)
+                self.server.record(size, recipients)
+                recipients = []
+                self.wfile.write(b"250 OK\r\n")
+            elif command == b'QUIT':
+                self.wfile.write(b"221 bye\r\n")
+                return
+            elif command == b'RCPT':
+                recipients.append(line[8:].strip(b' <>\r\n').decode('ascii', 'replace'))
+                self.wfile.write(b"250 OK\r\n")
+            else:  # HELO, MAIL, RSET, NOOP
+                self.wfile.write(b"250 OK\r\n")
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """Local SMTP server on a free port that accepts every message (no TLS, no auth).
+
+    `latency` seconds are slept before each reply; `delivered` counts messages per
+    recipient and `connections` the sessions opened.
+
+        with SmtpSink() as sink:
+            smtplib.SMTP(*sink.address) ...
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(('127.0.0.1', 0), _SmtpHandler)
+        self.latency = latency
+        self.connections = 0
+        self.delivered = Counter()
+        self.messages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def address(self):
+        return self.server_address
+
+    def record_connection(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def record(self, size: int, recipients) -> None:
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+            self.delivered.update(recipients)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
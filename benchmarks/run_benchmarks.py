@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the pipeline's hot paths, with a stored baseline.
+
+Each stage runs on local fixtures only (see fixtures.py): NEWS_SOURCES page snapshots saved
+in benchmarks/pages/ (not committed; generated synthetic pages stand in for missing ones),
+the hand-written example newsletters in benchmarks/newsletters/ and synthetic recipients.
+The committed baseline was recorded on synthetic pages only; its "snapshots" and
+"synthetic_pages" fields say which were used. For every stage the median CPU time per call
+and the peak memory allocated during one call (tracemalloc) are written to a JSON report and
+compared with benchmarks/baseline.json. A stage slower than the baseline by more than
+--tolerance, or allocating more by more than --memory-tolerance, is a regression and makes
+the run exit non-zero.
+
+Every stage is called before it is measured, so imports and caches are warm, and the garbage
+collector is run before and paused during the memory measurement. Timings depend on the
+machine: record a baseline where the comparison will run. Memory peaks vary much less (they
+still depend on the Python and library versions), so their tolerance is tight. The
+fingerprint covers the fixtures and the settings that shape the stages; when it differs from
+the baseline's the comparison is skipped.
+
+    python benchmarks/run_benchmarks.py                        # compare with the baseline
+    python benchmarks/run_benchmarks.py --update-baseline      # record a new baseline
+    python benchmarks/run_benchmarks.py --stages render_html message_for --tolerance 1.0
+"""
+import argparse
+import gc
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from fixtures import (BENCH_DIR, SnapshotResponse, load_newsletters, load_pages, sample_newsletter,
+                      synthetic_recipients)
+
+import config
+from config import NEWS_SOURCES
+import email_sender
+import gemini_client
+import newsletter_markdown
+import scraper
+import smtp_delivery
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+RESULTS_PATH = os.path.join(BENCH_DIR, 'results.json')
+# Each timing round runs a stage for about this long; the median of ROUNDS rounds is reported
+ROUND_SEC = 0.05
+ROUNDS = 7
+RECIPIENTS = 1000
+SUBJECT = "MBT Newsletter - Benchmark"
+# Settings that change what the stages do; they are part of the fixture fingerprint
+SETTINGS = ('SCRAPE_PARSER', 'SCRAPE_MAX_BYTES', 'SCRAPE_MAX_ARTICLES', 'PROMPT_TOKEN_BUDGET',
+            'PROMPT_CHARS_PER_TOKEN', 'STORY_CLUSTERING', 'CLUSTER_SIMILARITY')
+OPTIONAL_MODULES = ('lxml', 'numpy')
+
+
+def load_inputs() -> Dict:
+    """Every fixture the stages use, plus a fingerprint that changes when any of them, or a
+    setting or optional module they depend on, does."""
+    pages = load_pages(NEWS_SOURCES)
+    newsletters = load_newsletters() + [('synthetic', sample_newsletter())]
+    settings = {name: getattr(config, name) for name in SETTINGS}
+    settings.update({name: importlib.util.find_spec(name) is not None for name in OPTIONAL_MODULES})
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    for _, body, _ in pages:
+        digest.update(body)
+    for _, text in newsletters:
+        digest.update(text.encode('utf-8'))
+    return {
+        'pages': pages,
+        'newsletters': newsletters,
+        'recipients': synthetic_recipients(RECIPIENTS),
+        'fingerprint': digest.hexdigest()[:16],
+        'snapshots': sum(1 for _, _, is_snapshot in pages if is_snapshot),
+        'synthetic_pages': sum(1 for _, _, is_snapshot in pages if not is_snapshot),
+        'settings': settings,
+    }
+
+
+def stages(inputs: Dict) -> Dict[str, Tuple[str, Callable[[], object]]]:
+    """name -> (what one call covers, callable)."""
+    pages = inputs['pages']
+    texts = [text for _, text in inputs['newsletters']]
+    scraped = [{'url': url, 'success': True, **scraper._stream_parse(SnapshotResponse(body), url)}
+               for url, body, _ in pages]
+    content = sample_newsletter()
+    html_content = email_sender.create_purdue_theme_html(content)
+    rendered = email_sender.render_message(content, SUBJECT, html_content)
+    recipients = inputs['recipients']
+
+    def scrape_parse():
+        for url, body, _ in pages:
+            scraper._stream_parse(SnapshotResponse(body), url)
+
+    def message_for():
+        for recipient in recipients:
+            smtp_delivery.message_for(recipient, rendered)
+
+    return {
+        'scrape_parse': (f"{len(pages)} pages", scrape_parse),
+        'build_user_prompt': (f"{len(scraped)} sources", lambda: gemini_client._build_user_prompt(scraped, 5)),
+        'parse_markdown': (f"{len(texts)} outputs", lambda: [newsletter_markdown.parse(t) for t in texts]),
+        'render_html': (f"{len(texts)} outputs", lambda: [email_sender.create_purdue_theme_html(t) for t in texts]),
+        'render_message': ("1 message", lambda: email_sender.render_message(content, SUBJECT, html_content)),
+        'message_for': (f"{len(recipients)} recipients", message_for),
+    }
+
+
+def measure(fn: Callable[[], object]) -> Dict:
+    """Median CPU time per call (us) and peak memory allocated during one call (KB)."""
+    fn()  # imports, lazily built tables and caches are filled before anything is measured
+    started = time.thread_time()
+    fn()
+    once = max(time.thread_time() - started, 1e-6)
+    repeat = max(1, int(ROUND_SEC / once))
+    samples = []
+    for _ in range(ROUNDS):
+        started = time.thread_time()
+        for _ in range(repeat):
+            fn()
+        samples.append((time.thread_time() - started) / repeat * 1e6)
+    samples.sort()
+
+    # Garbage left by the timing rounds is not collected inside the window
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+    return {'us': round(samples[ROUNDS // 2], 1), 'min_us': round(samples[0], 1),
+            'peak_kb': round(peak / 1024, 1), 'repeat': repeat}
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, memory_tolerance: float) -> List[str]:
+    """Regressions of `results` against `baseline` (empty if none)."""
+    regressions = []
+    for name, result in results['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base:
+            continue
+        for key, label, allowed in (('us', 'time', tolerance), ('peak_kb', 'memory', memory_tolerance)):
+            if base[key] > 0 and result[key] > base[key] * (1 + allowed):
+                regressions.append(f"{name}: {label} {result[key]} vs {base[key]} "
+                                   f"(+{(result[key] / base[key] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', nargs='+', help='only these stages')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--output', default=RESULTS_PATH, help='where to write the JSON report')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown (0.5 = 50%%)')
+    parser.add_argument('--memory-tolerance', type=float, default=0.1, help='allowed growth of peak memory')
+    parser.add_argument('--update-baseline', action='store_true', help='save this run as the baseline')
+    args = parser.parse_args()
+
+    # The stages log on every call at INFO
+    logging.disable(logging.INFO)
+    inputs = load_inputs()
+    available = stages(inputs)
+    selected = args.stages or list(available)
+    unknown = [name for name in selected if name not in available]
+    if unknown:
+        parser.error(f"unknown stage(s) {unknown}; available: {list(available)}")
+
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'fixtures': inputs['fingerprint'],
+        'snapshots': inputs['snapshots'],
+        'synthetic_pages': inputs['synthetic_pages'],
+        'newsletters': 'hand-written examples in benchmarks/newsletters/ plus fixtures.sample_newsletter()',
+        'settings': inputs['settings'],
+        'stages': {},
+    }
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    same_inputs = baseline.get('fixtures') == results['fixtures']
+
+    print(f"fixtures {results['fixtures']} ({inputs['snapshots']} page snapshot(s), "
+          f"{inputs['synthetic_pages']} synthetic page(s))")
+    print(f"{'stage':<18} {'per call':<15} {'us':>10} {'peak KB':>9} {'base us':>10} {'change':>8}")
+    for name in selected:
+        unit, fn = available[name]
+        result = measure(fn)
+        results['stages'][name] = {'unit': unit, **result}
+        base = baseline.get('stages', {}).get(name)
+        change = f"{(result['us'] / base['us'] - 1) * 100:+.0f}%" if base and base['us'] else '-'
+        print(f"{name:<18} {unit:<15} {result['us']:>10.1f} {result['peak_kb']:>9.1f} "
+              f"{base['us'] if base else '-':>10} {change:>8}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"report written to {args.output}")
+
+    if args.update_baseline:
+        if args.stages and baseline:
+            # keep the stages that were not rerun
+            results['stages'] = {**baseline.get('stages', {}), **results['stages']}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline updated: {args.baseline}")
+        return
+    if not baseline:
+        print("no baseline yet; record one with --update-baseline")
+        return
+    if not same_inputs:
+        print("fixtures differ from the baseline's; comparison skipped (record a new baseline)")
+        return
+    regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Story clustering across sources.
+Articles from different outlets covering the same event rarely share a headline, so each
+article is represented by the words of its title plus the page text that follows it,
+turned into a MinHash signature. LSH banding proposes candidate pairs (only articles
+sharing a band bucket are compared, so this stays sub-quadratic; bands are made as narrow
+as CLUSTER_SIMILARITY allows, see lsh_shape); pairs whose estimated
+Jaccard similarity reaches CLUSTER_SIMILARITY are merged with union-find, as long as the
+two clusters' first articles are that similar too (no long single-link chains) and they
+come from different sources.
+Each cluster becomes one story with all of its links and sources, which prompt_builder
+sends instead of per-source dumps. NumPy is optional: without it no clustering is done.
+"""
+import bisect
+import hashlib
+import logging
+import math
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from config import CLUSTER_SIMILARITY
+from dedup import title_tokens
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 192
+# A pair exactly at the similarity threshold is a candidate with at least this probability
+LSH_MIN_RECALL = 0.8
+_KEY_MULTIPLIER = 0x9E3779B97F4A7C15
+# Page text after a headline (up to the next headline) that is added to its signature
+CONTEXT_CHARS = 300
+# Buckets this large come from very common words, not shared stories; they are skipped
+MAX_BUCKET_SIZE = 50
+# Candidate pairs compared per vectorized step (bounds memory to ~2 x PAIR_CHUNK x NUM_PERM x 4 bytes)
+PAIR_CHUNK = 8192
+_SEED = 1
+
+
+@lru_cache(maxsize=1 << 18)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=4).digest(), 'big')
+
+
+def _contexts(item: Dict) -> List[str]:
+    """Snippet of page text following each article title, stopping at the next title."""
+    text = item.get('text', '')
+    articles = item.get('articles', [])
+    starts = [text.find(a['title']) for a in articles]
+    found = sorted(s for s in starts if s >= 0)
+    contexts = []
+    for article, start in zip(articles, starts):
+        if start < 0:
+            contexts.append('')
+            continue
+        begin = start + len(article['title'])
+        end = begin + CONTEXT_CHARS
+        n = bisect.bisect_left(found, begin)
+        if n < len(found):
+            end = min(end, found[n])
+        contexts.append(text[begin:end].strip())
+    return contexts
+
+
+class _UnionFind:
+    """Union-find whose roots are each cluster's first index and which tracks cluster sources."""
+
+    def __init__(self, groups: List[str]):
+        self.parent = list(range(len(groups)))
+        self.groups = [{g} for g in groups]
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, ra: int, rb: int) -> None:
+        """Merge two roots; the earlier article stays the root."""
+        ra, rb = min(ra, rb), max(ra, rb)
+        self.parent[rb] = ra
+        self.groups[ra] |= self.groups[rb]
+
+
+def minhash_signatures(token_sets: List[List[str]]):
+    """(n, NUM_PERM) uint32 array of MinHash signatures (multiply-shift hashing)."""
+    import numpy as np
+
+    rng = np.random.RandomState(_SEED)
+    a = rng.randint(1, 2 ** 62, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+    b = rng.randint(0, 2 ** 62, size=NUM_PERM, dtype=np.uint64)
+    signatures = np.full((len(token_sets), NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    shift = np.uint64(32)
+    for i, tokens in enumerate(token_sets):
+        if tokens:
+            x = np.array([_token_hash(t) for t in set(tokens)], dtype=np.uint64)
+            # (a*x + b) mod 2^64, top 32 bits: a universal hash family per permutation
+            signatures[i] = ((np.outer(a, x) + b[:, None]) >> shift).min(axis=1)
+    return signatures
+
+
+def lsh_shape(threshold: float):
+    """(bands, rows) of the LSH banding for Jaccard `threshold`.
+
+    A pair of similarity s shares a bucket with probability 1 - (1 - s^rows)^bands. More rows
+    per band means fewer candidates among dissimilar articles, so this takes the most rows
+    that still keep that probability at the threshold above LSH_MIN_RECALL (at 0.3: 64 bands
+    of 3 rows, ~82%; pairs at 0.4 ~98%, at 0.1 ~6%).
+    """
+    rows = 1
+    for r in range(2, NUM_PERM + 1):
+        if 1 - (1 - threshold ** r) ** (NUM_PERM // r) < LSH_MIN_RECALL:
+            break
+        rows = r
+    return NUM_PERM // rows, rows
+
+
+def _candidate_pairs(signatures, indices, bands: int, rows: int):
+    """(i, j) index pairs, i < j, that share at least one LSH band bucket."""
+    import numpy as np
+
+    multiplier = np.uint64(_KEY_MULTIPLIER)
+    pairs = []
+    for band in range(bands):
+        # One key per article for this band; colliding keys only cost a wasted comparison
+        keys = signatures[indices, band * rows].astype(np.uint64)
+        for row in range(1, rows):
+            # Multiply-xor mixing keeps every row in the 64-bit key (shifting would drop all but two)
+            keys = keys * multiplier ^ signatures[indices, band * rows + row].astype(np.uint64)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        for size in np.unique(sizes[(sizes > 1) & (sizes <= MAX_BUCKET_SIZE)]):
+            # every bucket of this size at once: members are (buckets, size) article indices
+            members = indices[order[starts[sizes == size][:, None] + np.arange(size)]]
+            a, b = np.triu_indices(size, 1)
+            pairs.append(np.stack([members[:, a].ravel(), members[:, b].ravel()], axis=1))
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)  # sorted, so merges are deterministic
+
+
+def cluster_articles(token_sets: List[List[str]], groups: List[str],
+                     threshold: float = CLUSTER_SIMILARITY) -> List[List[int]]:
+    """Groups of indices whose token sets are estimated to be at least `threshold` Jaccard-similar.
+
+    Articles with the same `groups` entry (their source) are never put in one cluster.
+    """
+    import numpy as np
+
+    signatures = minhash_signatures(token_sets)
+    min_equal = math.ceil(threshold * NUM_PERM)
+    indices = np.array([i for i, tokens in enumerate(token_sets) if tokens], dtype=np.int64)
+    pairs = _candidate_pairs(signatures, indices, *lsh_shape(threshold))
+    matches = []
+    for chunk in range(0, len(pairs), PAIR_CHUNK):
+        part = pairs[chunk:chunk + PAIR_CHUNK]
+        equal = np.count_nonzero(signatures[part[:, 0]] == signatures[part[:, 1]], axis=1)
+        matches.extend(part[equal >= min_equal].tolist())
+
+    uf = _UnionFind(groups)
+    for first, other in matches:
+        ra, rb = uf.find(first), uf.find(other)
+        if ra == rb or uf.groups[ra] & uf.groups[rb]:
+            continue
+        if (ra, rb) == (first, other) or np.count_nonzero(signatures[ra] == signatures[rb]) >= min_equal:
+            uf.union(ra, rb)
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(token_sets)):
+        clusters.setdefault(uf.find(i), []).append(i)
+    return list(clusters.values())
+
+
+def cluster_stories(scraped_items: List[Dict]) -> Optional[List[Dict]]:
+    """Articles of successful sources grouped into stories, most widely covered first.
+
+    Each story: {'title', 'titles', 'urls', 'sources', 'context', 'score'}.
+    Returns None when NumPy is not installed.
+    """
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        logger.warning("numpy is not installed; stories are not clustered")
+        return None
+
+    started = time.perf_counter()
+    articles = []
+    for item in scraped_items:
+        if not item.get('success'):
+            continue
+        for article, context in zip(item.get('articles', []), _contexts(item)):
+            articles.append((item['url'], article, context))
+    if not articles:
+        return []
+
+    token_sets = [title_tokens(a['title'] + ' ' + context) for _, a, context in articles]
+    stories = []
+    for group in cluster_articles(token_sets, [source for source, _, _ in articles]):
+        members = [articles[i] for i in group]
+        best = max(members, key=lambda m: m[1].get('score', 0.0))
+        sources = list(dict.fromkeys(m[0] for m in members))
+        stories.append({
+            'title': best[1]['title'],
+            'titles': list(dict.fromkeys(m[1]['title'] for m in members if m[1]['title'] != best[1]['title'])),
+            'urls': list(dict.fromkeys([best[1]['url']] + [m[1]['url'] for m in members])),
+            'sources': sources,
+            'context': max((m[2] for m in members), key=len),
+            'score': sum(m[1].get('score', 0.0) for m in members),
+        })
+    # Stable sort: ties keep scrape order (sources in NEWS_SOURCES order, articles ranked)
+    stories.sort(key=lambda s: (-len(s['sources']), -s['score']))
+    logger.info("Clustered %d article(s) into %d stor%s (%d covered by several sources) in %.1fms",
+                len(articles), len(stories), 'y' if len(stories) == 1 else 'ies',
+                sum(1 for s in stories if len(s['sources']) > 1), (time.perf_counter() - started) * 1000)
+    return stories
@@ -8,19 +8,176 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')  # single model per request
 
+# Stream LLM output; fail if no first token / no further chunk arrives in time
+LLM_STREAMING = os.getenv('LLM_STREAMING', 'true').lower() in ('1', 'true', 'yes')
+LLM_FIRST_TOKEN_TIMEOUT_SEC = float(os.getenv('LLM_FIRST_TOKEN_TIMEOUT_SEC', '20'))
+LLM_STALL_TIMEOUT_SEC = float(os.getenv('LLM_STALL_TIMEOUT_SEC', '10'))
+
+# Provider router: hedge to the backup provider when the primary is slow to start
+# (delay = primary's p95 time-to-first-token, clamped), and skip providers whose
+# circuit breaker is open. State persists across runs in LLM_ROUTER_STATE_FILE.
+LLM_ROUTER_STATE_FILE = os.getenv('LLM_ROUTER_STATE_FILE', 'llm_state.json')
+LLM_HEDGING = os.getenv('LLM_HEDGING', 'true').lower() in ('1', 'true', 'yes')
+LLM_HEDGE_DEFAULT_DELAY_SEC = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY_SEC', '8'))
+LLM_HEDGE_MIN_DELAY_SEC = float(os.getenv('LLM_HEDGE_MIN_DELAY_SEC', '2'))
+LLM_HEDGE_MAX_DELAY_SEC = float(os.getenv('LLM_HEDGE_MAX_DELAY_SEC', '15'))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv('LLM_BREAKER_FAILURE_THRESHOLD', '3'))
+LLM_BREAKER_COOLDOWN_SEC = int(os.getenv('LLM_BREAKER_COOLDOWN_SEC', '1800'))
+
+# Client-side rate limits per provider (requests / tokens per minute, 0 = unlimited).
+# 429/5xx responses are retried honoring Retry-After, else with jittered exponential
+# backoff, until LLM_RETRY_DEADLINE_SEC has passed.
+GEMINI_RPM = int(os.getenv('GEMINI_RPM', '15'))
+GEMINI_TPM = int(os.getenv('GEMINI_TPM', '1000000'))
+OPENAI_RPM = int(os.getenv('OPENAI_RPM', '500'))
+OPENAI_TPM = int(os.getenv('OPENAI_TPM', '30000'))
+LLM_RETRY_DEADLINE_SEC = float(os.getenv('LLM_RETRY_DEADLINE_SEC', '120'))
+LLM_BACKOFF_BASE_SEC = float(os.getenv('LLM_BACKOFF_BASE_SEC', '1'))
+LLM_BACKOFF_MAX_SEC = float(os.getenv('LLM_BACKOFF_MAX_SEC', '30'))
+
 # Email Configuration
 EMAIL_ADDRESS = os.getenv('EMAIL_ADDRESS', 'akshatboudh4@gmail.com')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
 SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
 SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
 
-# Recipient emails (comma-separated list, or single email)
+# Email HTML: write the stylesheet into each element's style attribute when the template is
+# compiled, for mail clients that ignore <style> (responsive/hover rules stay in <style>)
+EMAIL_INLINE_CSS = os.getenv('EMAIL_INLINE_CSS', 'false').lower() in ('1', 'true', 'yes')
+
+# SMTP delivery: parallel sessions, messages per connection before reconnecting, a
+# throughput cap (messages per minute across all sessions, 0 = unlimited), and retries
+# for transient failures. Delivered recipients are journaled per issue in
+# DELIVERY_JOURNAL_DIR so a rerun of the same issue only sends to the rest.
+SMTP_CONCURRENCY = int(os.getenv('SMTP_CONCURRENCY', '4'))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', '100'))
+SMTP_MAX_PER_MINUTE = int(os.getenv('SMTP_MAX_PER_MINUTE', '60'))
+SMTP_SEND_RETRIES = int(os.getenv('SMTP_SEND_RETRIES', '2'))
+SMTP_TIMEOUT_SEC = float(os.getenv('SMTP_TIMEOUT_SEC', '30'))
+DELIVERY_JOURNAL_DIR = os.getenv('DELIVERY_JOURNAL_DIR', 'delivery_journal')
+
+# Run metrics: per-stage timings, bytes and tokens of each run are written as a JSON report
+# to METRICS_DIR (the last METRICS_KEEP_REPORTS are kept) and as a Prometheus textfile
+# (point METRICS_TEXTFILE into node_exporter's --collector.textfile.directory; empty disables)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_DIR = os.getenv('METRICS_DIR', 'metrics')
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', os.path.join(METRICS_DIR, 'mbt_newsletter.prom'))
+METRICS_KEEP_REPORTS = int(os.getenv('METRICS_KEEP_REPORTS', '100'))
+
+# Newsletter profiles (python main.py --profiles, see profiles.py): several newsletters,
+# each with its own sources, system prompt and recipients, defined in PROFILES_FILE. Each
+# profile keeps its last run and covered stories in PROFILES_STATE_DIR/<name>/
+PROFILES_FILE = os.getenv('PROFILES_FILE', 'profiles.json')
+PROFILES_STATE_DIR = os.getenv('PROFILES_STATE_DIR', 'profile_state')
+
+# Scheduler (python main.py --schedule): an issue goes out every SCHEDULE_INTERVAL_DAYS at
+# SCHEDULE_SEND_TIME (local HH:MM), counted from the last send recorded in last_run.json.
+# Scraping and generation start SCHEDULE_LEAD_MINUTES before that so the email is on time;
+# a failed run is retried after SCHEDULE_RETRY_MINUTES.
+SCHEDULE_INTERVAL_DAYS = int(os.getenv('SCHEDULE_INTERVAL_DAYS', '5'))
+SCHEDULE_SEND_TIME = os.getenv('SCHEDULE_SEND_TIME', '08:00')
+SCHEDULE_LEAD_MINUTES = int(os.getenv('SCHEDULE_LEAD_MINUTES', '60'))
+SCHEDULE_RETRY_MINUTES = int(os.getenv('SCHEDULE_RETRY_MINUTES', '60'))
+
+# Recipient emails (comma-separated list, or single email). An entry may carry interest
+# tags, "reader@example.com:fintech|ai", which personalize the story order (see segments.py)
 RECIPIENT_EMAILS = os.getenv('RECIPIENT_EMAILS', EMAIL_ADDRESS)
 # Parse comma-separated emails and strip whitespace
 if RECIPIENT_EMAILS:
     RECIPIENT_EMAILS = [email.strip() for email in RECIPIENT_EMAILS.split(',') if email.strip()]
 else:
     RECIPIENT_EMAILS = [EMAIL_ADDRESS]
+# Split off the tags: {email: ('fintech', 'ai')}
+RECIPIENT_TAGS = {
+    entry.split(':', 1)[0].strip(): tuple(t.strip().lower() for t in entry.split(':', 1)[1].split('|') if t.strip())
+    for entry in RECIPIENT_EMAILS if ':' in entry
+}
+RECIPIENT_EMAILS = [entry.split(':', 1)[0].strip() for entry in RECIPIENT_EMAILS]
+# Large lists: a file with one "email[:tag|tag]" per line replaces RECIPIENT_EMAILS
+RECIPIENTS_FILE = os.getenv('RECIPIENTS_FILE')
+
+# Segments: recipients with the same tags share one rendering. Stories matching a tag's
+# keywords (title, text, insight) are moved to the top; with SEGMENT_FILTER the other
+# stories are dropped as long as SEGMENT_MIN_STORIES remain. Tags without an entry here
+# match on the tag itself.
+SEGMENT_FILTER = os.getenv('SEGMENT_FILTER', 'false').lower() in ('1', 'true', 'yes')
+SEGMENT_MIN_STORIES = int(os.getenv('SEGMENT_MIN_STORIES', '3'))
+SEGMENT_TAG_KEYWORDS = {
+    'ai': ['ai', 'llm', 'model', 'models', 'openai', 'anthropic', 'gemini', 'agent', 'agents', 'inference', 'gpu', 'nvidia'],
+    'fintech': ['fintech', 'payments', 'payment', 'bank', 'banking', 'stripe', 'crypto', 'lending', 'insurtech'],
+    'devtools': ['developer', 'developers', 'api', 'apis', 'github', 'open source', 'sdk', 'coding', 'devtools'],
+    'startups': ['startup', 'startups', 'funding', 'raised', 'raises', 'series', 'valuation', 'ipo', 'acquisition', 'vc'],
+    'enterprise': ['enterprise', 'saas', 'cloud', 'b2b', 'software'],
+}
+
+# Scraping: sources are fetched concurrently; the rate limit applies per host
+SCRAPE_WORKERS = int(os.getenv('SCRAPE_WORKERS', '8'))
+SCRAPE_HOST_DELAY_SEC = float(os.getenv('SCRAPE_HOST_DELAY_SEC', '2'))
+# HTML extraction backend: 'lxml' (fast, compiled) or 'stream' (stdlib tokenizer)
+SCRAPE_PARSER = os.getenv('SCRAPE_PARSER', 'lxml')
+# Pages are streamed: the download stops once enough text/articles are collected,
+# and never reads more than SCRAPE_MAX_BYTES per source
+SCRAPE_MAX_BYTES = int(os.getenv('SCRAPE_MAX_BYTES', str(2 * 1024 * 1024)))
+# Links extracted per source, in page order. They are all scored by ranking before RANK_TOP_K
+# are kept, so this must stay well above RANK_TOP_K: hubs start with nav and section links
+SCRAPE_MAX_ARTICLES = int(os.getenv('SCRAPE_MAX_ARTICLES', '100'))
+
+# Shared HTTP transport: per-host keep-alive pools, retries, connect timeout
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+HTTP_CONNECT_TIMEOUT_SEC = float(os.getenv('HTTP_CONNECT_TIMEOUT_SEC', '5'))
+
+# On-disk HTTP cache for scraped pages (ETag/Last-Modified revalidation)
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', '.cache/http')
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+HTTP_CACHE_TTL_SEC = int(os.getenv('HTTP_CACHE_TTL_SEC', '0'))  # 0 = always revalidate
+
+# Article deduplication: across sources in a run, and against stories covered in past issues
+DEDUP_INDEX_FILE = os.getenv('DEDUP_INDEX_FILE', 'dedup_index.json')
+DEDUP_HISTORY_DAYS = int(os.getenv('DEDUP_HISTORY_DAYS', '30'))
+DEDUP_TITLE_MAX_DISTANCE = int(os.getenv('DEDUP_TITLE_MAX_DISTANCE', '3'))  # SimHash bits, 0-3
+# The near-duplicate index is exact only below its 4 bands (see dedup.SimHashIndex)
+if not 0 <= DEDUP_TITLE_MAX_DISTANCE <= 3:
+    raise ValueError(f"DEDUP_TITLE_MAX_DISTANCE must be 0-3 (differing SimHash bits), got {DEDUP_TITLE_MAX_DISTANCE}")
+
+# Local relevance ranking: headlines are scored against the FOCUS AREAS of SYSTEM_PROMPT
+# (BM25, needs numpy) and only the best RANK_TOP_K across all sources reach the prompt
+RANKING_ENABLED = os.getenv('RANKING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RANK_TOP_K = int(os.getenv('RANK_TOP_K', '40'))
+
+# Story clustering: articles from several sources about the same event (MinHash similarity
+# of title + following page text >= CLUSTER_SIMILARITY) are sent as one story
+STORY_CLUSTERING = os.getenv('STORY_CLUSTERING', 'true').lower() in ('1', 'true', 'yes')
+CLUSTER_SIMILARITY = float(os.getenv('CLUSTER_SIMILARITY', '0.3'))
+
+# SQLite store of scraped articles (first/last seen); with NEW_ARTICLES_ONLY the prompt
+# only gets articles first seen since the last run recorded in last_run.json
+ARTICLE_STORE_PATH = os.getenv('ARTICLE_STORE_PATH', 'articles.db')
+NEW_ARTICLES_ONLY = os.getenv('NEW_ARTICLES_ONLY', 'true').lower() in ('1', 'true', 'yes')
+
+# Prompt packing: total token budget for the sources block, and the chars-per-token
+# ratio used to estimate tokens (tune it from the estimated/actual lines in the log)
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '4000'))
+PROMPT_CHARS_PER_TOKEN = float(os.getenv('PROMPT_CHARS_PER_TOKEN', '4.0'))
+
+# Generation mode: 'single' (one prompt), 'map_reduce' (sources condensed into story
+# candidates by parallel calls, then one final call), or 'auto' (map_reduce once the
+# sources in full would exceed MAP_REDUCE_THRESHOLD_TOKENS)
+GENERATION_MODE = os.getenv('GENERATION_MODE', 'auto').lower()
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv('MAP_REDUCE_THRESHOLD_TOKENS', '16000'))
+MAP_BATCH_TOKENS = int(os.getenv('MAP_BATCH_TOKENS', '8000'))
+MAP_CONCURRENCY = int(os.getenv('MAP_CONCURRENCY', '4'))
+MAP_MAX_OUTPUT_TOKENS = int(os.getenv('MAP_MAX_OUTPUT_TOKENS', '800'))
+
+# Pipelined runs (PIPELINED or python main.py --pipelined, see pipeline.py): generation
+# starts once PIPELINE_QUORUM of the sources are scraped or PIPELINE_DEADLINE_SEC after the
+# start; for map-reduce, sources scraped later get map calls of their own for up to
+# PIPELINE_STRAGGLER_SEC more. SMTP sessions are opened while the model writes.
+PIPELINED = os.getenv('PIPELINED', 'false').lower() in ('1', 'true', 'yes')
+PIPELINE_QUORUM = float(os.getenv('PIPELINE_QUORUM', '0.8'))
+PIPELINE_DEADLINE_SEC = float(os.getenv('PIPELINE_DEADLINE_SEC', '45'))
+PIPELINE_STRAGGLER_SEC = float(os.getenv('PIPELINE_STRAGGLER_SEC', '60'))
 
 # News Sources
 NEWS_SOURCES = [
@@ -32,6 +189,12 @@ NEWS_SOURCES = [
     'https://thefounderplaybook.hustlefund.vc/'
 ]
 
+# Per-source cache TTL overrides in seconds. Within the TTL a cached page is reused
+# without any request; after it the page is revalidated with a conditional GET.
+SOURCE_CACHE_TTL_SEC = {
+    # 'https://thefounderplaybook.hustlefund.vc/': 6 * 3600,
+}
+
 # System Prompt
 SYSTEM_PROMPT = """You are a sharp, insightful tech analyst writing for an ambitious MBT student who wants to stay ahead of the curve in AI and business innovation.
 
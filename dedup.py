@@ -0,0 +1,256 @@
+"""
+Article deduplication between scraping and generation.
+- Canonical URLs: lowercase scheme/host, no fragment, no tracking params, no trailing slash.
+- Exact duplicates: hash of the canonical URL (ignoring http/https and a leading "www.").
+- Near duplicates: 64-bit SimHash of the normalized title; titles within
+  DEDUP_TITLE_MAX_DISTANCE differing bits are treated as the same story.
+A persistent index (DEDUP_INDEX_FILE) remembers stories covered in past issues,
+so they are dropped before they reach the prompt again.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from config import DEDUP_INDEX_FILE, DEDUP_HISTORY_DAYS, DEDUP_TITLE_MAX_DISTANCE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRACKING_PARAMS = frozenset([
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'ref', 'ref_src', 'referrer',
+    'cmpid', 'igshid', 'sr_share', 'trk', '_hsenc', '_hsmi',
+])
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_', 'mkt_', 'oly_', 'vero_')
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in into is it its of on or that the "
+    "this to was what when where who why will with you your".split()
+)
+
+# Titles with fewer tokens than this are only matched exactly: SimHash is too noisy on them
+MIN_SIMHASH_TOKENS = 4
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def canonical_url(url: str) -> str:
+    """Normalize a URL so trivially different links to the same page compare equal."""
+    parts = urlsplit(url.strip())
+    if not parts.netloc:
+        return urlunsplit(parts._replace(fragment=''))  # relative or non-web link: leave as is
+    scheme = (parts.scheme or 'https').lower()
+    host = parts.netloc.lower()
+    if (scheme, host[-4:]) == ('https', ':443') or (scheme, host[-3:]) == ('http', ':80'):
+        host = host.rsplit(':', 1)[0]
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    ]
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ''))
+
+
+def url_hash(url: str) -> str:
+    """Stable key for a story URL; http/https and www/non-www variants hash the same."""
+    key = canonical_url(url).split('://', 1)[-1]
+    if key.startswith('www.'):
+        key = key[4:]
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def title_tokens(title: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(title.lower()) if t not in STOPWORDS]
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(tokens: List[str]) -> int:
+    """64-bit SimHash over word unigrams and bigrams."""
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    weights = [0] * 64
+    for feature in features:
+        h = _feature_hash(feature)
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value
+
+
+class SimHashIndex:
+    """Near-duplicate lookup for 64-bit SimHashes.
+
+    The hash is split into bands; by the pigeonhole principle two hashes within
+    fewer than `_BANDS` differing bits share at least one band exactly, so only
+    that band's bucket has to be scanned.
+    """
+
+    def __init__(self, max_distance: int = DEDUP_TITLE_MAX_DISTANCE):
+        if not 0 <= max_distance < _BANDS:
+            raise ValueError(f"max_distance must be 0-{_BANDS - 1}, got {max_distance}")
+        self.max_distance = max_distance
+        self._buckets: Dict[tuple, List[int]] = {}
+
+    def add(self, value: int) -> None:
+        for band in range(_BANDS):
+            key = (band, (value >> (band * _BAND_BITS)) & _BAND_MASK)
+            self._buckets.setdefault(key, []).append(value)
+
+    def contains_near(self, value: int) -> bool:
+        for band in range(_BANDS):
+            key = (band, (value >> (band * _BAND_BITS)) & _BAND_MASK)
+            for other in self._buckets.get(key, ()):
+                if bin(value ^ other).count('1') <= self.max_distance:
+                    return True
+        return False
+
+
+class _Seen:
+    """Exact-URL and near-duplicate-title membership for one set of stories."""
+
+    def __init__(self):
+        self.urls = set()
+        self.titles = set()
+        self.simhashes = SimHashIndex()
+
+    def contains(self, url_key: str, title: str) -> bool:
+        if url_key in self.urls:
+            return True
+        tokens = title_tokens(title)
+        if tokens and ' '.join(tokens) in self.titles:
+            return True
+        return len(tokens) >= MIN_SIMHASH_TOKENS and self.simhashes.contains_near(simhash(tokens))
+
+    def add(self, url_key: str, title: str) -> None:
+        self.urls.add(url_key)
+        tokens = title_tokens(title)
+        if tokens:
+            self.titles.add(' '.join(tokens))
+        if len(tokens) >= MIN_SIMHASH_TOKENS:
+            self.simhashes.add(simhash(tokens))
+
+
+class DedupIndex:
+    """Persistent record of stories covered in past issues."""
+
+    def __init__(self, path: str = DEDUP_INDEX_FILE):
+        self.path = path
+        self.entries: List[Dict] = []  # {'url': hash, 'title': normalized, 'simhash': hex, 'ts': epoch}
+        self._seen = _Seen()
+
+    @classmethod
+    def load(cls, path: str = DEDUP_INDEX_FILE) -> 'DedupIndex':
+        index = cls(path)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    entries = json.load(f).get('stories', [])
+            except (OSError, ValueError) as e:
+                logger.warning("Error reading dedup index %s: %s", path, e)
+                entries = []
+            cutoff = time.time() - DEDUP_HISTORY_DAYS * 86400
+            for entry in entries:
+                if entry.get('ts', 0) >= cutoff:
+                    index._add_entry(entry)
+        return index
+
+    def _add_entry(self, entry: Dict) -> None:
+        self.entries.append(entry)
+        self._seen.urls.add(entry['url'])
+        if entry['title']:
+            self._seen.titles.add(entry['title'])
+        if entry.get('simhash'):
+            self._seen.simhashes.add(int(entry['simhash'], 16))
+
+    def seen(self, url_key: str, title: str) -> bool:
+        return self._seen.contains(url_key, title)
+
+    def add(self, article: Dict, ts: Optional[float] = None) -> None:
+        tokens = title_tokens(article['title'])
+        self._add_entry({
+            'url': url_hash(article['url']),
+            'title': ' '.join(tokens),
+            'simhash': format(simhash(tokens), 'x') if len(tokens) >= MIN_SIMHASH_TOKENS else None,
+            'ts': ts or time.time(),
+        })
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'stories': self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+
+class Deduper:
+    """dedup_items one source at a time, e.g. as sources finish scraping."""
+
+    def __init__(self, history: Optional[DedupIndex] = None):
+        self.history = history
+        self.dropped_dup = 0
+        self.dropped_history = 0
+        self._run_seen = _Seen()
+
+    def add(self, item: Dict) -> Dict:
+        """A copy of `item` without articles seen in earlier sources or covered in past issues."""
+        articles = []
+        for article in item.get('articles', []):
+            url = canonical_url(article['url'])
+            key = url_hash(url)
+            if self._run_seen.contains(key, article['title']):
+                self.dropped_dup += 1
+                continue
+            self._run_seen.add(key, article['title'])
+            if self.history is not None and self.history.seen(key, article['title']):
+                self.dropped_history += 1
+                continue
+            articles.append({**article, 'url': url})
+        return {**item, 'articles': articles}
+
+
+def dedup_items(items: List[Dict], history: Optional[DedupIndex] = None) -> List[Dict]:
+    """Return copies of `items` with duplicate and already-covered articles removed.
+
+    Article URLs are replaced by their canonical form. Within the run the first
+    occurrence wins, so earlier sources take precedence over later ones.
+    """
+    deduper = Deduper(history)
+    deduped = [deduper.add(item) for item in items]
+    logger.info("Dedup: dropped %d duplicate article(s) and %d covered in past issues",
+                deduper.dropped_dup, deduper.dropped_history)
+    return deduped
+
+
+def record_issue(items: Iterable[Dict], newsletter_content: str,
+                 path: str = DEDUP_INDEX_FILE, min_overlap: float = 0.6) -> int:
+    """Add the articles an issue actually covered to the persistent index.
+
+    An article counts as covered when at least `min_overlap` of its title tokens
+    appear in the generated newsletter. Returns the number of stories recorded.
+    """
+    content_tokens = set(title_tokens(newsletter_content))
+    index = DedupIndex.load(path)
+    now = time.time()
+    recorded = 0
+    for item in items:
+        for article in item.get('articles', []):
+            tokens = title_tokens(article['title'])
+            if not tokens:
+                continue
+            overlap = sum(1 for t in tokens if t in content_tokens) / len(tokens)
+            if overlap >= min_overlap:
+                index.add(article, now)
+                recorded += 1
+    index.save()
+    logger.info("Recorded %d covered stor%s in %s", recorded, 'y' if recorded == 1 else 'ies', path)
+    return recorded
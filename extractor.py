@@ -0,0 +1,208 @@
+"""
+Single-pass HTML extraction for scraped pages.
+Produces the cleaned page text and the article links in one traversal, skipping
+script/style/nav/footer/header subtrees. Two backends (SCRAPE_PARSER):
+- 'lxml'   : libxml2 pull parser (fast, compiled)
+- 'stream' : stdlib html.parser tokenizer (pure Python, no extra dependency)
+Both take incremental feed() calls, so a page can be parsed while it downloads,
+and report `done` once the text and article budgets are full so the download can stop.
+"""
+import logging
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SKIP_TAGS = frozenset(['script', 'style', 'nav', 'footer', 'header'])
+MIN_TITLE_LEN = 10
+MAX_TITLE_LEN = 200
+
+
+class _Collector:
+    """Accumulates cleaned text and article links from parser callbacks."""
+
+    def __init__(self, base_url: str, max_text_chars: Optional[int] = None,
+                 max_articles: Optional[int] = None):
+        self.base_url = base_url
+        self.max_text_chars = max_text_chars
+        self.max_articles = max_articles
+        self.articles: List[Dict[str, str]] = []
+        self._chunks: List[str] = []
+        self._pending: List[str] = []  # raw text since the last tag (may arrive in pieces)
+        self._text_len = 0
+        self._skip_depth = 0
+        self._anchor = None  # (href, [text parts]) while inside <a href>
+
+    @property
+    def text_full(self) -> bool:
+        return self.max_text_chars is not None and self._text_len >= self.max_text_chars
+
+    @property
+    def articles_full(self) -> bool:
+        return self.max_articles is not None and len(self.articles) >= self.max_articles
+
+    @property
+    def done(self) -> bool:
+        """True once both budgets are full and the rest of the page can be skipped."""
+        return self.text_full and self.articles_full
+
+    def _on_text(self, data: Optional[str]) -> None:
+        if data and not self._skip_depth:
+            self._pending.append(data)
+
+    def _flush_text(self) -> None:
+        """Normalize the text collected since the last tag (a text node split across feed() calls)."""
+        if not self._pending:
+            return
+        chunk = ' '.join(''.join(self._pending).split())
+        self._pending.clear()
+        if not chunk:
+            return
+        if not self.text_full:
+            self._chunks.append(chunk)
+            self._text_len += len(chunk) + 1
+        if self._anchor is not None:
+            self._anchor[1].append(chunk)
+
+    def _on_start(self, tag: str, href: Optional[str]) -> None:
+        self._flush_text()
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == 'a' and href is not None and not self._skip_depth and not self.articles_full:
+            self._close_anchor()
+            self._anchor = (href, [])
+
+    def _on_end(self, tag: str) -> None:
+        self._flush_text()
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == 'a' and not self._skip_depth:
+            self._close_anchor()
+
+    def _close_anchor(self) -> None:
+        if self._anchor is None:
+            return
+        href, parts = self._anchor
+        self._anchor = None
+        title = ' '.join(parts)
+        if MIN_TITLE_LEN < len(title) < MAX_TITLE_LEN:
+            # Make absolute URL if relative
+            if href.startswith('/'):
+                href = urljoin(self.base_url, href)
+            self.articles.append({'title': title, 'url': href})
+
+    def result(self) -> Dict[str, any]:
+        self._flush_text()
+        self._close_anchor()
+        text = ' '.join(self._chunks)
+        if self.max_text_chars is not None:
+            text = text[:self.max_text_chars]
+        return {'text': text, 'articles': self.articles[:self.max_articles]}
+
+
+class LxmlExtractor(_Collector):
+    """Extraction on top of lxml's HTMLPullParser.
+
+    Text is emitted in document order from the pull events: a node's leading text
+    (parent.text or the previous sibling's tail) is complete when the next element
+    starts, and its trailing text is complete when the enclosing element ends.
+    Finished elements are cleared and dropped so the tree never holds the whole page.
+    """
+
+    def __init__(self, base_url: str, max_text_chars: Optional[int] = None,
+                 max_articles: Optional[int] = None):
+        super().__init__(base_url, max_text_chars, max_articles)
+        from lxml import etree
+        self._parser = etree.HTMLPullParser(events=('start', 'end', 'comment', 'pi'))
+
+    def feed(self, data: str) -> None:
+        self._parser.feed(data)
+        self._drain()
+
+    def close(self) -> None:
+        self._parser.close()
+        self._drain()
+        self._flush_text()
+
+    def _drain(self) -> None:
+        for event, el in self._parser.read_events():
+            if event == 'end':
+                self._on_text(el[-1].tail if len(el) else el.text)
+                self._on_end(el.tag)
+                # Everything before el has been emitted; its own tail is still pending
+                el.clear(keep_tail=True)
+                parent = el.getparent()
+                if parent is not None:
+                    while el.getprevious() is not None:
+                        del parent[0]
+                continue
+            prev = el.getprevious()
+            if prev is not None:
+                self._on_text(prev.tail)
+            else:
+                parent = el.getparent()
+                if parent is not None:
+                    self._on_text(parent.text)
+            if event == 'start':
+                self._on_start(el.tag, el.get('href'))
+            else:
+                # Comments and processing instructions separate text like tags do
+                self._flush_text()
+
+
+class StreamExtractor(_Collector, HTMLParser):
+    """Extraction on top of the stdlib html.parser tokenizer."""
+
+    def __init__(self, base_url: str, max_text_chars: Optional[int] = None,
+                 max_articles: Optional[int] = None):
+        _Collector.__init__(self, base_url, max_text_chars, max_articles)
+        HTMLParser.__init__(self, convert_charrefs=True)
+
+    def handle_starttag(self, tag, attrs):
+        href = None
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href':
+                    href = value or ''
+                    break
+        self._on_start(tag, href)
+
+    def handle_endtag(self, tag):
+        self._on_end(tag)
+
+    def handle_data(self, data):
+        # A text node can arrive in several calls, split where a feed() chunk ended
+        self._on_text(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def close(self) -> None:
+        HTMLParser.close(self)
+        self._flush_text()
+
+
+BACKENDS = {'lxml': LxmlExtractor, 'stream': StreamExtractor}
+
+
+def make_extractor(base_url: str, backend: str = 'lxml', max_text_chars: Optional[int] = None,
+                   max_articles: Optional[int] = None) -> _Collector:
+    """Create an incremental extractor; falls back to 'stream' if lxml is unavailable."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown parser backend {backend!r}; expected one of {sorted(BACKENDS)}")
+    try:
+        return BACKENDS[backend](base_url, max_text_chars, max_articles)
+    except ImportError:
+        logger.warning("lxml not installed, falling back to the 'stream' parser backend")
+        return StreamExtractor(base_url, max_text_chars, max_articles)
+
+
+def extract(html: str, base_url: str, backend: str = 'lxml', max_text_chars: Optional[int] = None,
+            max_articles: Optional[int] = None) -> Dict[str, any]:
+    """Parse a whole page and return {'text': ..., 'articles': [...]}."""
+    extractor = make_extractor(base_url, backend, max_text_chars, max_articles)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.result()
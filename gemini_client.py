@@ -1,76 +1,151 @@
 """
 Gemini API client for newsletter generation.
-Uses REST API with requests + timeout (same as test_gemini.py) so the call completes reliably.
+Uses REST API via the shared pooled transport (same as test_gemini.py) so the call completes reliably.
 Single env var GEMINI_API_KEY. Model: gemini-2.0-flash. Single turn: system prompt + user message.
+Streams by default (streamGenerateContent) so a hung model fails within seconds.
+Requests go through rate_limiter (GEMINI_RPM/GEMINI_TPM; 429s honor RetryInfo / Retry-After).
 """
+import json
 import logging
-import requests
-from config import GEMINI_API_KEY, GEMINI_MODEL, SYSTEM_PROMPT
+from typing import Callable, Iterator, Optional
+import http_transport
+from config import (GEMINI_API_KEY, GEMINI_MODEL, SYSTEM_PROMPT, LLM_STREAMING,
+                    LLM_FIRST_TOKEN_TIMEOUT_SEC, LLM_STALL_TIMEOUT_SEC)
+from llm_stream import iter_with_deadlines
+from rate_limiter import call_with_limits, get_limiter
+from prompt_builder import build_user_prompt, estimate_tokens, report_usage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 GEMINI_BASE = "https://generativelanguage.googleapis.com/v1beta"
 GEMINI_TIMEOUT_SEC = 60
+MAX_OUTPUT_TOKENS = 2000
 
 
 def _build_user_prompt(scraped_items: list, days_since_last_run: int) -> str:
-    """Build the user prompt from scraped items."""
-    items_text = []
-    for item in scraped_items:
-        if item.get("success"):
-            items_text.append({
-                "source": item["url"],
-                "content": item["text"][:2000],
-                "articles": item.get("articles", [])[:5],
-            })
-    return f"""Analyze these tech news sources from the past {days_since_last_run} days. Find the 3-4 stories with the deepest strategic implications for someone building a career in business + AI.
+    """Build the user prompt from scraped items (token-budgeted, see prompt_builder)."""
+    return build_user_prompt(scraped_items, days_since_last_run)
 
-SOURCES:
 
-{str(items_text)}
-
-Focus on:
-
-- What's genuinely NEW or SURPRISING (not just incremental updates)
-
-- Stories that reveal competitive dynamics or market shifts
-
-- Developments that create opportunities for students/professionals
+def _payload(system_prompt: str, user_prompt: str, max_tokens: int = MAX_OUTPUT_TOKENS) -> dict:
+    return {
+        "contents": [{"parts": [{"text": user_prompt}]}],
+        "systemInstruction": {"parts": [{"text": system_prompt}]},
+        "generationConfig": {
+            "temperature": 0.7,
+            "maxOutputTokens": max_tokens,
+        },
+    }
 
-- Insights that challenge conventional thinking
 
-Be ruthless: Skip stories that are surface-level or already widely understood."""
+def stream_completion(system_prompt: str, user_prompt: str,
+                      max_tokens: int = MAX_OUTPUT_TOKENS) -> Iterator[str]:
+    """Yield text chunks as Gemini produces them (streamGenerateContent, SSE).
 
+    Raises StreamTimeout if no text arrives within LLM_FIRST_TOKEN_TIMEOUT_SEC or the
+    stream stalls for LLM_STALL_TIMEOUT_SEC.
+    """
+    if not GEMINI_API_KEY:
+        raise ValueError(
+            "GEMINI_API_KEY not set in environment variables. Add it to your .env file."
+        )
 
-def generate_newsletter(scraped_items: list, days_since_last_run: int = 5) -> str:
-    """Generate newsletter content using Gemini REST API. Single turn: system + user message."""
+    estimated_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+    url = f"{GEMINI_BASE}/models/{GEMINI_MODEL}:streamGenerateContent"
+    state = {}
+
+    def open_stream():
+        r = http_transport.post(
+            url,
+            params={"key": GEMINI_API_KEY, "alt": "sse"},
+            json=_payload(system_prompt, user_prompt, max_tokens),
+            timeout=LLM_FIRST_TOKEN_TIMEOUT_SEC,
+            headers={"Content-Type": "application/json"},
+            stream=True,
+        )
+        if r.status_code >= 400:
+            r.content  # read the error body (RetryInfo) before the connection is released
+            r.close()
+        r.raise_for_status()
+        return r
+
+    # Waiting for quota happens before the first-token deadline starts
+    r = call_with_limits(get_limiter("gemini"), open_stream, estimated_tokens + max_tokens)
+    state["response"] = r
+
+    def chunks():
+        with r:
+            r.encoding = "utf-8"
+            for line in r.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:])
+                if data.get("usageMetadata"):
+                    state["usage"] = data["usageMetadata"]
+                for candidate in (data.get("candidates") or [])[:1]:
+                    for part in candidate.get("content", {}).get("parts") or []:
+                        if part.get("text"):
+                            yield part["text"]
+
+    def abort():
+        if state.get("response") is not None:
+            state["response"].close()
+
+    logger.info("Streaming from Gemini API (model=%s, first token <= %gs, stall <= %gs)...",
+                GEMINI_MODEL, LLM_FIRST_TOKEN_TIMEOUT_SEC, LLM_STALL_TIMEOUT_SEC)
+    yield from iter_with_deadlines(chunks(), LLM_FIRST_TOKEN_TIMEOUT_SEC, LLM_STALL_TIMEOUT_SEC, abort)
+    usage = state.get("usage", {})
+    report_usage("gemini", estimated_tokens, usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+
+
+def stream_newsletter(scraped_items: list, days_since_last_run: int = 5) -> Iterator[str]:
+    """Yield newsletter text chunks as Gemini produces them."""
+    yield from stream_completion(SYSTEM_PROMPT, _build_user_prompt(scraped_items, days_since_last_run))
+
+
+def complete(system_prompt: str, user_prompt: str, max_tokens: int = MAX_OUTPUT_TOKENS,
+             on_chunk: Optional[Callable[[str], None]] = None) -> str:
+    """Single turn (system + user message) via the Gemini REST API; returns the stripped text.
+
+    Streams when LLM_STREAMING is set or `on_chunk` is given (called with each text chunk).
+    """
     if not GEMINI_API_KEY:
         raise ValueError(
             "GEMINI_API_KEY not set in environment variables. Add it to your .env file."
         )
 
-    user_prompt = _build_user_prompt(scraped_items, days_since_last_run)
+    if LLM_STREAMING or on_chunk is not None:
+        parts = []
+        for chunk in stream_completion(system_prompt, user_prompt, max_tokens):
+            parts.append(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+        text = "".join(parts).strip()
+        if not text:
+            raise ValueError("Gemini returned empty text")
+        return text
+
+    estimated_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
     url = f"{GEMINI_BASE}/models/{GEMINI_MODEL}:generateContent"
-    payload = {
-        "contents": [{"parts": [{"text": user_prompt}]}],
-        "systemInstruction": {"parts": [{"text": SYSTEM_PROMPT}]},
-        "generationConfig": {
-            "temperature": 0.7,
-            "maxOutputTokens": 2000,
-        },
-    }
 
     logger.info("Calling Gemini API (model=%s, timeout=%ds)...", GEMINI_MODEL, GEMINI_TIMEOUT_SEC)
-    r = requests.post(
-        url,
-        params={"key": GEMINI_API_KEY},
-        json=payload,
-        timeout=GEMINI_TIMEOUT_SEC,
-        headers={"Content-Type": "application/json"},
-    )
-    r.raise_for_status()
+
+    def post():
+        r = http_transport.post(
+            url,
+            params={"key": GEMINI_API_KEY},
+            json=_payload(system_prompt, user_prompt, max_tokens),
+            timeout=GEMINI_TIMEOUT_SEC,
+            headers={"Content-Type": "application/json"},
+        )
+        r.raise_for_status()
+        return r
+
+    r = call_with_limits(get_limiter("gemini"), post, estimated_tokens + max_tokens)
     data = r.json()
+    usage = data.get("usageMetadata") or {}
+    report_usage("gemini", estimated_tokens, usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
     candidates = data.get("candidates") or []
     if not candidates:
         raise ValueError("Gemini returned no candidates")
@@ -80,5 +155,15 @@ def generate_newsletter(scraped_items: list, days_since_last_run: int = 5) -> st
     text = (parts[0].get("text") or "").strip()
     if not text:
         raise ValueError("Gemini returned empty text")
+    return text
+
+
+def generate_newsletter(scraped_items: list, days_since_last_run: int = 5,
+                        on_chunk: Optional[Callable[[str], None]] = None) -> str:
+    """Generate newsletter content using Gemini REST API. Single turn: system + user message.
+
+    Streams when LLM_STREAMING is set or `on_chunk` is given (called with each text chunk).
+    """
+    text = complete(SYSTEM_PROMPT, _build_user_prompt(scraped_items, days_since_last_run), on_chunk=on_chunk)
     logger.info("Newsletter generated successfully (model=%s)", GEMINI_MODEL)
     return text
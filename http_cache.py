@@ -0,0 +1,134 @@
+"""
+On-disk conditional-GET cache for scraped pages.
+Each entry keeps the ETag/Last-Modified validators plus the already-parsed result
+(text and articles), so an unchanged page costs one 304 round trip and no HTML parsing.
+Entries live as JSON files under HTTP_CACHE_DIR; the least recently used are evicted
+once the directory grows past HTTP_CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from config import HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_TTL_SEC, SOURCE_CACHE_TTL_SEC
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+def _entry_path(url: str) -> str:
+    digest = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+    return os.path.join(HTTP_CACHE_DIR, f"{digest}.json")
+
+
+def ttl_for(url: str) -> int:
+    """TTL in seconds for a source: per-source override, else HTTP_CACHE_TTL_SEC."""
+    return SOURCE_CACHE_TTL_SEC.get(url, HTTP_CACHE_TTL_SEC)
+
+
+def get(url: str) -> Optional[Dict]:
+    """Return the cached entry for `url`, or None if missing/unreadable."""
+    path = _entry_path(url)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable cache entry for %s: %s", url, e)
+        return None
+    if entry.get('url') != url:
+        return None
+    try:
+        os.utime(path)  # mark as recently used for eviction
+    except OSError:
+        pass
+    return entry
+
+
+def is_fresh(entry: Dict, url: str) -> bool:
+    """True if the entry is within its TTL and can be reused without a request."""
+    return time.time() - entry.get('stored_at', 0) < ttl_for(url)
+
+
+def conditional_headers(entry: Dict) -> Dict[str, str]:
+    """Request headers that let the server answer 304 Not Modified."""
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def put(url: str, response_headers, result: Dict) -> None:
+    """Store a parsed result together with the response validators."""
+    etag = response_headers.get('ETag')
+    last_modified = response_headers.get('Last-Modified')
+    if not (etag or last_modified or ttl_for(url) > 0):
+        return  # nothing to revalidate against and no TTL: caching would never pay off
+    _write(url, {
+        'url': url,
+        'etag': etag,
+        'last_modified': last_modified,
+        'stored_at': time.time(),
+        'text': result['text'],
+        'articles': result['articles'],
+    })
+
+
+def refresh(url: str, entry: Dict, response_headers) -> None:
+    """Restart the TTL of an entry after a 304, picking up any new validators."""
+    entry = dict(entry)
+    entry['etag'] = response_headers.get('ETag') or entry.get('etag')
+    entry['last_modified'] = response_headers.get('Last-Modified') or entry.get('last_modified')
+    entry['stored_at'] = time.time()
+    _write(url, entry)
+
+
+def _write(url: str, entry: Dict) -> None:
+    path = _entry_path(url)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not write cache entry for %s: %s", url, e)
+        return
+    _evict()
+
+
+def _evict() -> None:
+    """Delete least recently used entries until the cache fits HTTP_CACHE_MAX_BYTES."""
+    with _lock:
+        try:
+            names = [n for n in os.listdir(HTTP_CACHE_DIR) if n.endswith('.json')]
+        except OSError:
+            return
+        entries = []
+        total = 0
+        for name in names:
+            path = os.path.join(HTTP_CACHE_DIR, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= HTTP_CACHE_MAX_BYTES:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= HTTP_CACHE_MAX_BYTES:
+                break
@@ -0,0 +1,121 @@
+"""
+Shared pooled HTTP transport.
+Owns one requests.Session per host, each with a keep-alive connection pool, a retry
+adapter for transient failures, gzip/brotli negotiation and separate connect/read
+timeouts. Used by the scraper, the Gemini client and test_gemini.py so repeated
+requests to a host reuse TCP/TLS connections instead of handshaking every time.
+"""
+import logging
+import threading
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import HTTP_POOL_MAXSIZE, HTTP_MAX_RETRIES, HTTP_CONNECT_TIMEOUT_SEC
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# urllib3 decodes "br" transparently when a brotli package is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+DEFAULT_READ_TIMEOUT_SEC = 30
+
+_sessions: Dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc.lower()}"
+
+
+def _new_session() -> requests.Session:
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    return session
+
+
+def session_for(url: str) -> requests.Session:
+    """Return the pooled session for the host of `url`, creating it on first use."""
+    key = _host_key(url)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _new_session()
+    return session
+
+
+def _timeout(timeout):
+    """Turn a read timeout into a (connect, read) pair; tuples pass through."""
+    if isinstance(timeout, tuple):
+        return timeout
+    return (HTTP_CONNECT_TIMEOUT_SEC, DEFAULT_READ_TIMEOUT_SEC if timeout is None else timeout)
+
+
+def request(method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+    """Send a request through the host's pooled session.
+
+    `timeout` is the read timeout in seconds (or an explicit (connect, read) tuple);
+    the connect timeout comes from HTTP_CONNECT_TIMEOUT_SEC.
+    """
+    return session_for(url).request(method, url, timeout=_timeout(timeout), **kwargs)
+
+
+def get(url: str, timeout=None, **kwargs) -> requests.Response:
+    return request('GET', url, timeout=timeout, **kwargs)
+
+
+def post(url: str, timeout=None, **kwargs) -> requests.Response:
+    return request('POST', url, timeout=timeout, **kwargs)
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Per-host request/connection counts. `reused` = requests served on an existing connection."""
+    stats = {}
+    for key, session in list(_sessions.items()):
+        adapter = session.get_adapter(key)
+        num_requests = num_connections = 0
+        pools = adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            num_requests += pool.num_requests
+            num_connections += pool.num_connections
+        stats[key] = {
+            'requests': num_requests,
+            'connections': num_connections,
+            'reused': max(0, num_requests - num_connections),
+        }
+    return stats
+
+
+def log_pool_stats() -> None:
+    """Log connection reuse per host."""
+    for host, s in sorted(pool_stats().items()):
+        logger.info("HTTP pool %s: %d request(s), %d connection(s), %d reused",
+                    host, s['requests'], s['connections'], s['reused'])
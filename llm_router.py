@@ -0,0 +1,298 @@
+"""
+LLM provider router over gemini_client and openai_client.
+- Hedging: the primary provider is started first; if it hasn't produced its first
+  token within a delay derived from its p95 time-to-first-token, the backup is
+  started as well and the first valid response wins. Without streaming (LLM_STREAMING=false)
+  the delay comes from the p95 total latency instead.
+- Circuit breaker: after LLM_BREAKER_FAILURE_THRESHOLD consecutive failures a
+  provider is skipped for LLM_BREAKER_COOLDOWN_SEC, then given one trial call.
+- Latency tracking: time-to-first-token and total latency per provider.
+Breaker state and latency history persist in LLM_ROUTER_STATE_FILE across scheduler runs.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import (GEMINI_API_KEY, OPENAI_API_KEY, SYSTEM_PROMPT, LLM_ROUTER_STATE_FILE, LLM_HEDGING, LLM_STREAMING,
+                    LLM_HEDGE_DEFAULT_DELAY_SEC, LLM_HEDGE_MIN_DELAY_SEC, LLM_HEDGE_MAX_DELAY_SEC,
+                    LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_COOLDOWN_SEC)
+import metrics
+from prompt_builder import build_user_prompt
+from rate_limiter import log_metrics as log_rate_limit_metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HISTORY_SIZE = 50
+# Below this many samples the p95 is not trusted and LLM_HEDGE_DEFAULT_DELAY_SEC is used
+MIN_SAMPLES_FOR_P95 = 5
+
+
+def _gemini(*args, **kwargs):
+    from gemini_client import complete
+    return complete(*args, **kwargs)
+
+
+def _openai(*args, **kwargs):
+    from openai_client import complete
+    return complete(*args, **kwargs)
+
+
+def default_providers() -> List[Tuple[str, Callable]]:
+    """Configured providers in priority order (Gemini first, as before).
+
+    Each is called as fn(system_prompt, user_prompt, [on_chunk=...], [max_tokens=...]).
+    """
+    providers = []
+    if GEMINI_API_KEY:
+        providers.append(('gemini', _gemini))
+    if OPENAI_API_KEY:
+        providers.append(('openai', _openai))
+    return providers
+
+
+def _p95(values: List[float]) -> Optional[float]:
+    if len(values) < MIN_SAMPLES_FOR_P95:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+class RouterState:
+    """Per-provider breaker state and latency history, stored as JSON."""
+
+    def __init__(self, path: str = LLM_ROUTER_STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.providers: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.providers = json.load(f).get('providers', {})
+            except (OSError, ValueError) as e:
+                logger.warning("Error reading router state %s: %s", path, e)
+
+    def _entry(self, name: str) -> Dict:
+        return self.providers.setdefault(
+            name, {'failures': 0, 'opened_at': None, 'ttft': [], 'latency': []}
+        )
+
+    def is_available(self, name: str, now: Optional[float] = None) -> bool:
+        """Closed, or open long enough that a half-open trial call is allowed."""
+        with self._lock:
+            opened_at = self._entry(name)['opened_at']
+        return opened_at is None or (now or time.time()) - opened_at >= LLM_BREAKER_COOLDOWN_SEC
+
+    def hedge_delay(self, name: str, streaming: bool = True) -> float:
+        """How long to wait for `name` before starting the backup.
+
+        Streaming calls are hedged on the p95 time-to-first-token. Without streaming there is
+        no first token, so they are hedged on the p95 total latency instead (not capped at
+        LLM_HEDGE_MAX_DELAY_SEC, a whole answer takes longer; that cap is the wait until enough
+        calls have been seen).
+        """
+        with self._lock:
+            p95 = _p95(self._entry(name)['ttft' if streaming else 'latency'])
+        if not streaming:
+            return LLM_HEDGE_MAX_DELAY_SEC if p95 is None else max(LLM_HEDGE_MIN_DELAY_SEC, p95)
+        if p95 is None:
+            return LLM_HEDGE_DEFAULT_DELAY_SEC
+        return min(LLM_HEDGE_MAX_DELAY_SEC, max(LLM_HEDGE_MIN_DELAY_SEC, p95))
+
+    def record_success(self, name: str, ttft: Optional[float], latency: float) -> None:
+        with self._lock:
+            entry = self._entry(name)
+            if entry['opened_at'] is not None:
+                logger.info("Circuit for %s closed again", name)
+            entry['failures'] = 0
+            entry['opened_at'] = None
+            if ttft is not None:
+                entry['ttft'] = (entry['ttft'] + [round(ttft, 3)])[-HISTORY_SIZE:]
+            entry['latency'] = (entry['latency'] + [round(latency, 3)])[-HISTORY_SIZE:]
+
+    def record_failure(self, name: str) -> None:
+        with self._lock:
+            entry = self._entry(name)
+            entry['failures'] += 1
+            half_open = entry['opened_at'] is not None
+            if half_open or entry['failures'] >= LLM_BREAKER_FAILURE_THRESHOLD:
+                entry['opened_at'] = time.time()
+                logger.warning("Circuit for %s open after %d consecutive failure(s); skipping it for %ds",
+                               name, entry['failures'], LLM_BREAKER_COOLDOWN_SEC)
+
+    def summary(self, name: str) -> str:
+        with self._lock:
+            entry = self._entry(name)
+            ttft, latency = _p95(entry['ttft']), _p95(entry['latency'])
+        fmt = lambda v: f"{v:.1f}s" if v is not None else "n/a"
+        return f"{name}: p95 first token {fmt(ttft)}, p95 total {fmt(latency)}, failures {entry['failures']}"
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump({'providers': self.providers}, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning("Could not save router state %s: %s", self.path, e)
+
+
+class AttemptCancelled(Exception):
+    """Raised into a losing provider's stream once another provider has won."""
+
+
+class _Attempt:
+    """One provider call running on the router's pool."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.monotonic()
+        self.first_token = threading.Event()
+        self.ttft: Optional[float] = None
+        self.future = None
+
+    def saw_chunk(self) -> None:
+        if not self.first_token.is_set():
+            self.ttft = time.monotonic() - self.started
+            self.first_token.set()
+
+
+def log_summary(state: RouterState, providers: Optional[List[Tuple[str, Callable]]] = None) -> None:
+    """Log p95 latencies per provider and the rate limiter's wait totals."""
+    providers = default_providers() if providers is None else providers
+    for name in [p[0] for p in providers]:
+        logger.info("LLM latency %s", state.summary(name))
+    log_rate_limit_metrics()
+
+
+def complete(system_prompt: str, user_prompt: str, max_tokens: Optional[int] = None,
+             on_chunk: Optional[Callable[[str], None]] = None,
+             providers: Optional[List[Tuple[str, Callable]]] = None,
+             state: Optional[RouterState] = None, summary: bool = True) -> str:
+    """Run one completion on the first provider to return valid content.
+
+    Only the first provider to stream text has its chunks forwarded to `on_chunk`. Providers
+    stream when `on_chunk` is given or LLM_STREAMING is set; once one wins, the streams of the
+    others are aborted at their next chunk. Raises RuntimeError when every provider fails. `summary=False` skips the latency
+    log (for callers making many small calls, see map_reduce).
+    """
+    providers = default_providers() if providers is None else providers
+    if not providers:
+        raise ValueError("No AI provider configured. Set GEMINI_API_KEY or OPENAI_API_KEY in your .env file.")
+    state = state or RouterState()
+
+    candidates = [p for p in providers if state.is_available(p[0])]
+    if not candidates:
+        logger.warning("All provider circuits are open; trying them anyway")
+        candidates = list(providers)
+
+    streaming = on_chunk is not None or LLM_STREAMING
+    output_owner = []
+    owner_lock = threading.Lock()
+    # Set once the call is decided: losing streams stop instead of spending tokens and quota
+    cancelled = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix='llm')
+    attempts: List[_Attempt] = []
+    errors = []
+
+    def start(name: str, fn: Callable) -> _Attempt:
+        attempt = _Attempt(name)
+
+        def forward(chunk: str):
+            if cancelled.is_set():
+                raise AttemptCancelled(f"{name} lost the race")
+            attempt.saw_chunk()
+            with owner_lock:
+                if not output_owner:
+                    output_owner.append(name)
+            if on_chunk is not None and output_owner[0] == name:
+                on_chunk(chunk)
+
+        def finished(future):
+            latency = time.monotonic() - attempt.started
+            if future.cancelled() or isinstance(future.exception(), AttemptCancelled):
+                return  # stopped by the router, says nothing about the provider's health
+            ok = future.exception() is None and bool((future.result() or '').strip())
+            if ok:
+                state.record_success(name, attempt.ttft, latency)
+            else:
+                state.record_failure(name)
+            metrics.observe('llm_latency_seconds', latency, provider=name, outcome='ok' if ok else 'error')
+            if attempt.ttft is not None:
+                metrics.observe('llm_first_token_seconds', attempt.ttft, provider=name)
+            state.save()
+
+        kwargs = {'on_chunk': forward} if streaming else {}
+        if max_tokens is not None:
+            kwargs['max_tokens'] = max_tokens
+        attempt.future = pool.submit(fn, system_prompt, user_prompt, **kwargs)
+        attempt.future.add_done_callback(finished)
+        attempts.append(attempt)
+        logger.info("LLM router: started %s", name)
+        return attempt
+
+    try:
+        pending = list(candidates)
+        primary = start(*pending.pop(0))
+        if pending and LLM_HEDGING:
+            delay = state.hedge_delay(primary.name, streaming)
+            deadline = time.monotonic() + delay
+            while not primary.first_token.is_set() and not primary.future.done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.info("LLM router: no %s from %s after %.1fs, hedging with %s",
+                                'first token' if streaming else 'response', primary.name, delay, pending[0][0])
+                    break
+                primary.first_token.wait(min(remaining, 0.1))
+            # A primary that already finished is handled below (a failure starts the next provider)
+            if not primary.first_token.is_set() and not primary.future.done():
+                start(*pending.pop(0))
+
+        seen = set()
+        while True:
+            for attempt in attempts:
+                if attempt in seen or not attempt.future.done():
+                    continue
+                seen.add(attempt)
+                error = attempt.future.exception()
+                text = None if error else (attempt.future.result() or '').strip()
+                if text:
+                    logger.info("LLM router: %s won after %.1fs", attempt.name,
+                                time.monotonic() - attempt.started)
+                    if on_chunk is not None and output_owner[:1] != [attempt.name]:
+                        on_chunk("\n" + text)  # the streamed output came from a provider that lost
+                    return text
+                error = error or ValueError(f"{attempt.name} returned empty content")
+                logger.warning("LLM router: %s failed (%s: %s)", attempt.name, type(error).__name__, error)
+                errors.append((attempt.name, error))
+            running = [a.future for a in attempts if not a.future.done()]
+            if not running:
+                if pending:
+                    start(*pending.pop(0))
+                    continue
+                break
+            wait(running, return_when=FIRST_COMPLETED)
+    finally:
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        if summary:
+            log_summary(state, candidates)
+
+    detail = '; '.join(f"{name}: {type(e).__name__}: {e}" for name, e in errors)
+    raise RuntimeError(f"All AI providers failed ({detail})") from (errors[-1][1] if errors else None)
+
+
+def generate_newsletter(scraped_items: list, days_since_last_run: int = 5,
+                        on_chunk: Optional[Callable[[str], None]] = None,
+                        providers: Optional[List[Tuple[str, Callable]]] = None,
+                        state: Optional[RouterState] = None, system_prompt: Optional[str] = None) -> str:
+    """Generate the newsletter (system prompt, default SYSTEM_PROMPT, + packed sources) with the
+    first provider to answer."""
+    user_prompt = build_user_prompt(scraped_items, days_since_last_run)
+    return complete(system_prompt or SYSTEM_PROMPT, user_prompt, on_chunk=on_chunk, providers=providers,
+                    state=state)
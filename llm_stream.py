@@ -0,0 +1,61 @@
+"""
+Deadline enforcement for streamed LLM responses.
+A streamed call is read on a helper thread so the caller can give up after
+LLM_FIRST_TOKEN_TIMEOUT_SEC without a first chunk, or after LLM_STALL_TIMEOUT_SEC
+between chunks, instead of waiting out a single long socket timeout.
+"""
+import queue
+import threading
+from typing import Callable, Iterator, Optional
+
+_CHUNK, _END, _ERROR = range(3)
+
+
+class StreamTimeout(TimeoutError):
+    """The model did not start, or stopped, streaming within the allowed time."""
+
+
+def iter_with_deadlines(chunks: Iterator[str], first_chunk_timeout: float, stall_timeout: float,
+                        on_abort: Optional[Callable[[], None]] = None) -> Iterator[str]:
+    """Yield from `chunks`, raising StreamTimeout when a deadline passes.
+
+    `chunks` is consumed on a daemon thread (so a blocking request inside the
+    generator counts toward the first-chunk deadline). `on_abort` is called when
+    the caller stops early or a deadline passes (on its own thread, so it never
+    delays the caller), and should close the underlying response so the reader
+    thread exits.
+    """
+    events = queue.Queue()
+
+    def pump():
+        try:
+            for chunk in chunks:
+                events.put((_CHUNK, chunk))
+            events.put((_END, None))
+        except BaseException as e:  # handed to the consumer thread
+            events.put((_ERROR, e))
+
+    threading.Thread(target=pump, name='llm-stream', daemon=True).start()
+    timeout = first_chunk_timeout
+    started = finished = False
+    try:
+        while True:
+            try:
+                kind, value = events.get(timeout=timeout)
+            except queue.Empty:
+                what = 'next chunk' if started else 'first token'
+                raise StreamTimeout(f"No {what} within {timeout:g}s") from None
+            if kind == _END:
+                finished = True
+                return
+            if kind == _ERROR:
+                finished = True
+                raise value
+            if value:
+                started = True
+                timeout = stall_timeout
+                yield value
+    finally:
+        if not finished and on_abort is not None:
+            # Closing a response can block until the reader thread's current read returns
+            threading.Thread(target=on_abort, name='llm-stream-abort', daemon=True).start()
@@ -2,21 +2,17 @@
 """
 MBT Newsletter Generator
 Generates and sends a curated tech newsletter every 5 days.
+
+Only the standard library is imported at startup: config (and .env) and each stage's
+modules (scraper and requests, the LLM clients, email_sender) are imported when the
+stage runs, so the usage text and the scheduler start instantly and stay small
+(see benchmarks/bench_startup.py).
 """
 
 import logging
-from scraper import scrape_all_sources
-from config import NEWS_SOURCES, GEMINI_API_KEY, OPENAI_API_KEY
-
-# Prefer Gemini if key set; fall back to OpenAI when all Gemini models 404 (if OPENAI_API_KEY set)
-if GEMINI_API_KEY:
-    from gemini_client import generate_newsletter as _gemini_generate
-else:
-    from openai_client import generate_newsletter as _gemini_generate  # only OpenAI path
-
-from email_sender import send_email
-from scheduler import get_days_since_last_run
+import sys
 from datetime import datetime
+from typing import Optional
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,62 +20,166 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def generate_and_send_newsletter(test_mode: bool = False):
+def _print_chunk(chunk: str):
+    """Echo streamed newsletter text to the console as it arrives."""
+    sys.stdout.write(chunk)
+    sys.stdout.flush()
+
+def generate_and_send_newsletter(test_mode: bool = False, send_at: Optional[datetime] = None,
+                                 pipelined: Optional[bool] = None):
     """Main function to generate and send newsletter.
     
     Args:
         test_mode: If True, generates newsletter but doesn't send email
+        send_at: If set, the newsletter is prepared now and sent at this time
+            (at once if it is ready later; the scheduler starts runs ahead of it)
+        pipelined: Overlap scraping, selection, generation and SMTP connect (see pipeline);
+            default PIPELINED
+
+    Stage timings, bytes, tokens and send times are written as a run report (see metrics).
     """
+    import metrics
+    if pipelined is None:
+        from config import PIPELINED as pipelined
+
+    metrics.start_run('test' if test_mode else 'newsletter')
+    status = 'error'
     try:
-        # Step 1: Scrape all news sources
-        logger.info("Step 1: Scraping news sources...")
-        try:
+        content = _run_pipeline(test_mode, send_at, pipelined)
+        status = 'success'
+        return content
+    finally:
+        metrics.finish_run(status)
+
+def _prepare(on_chunk=None, on_generate=None):
+    """Scrape, select and generate one stage after another. Returns (items, content)."""
+    import metrics
+    from config import NEWS_SOURCES, NEW_ARTICLES_ONLY
+
+    # Step 1: Scrape all news sources
+    logger.info("Step 1: Scraping news sources...")
+    from scraper import scrape_all_sources
+    try:
+        with metrics.span('stage', stage='scrape'):
             scraped_items = scrape_all_sources(NEWS_SOURCES)
-        except Exception as e:
-            logger.error("Scraping failed: %s", e)
-            raise RuntimeError(f"Scraping failed: {e}") from e
-        
-        successful_items = [item for item in scraped_items if item.get('success')]
-        logger.info("Successfully scraped %d/%d sources", len(successful_items), len(NEWS_SOURCES))
-        
-        if not successful_items:
-            raise RuntimeError(
-                "Failed to scrape any news sources. Check network and that source URLs are reachable."
-            )
-        
-        # Step 2: Generate newsletter content
-        logger.info("Step 2: Generating newsletter content with AI...")
-        days_since_last_run = get_days_since_last_run()
-        try:
-            newsletter_content = _gemini_generate(successful_items, days_since_last_run)
-        except (RuntimeError, ValueError, Exception) as e:
-            if GEMINI_API_KEY and OPENAI_API_KEY:
-                logger.warning("Gemini failed (%s), falling back to OpenAI...", type(e).__name__)
-                from openai_client import generate_newsletter as openai_generate
-                newsletter_content = openai_generate(successful_items, days_since_last_run)
-            else:
-                logger.error("AI generation failed: %s", e)
-                raise RuntimeError(f"AI generation failed: {e}") from e
+    except Exception as e:
+        logger.error("Scraping failed: %s", e)
+        raise RuntimeError(f"Scraping failed: {e}") from e
+    
+    successful_items = [item for item in scraped_items if item.get('success')]
+    logger.info("Successfully scraped %d/%d sources", len(successful_items), len(NEWS_SOURCES))
+    
+    if not successful_items:
+        raise RuntimeError(
+            "Failed to scrape any news sources. Check network and that source URLs are reachable."
+        )
+    
+    # Record what was seen, drop duplicates and stories covered in past issues,
+    # then keep only articles first seen since the last newsletter
+    from article_store import ArticleStore
+    from dedup import DedupIndex, dedup_items
+    from ranking import rank_items
+    from scheduler import get_days_since_last_run, get_last_run
+    last_run = get_last_run()
+    with metrics.span('stage', stage='select'):
+        with ArticleStore() as store:
+            store.record_scrape(successful_items)
+            successful_items = dedup_items(successful_items, history=DedupIndex.load())
+            if NEW_ARTICLES_ONLY and last_run is not None:
+                successful_items = store.filter_new_since(successful_items, last_run)
+        # Keep the headlines most relevant to the focus areas, not navigation links
+        successful_items = rank_items(successful_items)
+    
+    # Step 2: Generate newsletter content
+    logger.info("Step 2: Generating newsletter content with AI...")
+    # Single prompt or map-reduce (GENERATION_MODE); Gemini first, OpenAI as hedged backup (see llm_router)
+    from map_reduce import generate_newsletter
+    days_since_last_run = get_days_since_last_run()
+    if on_generate:
+        on_generate()
+    try:
+        with metrics.span('stage', stage='generate'):
+            newsletter_content = generate_newsletter(successful_items, days_since_last_run, on_chunk=on_chunk)
+    except Exception as e:
+        logger.error("AI generation failed: %s", e)
+        raise RuntimeError(f"AI generation failed: {e}") from e
+    return successful_items, newsletter_content
+
+def _prepare_pipelined(on_chunk=None, on_generate=None):
+    """Scrape, select and generate with the stages overlapping (see pipeline). Returns (items, content)."""
+    from config import NEWS_SOURCES
+    from scheduler import get_days_since_last_run, get_last_run
+
+    logger.info("Steps 1-2: Scraping news sources and generating as they arrive (pipelined)...")
+    from pipeline import prepare
+    try:
+        return prepare(NEWS_SOURCES, get_last_run(), get_days_since_last_run(),
+                       on_chunk=on_chunk, on_generate=on_generate)
+    except RuntimeError:
+        raise
+    except Exception as e:
+        logger.error("Pipelined preparation failed: %s", e)
+        raise RuntimeError(f"Pipelined preparation failed: {e}") from e
+
+def _run_pipeline(test_mode: bool, send_at: Optional[datetime] = None, pipelined: bool = False):
+    import metrics
+
+    warm = None
+    # In test mode the newsletter is printed while it streams in
+    on_chunk = _print_chunk if test_mode else None
+
+    def on_generate():
+        if warm is not None:
+            warm.start()
+        if test_mode:
+            logger.info("=" * 80)
+
+    try:
+        if pipelined:
+            if not test_mode and send_at is None:
+                # Sending right after generation: open the SMTP sessions while the model writes
+                from smtp_delivery import WarmConnections
+                warm = WarmConnections()
+            successful_items, newsletter_content = _prepare_pipelined(on_chunk, on_generate)
+        else:
+            successful_items, newsletter_content = _prepare(on_chunk, on_generate)
         
         if not newsletter_content or not newsletter_content.strip():
             raise RuntimeError("AI returned empty newsletter content.")
         
         if test_mode:
-            logger.info("TEST MODE: Newsletter generated but not sent.")
-            logger.info("=" * 80)
-            logger.info(newsletter_content)
+            sys.stdout.write("\n")
             logger.info("=" * 80)
+            logger.info("TEST MODE: Newsletter generated (streamed above) but not sent.")
             return newsletter_content
         
+        if send_at is not None:
+            if datetime.now() < send_at:
+                logger.info("Newsletter ready; waiting to send at %s", send_at.strftime('%Y-%m-%d %H:%M'))
+                from scheduler import sleep_until
+                with metrics.span('stage', stage='wait'):
+                    sleep_until(send_at)
+            else:
+                logger.warning("Newsletter ready %s after its send time %s",
+                               str(datetime.now() - send_at).split('.')[0], send_at.strftime('%Y-%m-%d %H:%M'))
+        
         # Step 3: Send email
         logger.info("Step 3: Sending newsletter via email...")
-        subject = f"MBT Newsletter - {datetime.now().strftime('%B %d, %Y')}"
+        from email_sender import send_email
+        subject = f"MBT Newsletter - {(send_at or datetime.now()).strftime('%B %d, %Y')}"
         try:
-            send_email(newsletter_content, subject)
+            with metrics.span('stage', stage='send'):
+                send_email(newsletter_content, subject, connect_fn=warm.connect if warm else None)
         except Exception as e:
             logger.error("Email send failed: %s", e)
             raise RuntimeError(f"Email send failed: {e}") from e
         
+        from dedup import record_issue
+        try:
+            record_issue(successful_items, newsletter_content)
+        except OSError as e:
+            logger.warning("Could not update dedup index: %s", e)
+        
         logger.info("Newsletter generation and sending completed successfully!")
         return newsletter_content
         
@@ -88,24 +188,48 @@ def generate_and_send_newsletter(test_mode: bool = False):
     except Exception as e:
         logger.exception("Unexpected error in newsletter pipeline: %s", e)
         raise RuntimeError(f"Newsletter failed: {e}") from e
+    finally:
+        if warm is not None:
+            warm.close()
+
+def _run(test_mode: bool = False, send_at: Optional[datetime] = None,
+         pipelined: Optional[bool] = None, profiles: bool = False):
+    if profiles:
+        # Every newsletter of PROFILES_FILE from one scrape (see profiles)
+        from profiles import run_profiles
+        run_profiles(test_mode=test_mode, send_at=send_at)
+    else:
+        generate_and_send_newsletter(test_mode=test_mode, send_at=send_at, pipelined=pipelined)
 
 if __name__ == "__main__":
-    import sys
-    
-    if len(sys.argv) > 1:
-        if sys.argv[1] == '--schedule':
+    # --pipelined and --profiles combine with the modes below
+    pipelined = True if '--pipelined' in sys.argv else None
+    profiles = '--profiles' in sys.argv
+    args = [arg for arg in sys.argv if arg not in ('--pipelined', '--profiles')]
+    if len(args) > 1:
+        if args[1] == '--schedule':
             # Run as scheduled service
             from scheduler import start_scheduler
-            start_scheduler()
-        elif sys.argv[1] == '--test':
+            start_scheduler(profiles=profiles)
+        elif args[1] == '--send-at' and len(args) > 2:
+            # Prepare now, send at the given local time (used by the scheduler)
+            try:
+                send_at = datetime.fromisoformat(args[2])
+            except ValueError:
+                sys.exit(f"--send-at expects a time like 2026-01-05T08:00, got {args[2]!r}")
+            _run(send_at=send_at, pipelined=pipelined, profiles=profiles)
+        elif args[1] == '--test':
             # Test mode: generate but don't send
-            generate_and_send_newsletter(test_mode=True)
+            _run(test_mode=True, pipelined=pipelined, profiles=profiles)
         else:
+            # --help, -h or anything unknown
             print("Usage:")
             print("  python main.py          - Run once and send email")
             print("  python main.py --test   - Generate newsletter without sending")
             print("  python main.py --schedule - Run as scheduled service (every 5 days)")
+            print("  python main.py --send-at 2026-01-05T08:00 - Prepare now, send at that time")
+            print("  add --pipelined to overlap scraping, generation and SMTP connect")
+            print("  add --profiles to run every newsletter of profiles.json from one scrape")
     else:
         # Run once immediately
-        generate_and_send_newsletter()
-
+        _run(pipelined=pipelined, profiles=profiles)
@@ -0,0 +1,224 @@
+"""
+Map-reduce newsletter generation for large source sets.
+- Map: sources are grouped into batches of about MAP_BATCH_TOKENS and each batch is
+  condensed into JSON story candidates by its own LLM call (MAP_CONCURRENCY at a time).
+- Reduce: one final call with the unchanged SYSTEM_PROMPT writes the issue from the
+  candidates, so the final prompt stays small however many sources were scraped.
+GENERATION_MODE picks single-prompt, map-reduce, or 'auto' (map-reduce above
+MAP_REDUCE_THRESHOLD_TOKENS of source text).
+"""
+import json
+import logging
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import (SYSTEM_PROMPT, PROMPT_TOKEN_BUDGET, GENERATION_MODE, MAP_REDUCE_THRESHOLD_TOKENS,
+                    MAP_BATCH_TOKENS, MAP_CONCURRENCY, MAP_MAX_OUTPUT_TOKENS)
+import llm_router
+from dedup import url_hash
+from prompt_builder import (USER_PROMPT_TEMPLATE, estimate_tokens, focus_section, pack_sources,
+                            source_tokens)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GENERATION_MODES = ('auto', 'single', 'map_reduce')
+
+MAP_SYSTEM_PROMPT = """You are a research assistant preparing story candidates for a tech newsletter editor. Do not write newsletter prose.
+
+From the sources you are given, pick the stories most worth the editor's attention, preferring these focus areas:
+
+{focus}
+
+Respond with a JSON array only (no commentary), at most {max_stories} objects, each with:
+- "title": the story headline
+- "url": the article link exactly as given in the sources
+- "summary": 1-2 factual sentences on what happened, with names and numbers
+- "why": 1 sentence on the strategic implication
+- "score": 1-5, how strongly the story matches the focus areas"""
+
+MAP_USER_TEMPLATE = """Extract story candidates from these tech news sources:
+
+{sources}"""
+
+MAX_STORIES_PER_BATCH = 6
+
+
+def use_map_reduce(scraped_items: List[Dict]) -> bool:
+    """Whether GENERATION_MODE (and, for 'auto', the source size) calls for map-reduce."""
+    if GENERATION_MODE not in GENERATION_MODES:
+        raise ValueError(f"GENERATION_MODE must be one of {', '.join(GENERATION_MODES)}, got {GENERATION_MODE!r}")
+    if GENERATION_MODE != 'auto':
+        return GENERATION_MODE == 'map_reduce'
+    items = [item for item in scraped_items if item.get('success')]
+    return len(items) > 1 and sum(source_tokens(item) for item in items) > MAP_REDUCE_THRESHOLD_TOKENS
+
+
+def batch_sources(items: List[Dict], batch_tokens: int = MAP_BATCH_TOKENS) -> List[List[Dict]]:
+    """Group consecutive sources so each batch holds about `batch_tokens` tokens of source text."""
+    batches, current, used = [], [], 0
+    for item in items:
+        need = min(source_tokens(item), batch_tokens)
+        if current and used + need > batch_tokens:
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += need
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_candidates(text: str) -> List[Dict]:
+    """Story candidates from a map response (tolerates code fences and surrounding prose)."""
+    match = re.search(r'\[.*\]', text or '', re.S)
+    if not match:
+        raise ValueError("no JSON array in response")
+    candidates = []
+    for obj in json.loads(match.group(0)):
+        if not isinstance(obj, dict) or not str(obj.get('title') or '').strip():
+            continue
+        try:
+            score = min(5, max(1, int(obj.get('score', 3))))
+        except (TypeError, ValueError):
+            score = 3
+        candidates.append({
+            'title': str(obj['title']).strip(),
+            'url': str(obj.get('url') or '').strip(),
+            'summary': str(obj.get('summary') or '').strip(),
+            'why': str(obj.get('why') or '').strip(),
+            'score': score,
+        })
+    return candidates
+
+
+def render_candidates(candidates: List[Dict], budget_tokens: int) -> Tuple[str, int]:
+    """Highest-scoring candidates first, as many as fit in `budget_tokens`. Returns (text, count)."""
+    blocks, used = [], 0
+    ranked = sorted(candidates, key=lambda c: -c['score'])  # stable: ties keep source order
+    for i, c in enumerate(ranked, 1):
+        lines = [f"[{i}] {c['title']}" + (f" ({c['url']})" if c['url'] else '')]
+        if c['summary']:
+            lines.append(f"  {c['summary']}")
+        if c['why']:
+            lines.append(f"  Why it matters: {c['why']}")
+        block = '\n'.join(lines)
+        cost = estimate_tokens(block) + 1
+        if used + cost > budget_tokens:
+            logger.info("Map-reduce: %d of %d candidate(s) left out by the prompt budget",
+                        len(ranked) - len(blocks), len(ranked))
+            break
+        blocks.append(block)
+        used += cost
+    return '\n\n'.join(blocks), len(blocks)
+
+
+class MapStage:
+    """Map calls submitted as sources become available; candidates() waits for all of them.
+
+    map_stage() adds every source at once; pipeline adds late sources as they are scraped.
+    """
+
+    def __init__(self, providers: Optional[List[Tuple[str, Callable]]] = None,
+                 state: Optional[llm_router.RouterState] = None, system_prompt: Optional[str] = None):
+        self.providers = providers
+        self.state = state
+        # The focus areas of the newsletter's own system prompt
+        focus = focus_section(system_prompt) if system_prompt else focus_section()
+        self.system_prompt = MAP_SYSTEM_PROMPT.format(focus=focus, max_stories=MAX_STORIES_PER_BATCH)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, MAP_CONCURRENCY), thread_name_prefix='map')
+        self._batches: List[Tuple[List[Dict], Future]] = []
+
+    def _condense(self, batch: List[Dict]) -> List[Dict]:
+        sources, _ = pack_sources(batch, MAP_BATCH_TOKENS)
+        text = llm_router.complete(self.system_prompt, MAP_USER_TEMPLATE.format(sources=sources),
+                                   max_tokens=MAP_MAX_OUTPUT_TOKENS, providers=self.providers,
+                                   state=self.state, summary=False)
+        return parse_candidates(text)
+
+    def add(self, items: List[Dict]) -> int:
+        """Start map calls for `items` (batched by MAP_BATCH_TOKENS). Returns the number of batches."""
+        batches = batch_sources(items)
+        self._batches.extend((batch, self._pool.submit(self._condense, batch)) for batch in batches)
+        return len(batches)
+
+    def candidates(self) -> List[Dict]:
+        """Deduplicated story candidates of every batch, in the order the batches were added.
+
+        Batches that fail are skipped; raises RuntimeError only when every batch failed.
+        """
+        candidates, seen, failures = [], set(), []
+        try:
+            for batch, future in self._batches:
+                try:
+                    found = future.result()
+                except Exception as e:
+                    logger.warning("Map-reduce: batch of %d source(s) failed (%s: %s)",
+                                   len(batch), type(e).__name__, e)
+                    failures.append(e)
+                    continue
+                for candidate in found:
+                    key = url_hash(candidate['url']) if candidate['url'] else candidate['title'].lower()
+                    if key not in seen:
+                        seen.add(key)
+                        candidates.append(candidate)
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        total = len(self._batches)
+        if total and len(failures) == total:
+            raise RuntimeError(f"All {total} map call(s) failed") from failures[-1]
+        logger.info("Map-reduce: %d story candidate(s) from %d/%d batch(es)",
+                    len(candidates), total - len(failures), total)
+        return candidates
+
+
+def map_stage(items: List[Dict], providers: Optional[List[Tuple[str, Callable]]] = None,
+              state: Optional[llm_router.RouterState] = None, system_prompt: Optional[str] = None) -> List[Dict]:
+    """Condense sources into deduplicated story candidates with parallel LLM calls.
+
+    Batches that fail are skipped; raises RuntimeError only when every batch failed.
+    """
+    stage = MapStage(providers=providers, state=state, system_prompt=system_prompt)
+    batches = stage.add(items)
+    logger.info("Map-reduce: condensing %d source(s) in %d batch(es), %d at a time",
+                len(items), batches, MAP_CONCURRENCY)
+    return stage.candidates()
+
+
+def reduce_stage(candidates: List[Dict], scraped_items: list, days_since_last_run: int = 5,
+                 on_chunk: Optional[Callable[[str], None]] = None,
+                 providers: Optional[List[Tuple[str, Callable]]] = None,
+                 state: Optional[llm_router.RouterState] = None, system_prompt: Optional[str] = None) -> str:
+    """Write the issue from the map candidates (from `scraped_items` in one prompt if there are none)."""
+    if not candidates:
+        logger.warning("Map-reduce: no story candidates parsed; falling back to a single prompt")
+        return llm_router.generate_newsletter(scraped_items, days_since_last_run, on_chunk=on_chunk,
+                                              providers=providers, state=state, system_prompt=system_prompt)
+
+    overhead = estimate_tokens(USER_PROMPT_TEMPLATE)
+    stories, count = render_candidates(candidates, max(0, PROMPT_TOKEN_BUDGET - overhead))
+    logger.info("Map-reduce: writing the issue from %d candidate(s)", count)
+    user_prompt = USER_PROMPT_TEMPLATE.format(days=days_since_last_run, sources=stories)
+    return llm_router.complete(system_prompt or SYSTEM_PROMPT, user_prompt, on_chunk=on_chunk,
+                               providers=providers, state=state)
+
+
+def generate_newsletter(scraped_items: list, days_since_last_run: int = 5,
+                        on_chunk: Optional[Callable[[str], None]] = None,
+                        providers: Optional[List[Tuple[str, Callable]]] = None,
+                        state: Optional[llm_router.RouterState] = None,
+                        system_prompt: Optional[str] = None) -> str:
+    """Generate the newsletter in the configured GENERATION_MODE (see llm_router for providers).
+
+    `system_prompt` replaces SYSTEM_PROMPT (a profile's, see profiles).
+    """
+    if not use_map_reduce(scraped_items):
+        return llm_router.generate_newsletter(scraped_items, days_since_last_run, on_chunk=on_chunk,
+                                              providers=providers, state=state, system_prompt=system_prompt)
+
+    state = state or llm_router.RouterState()
+    items = [item for item in scraped_items if item.get('success')]
+    candidates = map_stage(items, providers=providers, state=state, system_prompt=system_prompt)
+    return reduce_stage(candidates, scraped_items, days_since_last_run, on_chunk=on_chunk,
+                        providers=providers, state=state, system_prompt=system_prompt)
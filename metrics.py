@@ -0,0 +1,174 @@
+"""
+Per-run timing and metrics for the newsletter pipeline.
+main starts a run, the stages record into it, and finishing the run writes:
+- a JSON run report to METRICS_DIR/run-<timestamp>.json: the timeline of spans and a
+  summary (count, sum, min, max, p50, p95) of every metric, labelled by source, provider...
+- a Prometheus textfile (METRICS_TEXTFILE, for node_exporter's textfile collector):
+  SUMMARY_METRICS as summaries (quantiles, sum, count), every other metric as a gauge
+  holding the run's total, so trends can be charted across scheduled runs.
+Outside a run (or with METRICS_ENABLED off) span() and observe() record nothing.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import METRICS_ENABLED, METRICS_DIR, METRICS_TEXTFILE, METRICS_KEEP_REPORTS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = 'mbt_newsletter_'
+QUANTILES = (0.5, 0.95)
+# Metrics observed many times per run (per recipient, per LLM call) whose distribution matters
+SUMMARY_METRICS = frozenset(['smtp_send_seconds', 'llm_latency_seconds', 'llm_first_token_seconds'])
+
+_lock = threading.Lock()
+_run: Optional['_Run'] = None
+
+
+class _Run:
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = datetime.now()
+        self.started = time.monotonic()
+        self.spans: List[Dict] = []
+        self.series: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+
+
+def start_run(name: str = 'newsletter') -> None:
+    """Start collecting (replaces a run that was never finished)."""
+    global _run
+    if METRICS_ENABLED:
+        with _lock:
+            _run = _Run(name)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record one value of a metric, e.g. observe('source_bytes', 52311, source=url)."""
+    run = _run
+    if run is None:
+        return
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        run.series.setdefault(key, []).append(float(value))
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a block: recorded in the timeline and as the metric `<name>_seconds`."""
+    run = _run
+    if run is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        seconds = time.monotonic() - started
+        observe(f"{name}_seconds", seconds, **labels)
+        with _lock:
+            run.spans.append({'name': name, 'labels': labels, 'start': round(started - run.started, 6),
+                              'seconds': round(seconds, 6)})
+
+
+def _quantile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _summary(values: List[float]) -> Dict:
+    summary = {'count': len(values), 'sum': sum(values), 'min': min(values), 'max': max(values)}
+    for q in QUANTILES:
+        summary[f"p{int(q * 100)}"] = _quantile(values, q)
+    return {k: round(v, 6) if isinstance(v, float) else v for k, v in summary.items()}
+
+
+def build_report(run: '_Run', status: str) -> Dict:
+    metrics: Dict[str, List[Dict]] = {}
+    for (name, labels), values in sorted(run.series.items()):
+        metrics.setdefault(name, []).append({'labels': dict(labels), **_summary(values)})
+    return {
+        'run': run.name,
+        'started': run.started_at.isoformat(timespec='seconds'),
+        'status': status,
+        'seconds': round(time.monotonic() - run.started, 3),
+        'spans': sorted(run.spans, key=lambda s: s['start']),
+        'metrics': metrics,
+    }
+
+
+def _label_text(labels: Dict[str, str], extra: str = '') -> str:
+    parts = ['{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for k, v in labels.items()]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def prometheus_text(run_report: Dict) -> str:
+    """The report in the Prometheus text exposition format."""
+    lines = []
+    for name, series in run_report['metrics'].items():
+        metric = PROMETHEUS_PREFIX + name
+        if name not in SUMMARY_METRICS:
+            lines.append(f"# TYPE {metric} gauge")
+            lines.extend(f"{metric}{_label_text(s['labels'])} {s['sum']}" for s in series)
+            continue
+        lines.append(f"# TYPE {metric} summary")
+        for s in series:
+            for q in QUANTILES:
+                quantile = 'quantile="{}"'.format(q)
+                lines.append(f"{metric}{_label_text(s['labels'], quantile)} {s[f'p{int(q * 100)}']}")
+            lines.append(f"{metric}_sum{_label_text(s['labels'])} {s['sum']}")
+            lines.append(f"{metric}_count{_label_text(s['labels'])} {s['count']}")
+    run = {'run': run_report['run']}
+    started = datetime.fromisoformat(run_report['started']).timestamp()
+    for name, value in (('run_timestamp_seconds', started),
+                        ('run_duration_seconds', run_report['seconds']),
+                        ('run_success', int(run_report['status'] == 'success'))):
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} gauge")
+        lines.append(f"{PROMETHEUS_PREFIX}{name}{_label_text(run)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def _write_atomic(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    # the textfile collector must never read a half-written file
+    os.replace(tmp, path)
+
+
+def _prune_reports(directory: str) -> None:
+    reports = sorted(f for f in os.listdir(directory) if f.startswith('run-') and f.endswith('.json'))
+    for name in reports[:max(0, len(reports) - METRICS_KEEP_REPORTS)]:
+        os.remove(os.path.join(directory, name))
+
+
+def finish_run(status: str = 'success') -> Optional[Dict]:
+    """Stop collecting and write the JSON report and the Prometheus textfile.
+
+    Returns the report (None without a run). Failing to write them is logged, never raised.
+    """
+    global _run
+    with _lock:
+        run, _run = _run, None
+    if run is None:
+        return None
+    run_report = build_report(run, status)
+    try:
+        path = os.path.join(METRICS_DIR, f"run-{run.started_at.strftime('%Y%m%d-%H%M%S')}.json")
+        _write_atomic(path, json.dumps(run_report, indent=2))
+        _prune_reports(METRICS_DIR)
+        if METRICS_TEXTFILE:
+            _write_atomic(METRICS_TEXTFILE, prometheus_text(run_report))
+        logger.info("Run metrics (%s, %.1fs) written to %s", status, run_report['seconds'], path)
+    except OSError as e:
+        logger.warning("Could not write run metrics: %s", e)
+    return run_report
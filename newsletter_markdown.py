@@ -0,0 +1,229 @@
+"""
+Parser for the newsletter markdown the LLM writes (the format SYSTEM_PROMPT asks for).
+One pass over the lines classifies each with a single regex (title, labelled insight /
+move, key takeaways, text, blank) and builds a typed AST:
+
+    Newsletter(intro, sections=[Section(title, paragraphs, insight, action)], takeaways)
+
+Inline **bold**, [links](https://...) and bare URLs become Bold/Link nodes instead of being
+lost. Common format drift is accepted: "## Title" or "1. **Title**" headings, bold or
+differently cased labels ("**Strategic Insight:**"), "Key takeaways" as a heading.
+Text before the first story is kept as the intro (a leading "# Newsletter" masthead is
+dropped, the email has its own); output with no stories at all is all intro.
+The same AST feeds render_text (canonical markdown, which parses back to the same AST)
+and inline_html (used by email_sender with the HTML template).
+"""
+import html
+import re
+from dataclasses import dataclass, field, replace
+from typing import List, Optional, Union
+
+
+@dataclass
+class Text:
+    text: str
+
+
+@dataclass
+class Bold:
+    children: List['Inline']
+
+
+@dataclass
+class Link:
+    children: List['Inline']
+    url: str
+
+
+Inline = Union[Text, Bold, Link]
+Spans = List[Inline]
+
+
+@dataclass
+class Section:
+    title: Spans
+    paragraphs: List[Spans] = field(default_factory=list)
+    insight: Optional[Spans] = None
+    action: Optional[Spans] = None
+
+
+@dataclass
+class Newsletter:
+    intro: List[Spans] = field(default_factory=list)
+    sections: List[Section] = field(default_factory=list)
+    takeaways: List[Spans] = field(default_factory=list)
+
+
+INSIGHT_LABEL = 'Strategic insight:'
+ACTION_LABEL = 'Your move:'
+TAKEAWAYS_LABEL = '**Key takeaways:**'
+
+# Lines are stripped and only those starting with one of these can be more than text
+_MARKERS = frozenset('#*-\u20220123456789KkSsYy')
+# One alternative per kind of (stripped) line; the first that matches wins, no match is text
+_LINE_RE = re.compile(r"""
+    (?:\#{1,6}\s*)?\**\s*(?P<kt>key\s+takeaways?)\s*\**\s*(?::\s*\**\s*(?P<takeaways>.*))?$
+  | \**\s*(?P<label>strategic\s+insight|your\s+move)\s*\**\s*:\s*\**\s*(?P<labelled>.*)$
+  | (?P<hashes>\#{1,6})\s+(?:\d+[.)]\s+)?\**(?P<heading>[^*].*?)\**\s*:?$
+  | (?:\d+[.)]\s+)?\*\*(?P<title>[^*]+)\*\*\s*:?$
+  | [-*\u2022]\s+(?P<bullet>.*)
+""", re.X | re.I)
+_INLINE_RE = re.compile(
+    r"\*\*(?P<bold>[^*]+)\*\*"
+    r"|\[(?P<label>[^\]]+)\]\((?P<url>[^)\s]+)\)"
+    r"|(?P<bare>https?://[^\s<>()\[\]]*[^\s<>()\[\].,;:!?'\"])"
+)
+_SAFE_URL_RE = re.compile(r'^(https?://|mailto:)', re.I)
+
+
+def parse_inline(text: str) -> Spans:
+    """Text with **bold**, [label](url) and bare http(s) URLs as Inline nodes."""
+    if '*' not in text and '[' not in text and '://' not in text:
+        return [Text(text)]
+    spans: Spans = []
+    pos = 0
+    for m in _INLINE_RE.finditer(text):
+        if m.start() > pos:
+            spans.append(Text(text[pos:m.start()]))
+        if m.group('bold') is not None:
+            spans.append(Bold(parse_inline(m.group('bold'))))
+        elif m.group('url') is not None:
+            spans.append(Link(parse_inline(m.group('label')), m.group('url')))
+        else:
+            spans.append(Link([Text(m.group('bare'))], m.group('bare')))
+        pos = m.end()
+    if pos < len(text):
+        spans.append(Text(text[pos:]))
+    return spans
+
+
+def parse(content: str) -> Newsletter:
+    """Parse newsletter markdown into a Newsletter AST in a single pass over its lines."""
+    doc = Newsletter()
+    section: Optional[Section] = None
+    # Lines of the block being collected, and where it goes when the block ends
+    block: List[str] = []
+    target = None
+
+    def flush():
+        nonlocal block
+        if block:
+            spans = parse_inline(' '.join(block))
+            if target == 'insight':
+                section.insight = spans
+            elif target == 'action':
+                section.action = spans
+            elif target == 'takeaways':
+                doc.takeaways.append(spans)
+            elif section is not None:
+                section.paragraphs.append(spans)
+            else:
+                doc.intro.append(spans)
+            block = []
+
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            flush()
+            if target in ('insight', 'action'):
+                target = None
+            continue
+        m = _LINE_RE.match(line) if line[0] in _MARKERS else None
+        # The last group of the matching alternative names the kind of line
+        kind = m.lastgroup if m else 'text'
+        if kind == 'text':
+            # Text continues the block being collected
+            block.append(line)
+        elif kind in ('kt', 'takeaways'):
+            flush()
+            target = 'takeaways'
+            if m.group('takeaways'):
+                block.append(m.group('takeaways'))
+        elif target == 'takeaways':
+            # Everything after "Key takeaways" belongs to it; bullets are separate items
+            if kind == 'bullet':
+                flush()
+                line = m.group('bullet')
+            block.append(line)
+        elif kind == 'labelled' and section is not None:
+            flush()
+            target = 'insight' if m.group('label')[0] in 'Ss' else 'action'
+            if m.group('labelled'):
+                block.append(m.group('labelled'))
+        elif kind == 'heading' and m.group('hashes') == '#' and section is None:
+            # "# Newsletter name" masthead: the email template has its own
+            continue
+        elif kind in ('heading', 'title'):
+            flush()
+            target = None
+            section = Section(parse_inline(m.group(kind).strip()))
+            doc.sections.append(section)
+        elif kind == 'bullet':
+            # A bullet starts a paragraph of its own (ending an insight / move)
+            flush()
+            target = None
+            block.append(m.group('bullet'))
+        else:
+            block.append(line)
+    flush()
+    return doc
+
+
+def plain_text(spans: Optional[Spans]) -> str:
+    """Spans as plain text (markup and URLs dropped)."""
+    if not spans:
+        return ''
+    return ''.join(s.text if isinstance(s, Text) else plain_text(s.children) for s in spans)
+
+
+def to_markdown(spans: Optional[Spans]) -> str:
+    if not spans:
+        return ''
+    out = []
+    for s in spans:
+        if isinstance(s, Text):
+            out.append(s.text)
+        elif isinstance(s, Bold):
+            out.append(f"**{to_markdown(s.children)}**")
+        elif len(s.children) == 1 and isinstance(s.children[0], Text) and s.children[0].text == s.url:
+            out.append(s.url)
+        else:
+            out.append(f"[{to_markdown(s.children)}]({s.url})")
+    return ''.join(out)
+
+
+def inline_html(spans: Optional[Spans]) -> str:
+    """Spans as escaped HTML; links other than http(s)/mailto are rendered as text."""
+    if not spans:
+        return ''
+    out = []
+    for s in spans:
+        if isinstance(s, Text):
+            out.append(html.escape(s.text))
+        elif isinstance(s, Bold):
+            out.append(f"<strong>{inline_html(s.children)}</strong>")
+        elif _SAFE_URL_RE.match(s.url):
+            out.append(f'<a href="{html.escape(s.url)}">{inline_html(s.children)}</a>')
+        else:
+            out.append(inline_html(s.children))
+    return ''.join(out)
+
+
+def render_text(doc: Newsletter) -> str:
+    """The newsletter in the canonical SYSTEM_PROMPT format (parse(render_text(doc)) == doc)."""
+    blocks = [to_markdown(p) for p in doc.intro]
+    for section in doc.sections:
+        blocks.append(f"**{to_markdown(section.title)}**")
+        blocks.extend(to_markdown(p) for p in section.paragraphs)
+        if section.insight:
+            blocks.append(f"{INSIGHT_LABEL} {to_markdown(section.insight)}")
+        if section.action:
+            blocks.append(f"{ACTION_LABEL} {to_markdown(section.action)}")
+    if doc.takeaways:
+        blocks.append('\n'.join([TAKEAWAYS_LABEL] + [f"- {to_markdown(t)}" for t in doc.takeaways]))
+    return '\n\n'.join(blocks)
+
+
+def with_sections(doc: Newsletter, sections: List[Section]) -> Newsletter:
+    """The same issue with its stories replaced (e.g. reordered for a segment)."""
+    return replace(doc, sections=sections)
@@ -0,0 +1,229 @@
+"""
+Precompiled HTML template for the newsletter email.
+templates/newsletter.html is the page shell; the repeated parts (story card, paragraph,
+insight, action, takeaways) are marked in place with `<!-- block name -->...<!-- end name -->`
+and become fragments with `{{slot}}` placeholders. The template and templates/newsletter.css
+are read and compiled once per process, so rendering an issue only escapes the dynamic
+text and joins precomputed string pieces.
+With EMAIL_INLINE_CSS the stylesheet is applied to every element's style attribute at
+compile time (mail clients that drop <style> still get the design); only rules that
+cannot be inlined, such as @media queries and :hover, stay in the <style> block.
+"""
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from config import EMAIL_INLINE_CSS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+TEMPLATE_FILE = 'newsletter.html'
+CSS_FILE = 'newsletter.css'
+
+SLOT_RE = re.compile(r'\{\{(\w+)\}\}')
+BLOCK_RE = re.compile(r'<!-- (block|end) (\w+) -->')
+COMMENT_RE = re.compile(r'<!--.*?-->', re.S)
+TAG_RE = re.compile(r'<!--.*?-->|<(/?)([a-zA-Z][a-zA-Z0-9]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>', re.S)
+CLASS_RE = re.compile(r'\sclass="([^"]*)"')
+STYLE_RE = re.compile(r'\sstyle="([^"]*)"')
+DECLARATION_RE = re.compile(r'([\w-]+\s*:\s*[^;{}]+?)\s*;')
+VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'])
+# Selectors made only of tags, classes, * and descendant combinators can be inlined
+INLINABLE_RE = re.compile(r'^[\w.\-* ]+$')
+
+
+class Fragment:
+    """A piece of template text with `{{slot}}` placeholders.
+
+    The text is split once into literal pieces and slot names, so render() is a single
+    ''.join over them, which is as cheap as assembling the text in place.
+    """
+
+    __slots__ = ('slots', '_parts')
+
+    def __init__(self, text: str):
+        parts = SLOT_RE.split(text)  # literals at even indices, slot names at odd
+        self.slots = list(dict.fromkeys(parts[1::2]))
+        # (is_slot, literal text or slot name), without the empty literals between adjacent slots
+        self._parts: List[Tuple[bool, str]] = [(i % 2 == 1, part) for i, part in enumerate(parts) if i % 2 or part]
+
+    def render(self, **values: str) -> str:
+        """The fragment with every slot filled in (values are inserted as given, not escaped)."""
+        try:
+            return ''.join([values[part] if is_slot else part for is_slot, part in self._parts])
+        except KeyError as e:
+            raise ValueError(f"Template slot {e.args[0]!r} has no value") from None
+
+
+def _declarations(body: str) -> Dict[str, str]:
+    declarations = {}
+    for declaration in body.split(';'):
+        prop, sep, value = declaration.partition(':')
+        if sep and prop.strip():
+            declarations[prop.strip().lower()] = value.strip()
+    return declarations
+
+
+def _compound(part: str) -> Tuple[str, frozenset]:
+    """'div.a.b' -> ('div', {'a', 'b'}); '*' and '.a' have no tag (None)."""
+    tag, *classes = part.split('.')
+    return (tag.lower() if tag and tag != '*' else None), frozenset(classes)
+
+
+def parse_css(css: str) -> Tuple[List[Tuple[List[Tuple[str, frozenset]], Dict[str, str]]], str]:
+    """Split a stylesheet into inlinable rules and the CSS that has to stay in <style>.
+
+    Rules are returned as (descendant selector parts, declarations), ordered by
+    specificity and then source order, i.e. in the order they should be applied.
+    """
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    rules, residual = [], []
+    pos = 0
+    while True:
+        start = css.find('{', pos)
+        if start < 0:
+            break
+        prelude = css[pos:start].strip()
+        if prelude.startswith('@'):
+            # at-rule with nested blocks: keep it whole
+            depth, end = 1, start + 1
+            while depth and end < len(css):
+                depth += {'{': 1, '}': -1}.get(css[end], 0)
+                end += 1
+            residual.append(css[pos:end].strip())
+            pos = end
+            continue
+        end = css.index('}', start)
+        body = css[start + 1:end]
+        kept = []
+        for selector in (s.strip() for s in prelude.split(',')):
+            if INLINABLE_RE.match(selector):
+                rules.append(([_compound(p) for p in selector.split()], _declarations(body)))
+            else:
+                kept.append(selector)
+        if kept:
+            residual.append(f"{', '.join(kept)} {{{body}}}")
+        pos = end + 1
+
+    def specificity(rule):
+        parts = rule[0]
+        return (sum(len(classes) for _, classes in parts), sum(1 for tag, _ in parts if tag))
+
+    rules.sort(key=specificity)  # stable: equal specificity keeps source order
+    return rules, '\n'.join(residual)
+
+
+def _matches(compound: Tuple[str, frozenset], element: Tuple[str, frozenset]) -> bool:
+    tag, classes = compound
+    return (tag is None or tag == element[0]) and classes <= element[1]
+
+
+def _selector_matches(parts, element, ancestors) -> bool:
+    if not _matches(parts[-1], element):
+        return False
+    i = len(parts) - 2
+    for ancestor in reversed(ancestors):
+        if i < 0:
+            break
+        if _matches(parts[i], ancestor):
+            i -= 1
+    return i < 0
+
+
+def inline_css(html: str, rules) -> str:
+    """Write the matching rules of `rules` (from parse_css) into the style attribute of every
+    element inside <body>; declarations already in a style attribute take precedence."""
+    out, stack = [], []
+    pos = 0
+    for m in TAG_RE.finditer(html):
+        closing, tag, attrs = m.group(1), m.group(2), m.group(3)
+        if tag is None:  # comment
+            continue
+        tag = tag.lower()
+        if closing:
+            while stack and stack.pop()[0] != tag:
+                pass
+            continue
+        classes = CLASS_RE.search(attrs)
+        element = (tag, frozenset(classes.group(1).split()) if classes else frozenset())
+        in_body = tag == 'body' or any(t == 'body' for t, _ in stack)
+        if in_body:
+            style = {}
+            for parts, declarations in rules:
+                if _selector_matches(parts, element, stack):
+                    style.update(declarations)
+            existing = STYLE_RE.search(attrs)
+            if existing:
+                style.update(_declarations(existing.group(1)))
+                attrs = attrs[:existing.start()] + attrs[existing.end():]
+            if style:
+                value = '; '.join(f"{prop}: {val}" for prop, val in style.items())
+                self_closing = attrs.rstrip().endswith('/')
+                attrs = attrs.rstrip().rstrip('/')
+                attrs = f'{attrs} style="{value};"' + (' /' if self_closing else '')
+                out.append(html[pos:m.start()])
+                out.append(f"<{m.group(2)}{attrs}>")
+                pos = m.end()
+        if tag not in VOID_TAGS and not attrs.rstrip().endswith('/'):
+            stack.append(element)
+    out.append(html[pos:])
+    return ''.join(out)
+
+
+def _split_blocks(text: str) -> Dict[str, str]:
+    """Template text per block; each nested block is replaced by a {{name}} slot."""
+    blocks = {}
+
+    def parse(pos: int, name: str) -> int:
+        out = []
+        while True:
+            m = BLOCK_RE.search(text, pos)
+            if m is None:
+                if name != 'page':
+                    raise ValueError(f"Template block '{name}' is not closed")
+                out.append(text[pos:])
+                pos = len(text)
+                break
+            out.append(text[pos:m.start()])
+            kind, inner = m.groups()
+            if kind == 'block':
+                if inner in blocks or inner == 'page':
+                    raise ValueError(f"Template block '{inner}' is defined twice")
+                pos = parse(m.end(), inner)
+                out.append('{{%s}}' % inner)
+            elif inner != name:
+                raise ValueError(f"Template block '{inner}' closed inside '{name}'")
+            else:
+                pos = m.end()
+                break
+        blocks[name] = COMMENT_RE.sub('', ''.join(out))
+        return pos
+
+    parse(0, 'page')
+    return blocks
+
+
+@lru_cache(maxsize=None)
+def load_template(inline: bool = EMAIL_INLINE_CSS, directory: str = TEMPLATE_DIR) -> Dict[str, Fragment]:
+    """Compiled fragments by block name ('page' is the shell). Cached per process."""
+    with open(os.path.join(directory, TEMPLATE_FILE), 'r', encoding='utf-8') as f:
+        text = f.read()
+    with open(os.path.join(directory, CSS_FILE), 'r', encoding='utf-8') as f:
+        css = f.read()
+    if inline:
+        rules, css = parse_css(css)
+        text = inline_css(text, rules)
+        # What is left (@media, :hover) must now win over the inlined style attributes
+        css = DECLARATION_RE.sub(lambda m: m.group(0) if '!important' in m.group(1)
+                                 else f"{m.group(1)} !important;", css)
+    # The stylesheet is static, so it is written into the shell now rather than per render
+    style = f"\n{css.strip()}\n" if css.strip() else ''
+    text = text.replace('<style>{{css}}</style>', f"<style>{style}</style>" if style else '')
+    fragments = {name: Fragment(block) for name, block in _split_blocks(text).items()}
+    logger.debug("Compiled %s (%d fragments, CSS %s)", TEMPLATE_FILE, len(fragments),
+                 'inlined' if inline else 'in <style>')
+    return fragments
@@ -1,63 +1,121 @@
 from openai import OpenAI
-from config import OPENAI_API_KEY, SYSTEM_PROMPT
+from config import (OPENAI_API_KEY, SYSTEM_PROMPT, LLM_STREAMING,
+                    LLM_FIRST_TOKEN_TIMEOUT_SEC, LLM_STALL_TIMEOUT_SEC)
+from llm_stream import iter_with_deadlines
+from rate_limiter import call_with_limits, get_limiter
+from prompt_builder import build_user_prompt, estimate_tokens, report_usage
+from typing import Callable, Iterator, Optional
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_newsletter(scraped_items: list, days_since_last_run: int = 5) -> str:
-    """Generate newsletter content using OpenAI."""
+OPENAI_MODEL = "gpt-4-turbo-preview"
+MAX_OUTPUT_TOKENS = 2000
+
+def _client() -> OpenAI:
+    # Retries are left to rate_limiter so 429s are shared with every other queued call
+    return OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+
+def _messages(system_prompt: str, user_prompt: str) -> list:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def stream_completion(system_prompt: str, user_prompt: str,
+                      max_tokens: int = MAX_OUTPUT_TOKENS) -> Iterator[str]:
+    """Yield text chunks as OpenAI produces them (stream=True).
+
+    Raises StreamTimeout if no text arrives within LLM_FIRST_TOKEN_TIMEOUT_SEC or the
+    stream stalls for LLM_STALL_TIMEOUT_SEC.
+    """
     if not OPENAI_API_KEY:
         raise ValueError("OPENAI_API_KEY not set in environment variables")
-    
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    
-    # Format scraped items for the prompt
-    items_text = []
-    for item in scraped_items:
-        if item.get('success'):
-            items_text.append({
-                'source': item['url'],
-                'content': item['text'][:2000],  # Limit content per source
-                'articles': item.get('articles', [])[:5]  # Top 5 articles
-            })
-    
-    user_prompt = f"""Analyze these tech news sources from the past {days_since_last_run} days. Find the 3-4 stories with the deepest strategic implications for someone building a career in business + AI.
 
-SOURCES:
+    client = _client()
+    estimated_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+    state = {}
+
+    # Opening the stream (and waiting for quota) happens before the first-token deadline starts
+    stream = call_with_limits(get_limiter('openai'), lambda: client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=_messages(system_prompt, user_prompt),
+        temperature=0.7,
+        max_tokens=max_tokens,
+        stream=True,
+        stream_options={"include_usage": True},
+        timeout=LLM_FIRST_TOKEN_TIMEOUT_SEC
+    ), estimated_tokens + max_tokens)
+    state['stream'] = stream
+
+    def chunks():
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                state['usage'] = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def abort():
+        if state.get('stream') is not None:
+            state['stream'].close()
+
+    logger.info("Streaming from OpenAI API (first token <= %gs, stall <= %gs)...",
+                LLM_FIRST_TOKEN_TIMEOUT_SEC, LLM_STALL_TIMEOUT_SEC)
+    yield from iter_with_deadlines(chunks(), LLM_FIRST_TOKEN_TIMEOUT_SEC, LLM_STALL_TIMEOUT_SEC, abort)
+    usage = state.get('usage')
+    report_usage('openai', estimated_tokens, getattr(usage, 'prompt_tokens', None),
+                 getattr(usage, 'completion_tokens', None))
 
-{str(items_text)}
+def stream_newsletter(scraped_items: list, days_since_last_run: int = 5) -> Iterator[str]:
+    """Yield newsletter text chunks as OpenAI produces them."""
+    yield from stream_completion(SYSTEM_PROMPT, build_user_prompt(scraped_items, days_since_last_run))
 
-Focus on:
+def complete(system_prompt: str, user_prompt: str, max_tokens: int = MAX_OUTPUT_TOKENS,
+             on_chunk: Optional[Callable[[str], None]] = None) -> str:
+    """Single chat completion (system + user message); returns the text.
 
-- What's genuinely NEW or SURPRISING (not just incremental updates)
+    Streams when LLM_STREAMING is set or `on_chunk` is given (called with each text chunk).
+    """
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY not set in environment variables")
+
+    if LLM_STREAMING or on_chunk is not None:
+        parts = []
+        for chunk in stream_completion(system_prompt, user_prompt, max_tokens):
+            parts.append(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+        return ''.join(parts)
+
+    client = _client()
+    estimated_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
 
-- Stories that reveal competitive dynamics or market shifts
+    logger.info("Calling OpenAI API...")
+    response = call_with_limits(get_limiter('openai'), lambda: client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=_messages(system_prompt, user_prompt),
+        temperature=0.7,
+        max_tokens=max_tokens
+    ), estimated_tokens + max_tokens)
 
-- Developments that create opportunities for students/professionals
+    usage = getattr(response, 'usage', None)
+    report_usage('openai', estimated_tokens, getattr(usage, 'prompt_tokens', None),
+                 getattr(usage, 'completion_tokens', None))
+    return response.choices[0].message.content
 
-- Insights that challenge conventional thinking
+def generate_newsletter(scraped_items: list, days_since_last_run: int = 5,
+                        on_chunk: Optional[Callable[[str], None]] = None) -> str:
+    """Generate newsletter content using OpenAI.
+
+    Streams when LLM_STREAMING is set or `on_chunk` is given (called with each text chunk).
+    """
+    user_prompt = build_user_prompt(scraped_items, days_since_last_run)
 
-Be ruthless: Skip stories that are surface-level or already widely understood."""
-    
     try:
-        logger.info("Calling OpenAI API to generate newsletter...")
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        newsletter_content = response.choices[0].message.content
+        newsletter_content = complete(SYSTEM_PROMPT, user_prompt, on_chunk=on_chunk)
         logger.info("Newsletter generated successfully")
         return newsletter_content
     except Exception as e:
         logger.error(f"Error generating newsletter: {str(e)}")
         raise
-
-
-
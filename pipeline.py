@@ -0,0 +1,143 @@
+"""
+Pipelined newsletter preparation (PIPELINED=true or python main.py --pipelined).
+The sequential run waits for every source before selecting articles, and for the whole
+issue before connecting to SMTP. Here the stages overlap:
+- sources are scraped in the background and each one is recorded in the article store,
+  deduplicated and filtered to new articles as soon as it arrives;
+- generation starts once PIPELINE_QUORUM of the sources are in, or PIPELINE_DEADLINE_SEC
+  after the start. When the issue is written map-reduce, sources still loading get map calls
+  of their own as they arrive (for up to PIPELINE_STRAGGLER_SEC); a single prompt cannot take
+  late sources, so it waits for them up to the deadline instead;
+- main opens the SMTP sessions when generation starts (on_generate, see WarmConnections).
+"""
+import logging
+import math
+import queue
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import PIPELINE_QUORUM, PIPELINE_DEADLINE_SEC, PIPELINE_STRAGGLER_SEC, NEW_ARTICLES_ONLY, RANK_TOP_K
+import llm_router
+import map_reduce
+import metrics
+from article_store import ArticleStore
+from dedup import DedupIndex, Deduper
+from ranking import rank_items
+from scraper import start_scraping
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _Selection:
+    """Articles selected from each source as it arrives: stored, deduplicated, new only."""
+
+    def __init__(self, urls: List[str], store: ArticleStore, last_run: Optional[datetime]):
+        self.total = len(urls)
+        self.order = {url: i for i, url in enumerate(urls)}
+        self.store = store
+        self.last_run = last_run
+        self.deduper = Deduper(history=DedupIndex.load())
+        self.done = 0
+        self.items: List[Dict] = []
+
+    def add(self, item: Dict) -> Optional[Dict]:
+        """The selected copy of a scraped source (None if it failed)."""
+        self.done += 1
+        if not item.get('success'):
+            return None
+        self.store.record_scrape([item])
+        item = self.deduper.add(item)
+        if NEW_ARTICLES_ONLY and self.last_run is not None:
+            item = self.store.filter_new_since([item], self.last_run)[0]
+        self.items.append(item)
+        return item
+
+    def collect(self, results: queue.Queue, target: int, deadline: float) -> None:
+        """Take results until `target` sources are done or the deadline passes (either only once one succeeded)."""
+        while self.done < self.total and (self.done < target or not self.items):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and self.items:
+                return
+            try:
+                # Past the deadline with nothing to write about: keep waiting
+                self.add(results.get(timeout=remaining if remaining > 0 else None))
+            except queue.Empty:
+                return
+
+    def in_order(self, items: List[Dict]) -> List[Dict]:
+        """`items` in NEWS_SOURCES order (they arrive in completion order)."""
+        return sorted(items, key=lambda item: self.order.get(item['url'], self.total))
+
+
+def prepare(urls: List[str], last_run: Optional[datetime], days_since_last_run: int,
+            on_chunk: Optional[Callable[[str], None]] = None,
+            on_generate: Optional[Callable[[], None]] = None) -> Tuple[List[Dict], str]:
+    """Scrape, select and generate with the stages overlapping.
+
+    Returns (the selected source items, the newsletter content); `on_generate` is called
+    when generation starts. Raises RuntimeError if no source could be scraped.
+    """
+    started = time.monotonic()
+    results: queue.Queue = queue.Queue()
+    pool = start_scraping(urls, results)
+    try:
+        with ArticleStore() as store:
+            selection = _Selection(urls, store, last_run)
+            deadline = started + PIPELINE_DEADLINE_SEC
+            with metrics.span('stage', stage='scrape'):
+                selection.collect(results, max(1, math.ceil(PIPELINE_QUORUM * len(urls))), deadline)
+                streaming = selection.done < len(urls) and map_reduce.use_map_reduce(selection.items)
+                if not streaming:
+                    selection.collect(results, len(urls), deadline)
+            if not selection.items:
+                raise RuntimeError(
+                    "Failed to scrape any news sources. Check network and that source URLs are reachable."
+                )
+            items = rank_items(selection.in_order(selection.items))
+            logger.info("Pipeline: generating from %d/%d source(s) after %.1fs; %d still loading",
+                        len(items), len(urls), time.monotonic() - started, len(urls) - selection.done)
+            if on_generate:
+                on_generate()
+            with metrics.span('stage', stage='generate'):
+                if not streaming:
+                    left_out = len(urls) - selection.done
+                    if left_out:
+                        logger.warning("Pipeline: %d source(s) not scraped by the deadline are left out",
+                                       left_out)
+                    return items, map_reduce.generate_newsletter(items, days_since_last_run, on_chunk=on_chunk)
+                return _generate_streaming(selection, results, items, days_since_last_run, on_chunk)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _generate_streaming(selection: _Selection, results: queue.Queue, items: List[Dict],
+                        days_since_last_run: int,
+                        on_chunk: Optional[Callable[[str], None]]) -> Tuple[List[Dict], str]:
+    """Map-reduce with map calls for the sources in now, then one per late source as it arrives."""
+    state = llm_router.RouterState()
+    stage = map_reduce.MapStage(state=state)
+    batches = stage.add(items)
+    # Late sources are ranked on their own, with their share of RANK_TOP_K
+    share = max(1, RANK_TOP_K // max(1, selection.total))
+    cutoff = time.monotonic() + PIPELINE_STRAGGLER_SEC
+    while selection.done < selection.total:
+        remaining = cutoff - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = selection.add(results.get(timeout=remaining))
+        except queue.Empty:
+            break
+        if item is not None:
+            item = rank_items([item], top_k=share)[0]
+            items.append(item)
+            batches += stage.add([item])
+    if selection.done < selection.total:
+        logger.warning("Pipeline: %d source(s) still loading after %.0fs are left out",
+                       selection.total - selection.done, PIPELINE_STRAGGLER_SEC)
+    logger.info("Map-reduce: condensed %d source(s) in %d batch(es) as they arrived", len(items), batches)
+    items = selection.in_order(items)
+    candidates = stage.candidates()
+    return items, map_reduce.reduce_stage(candidates, items, days_since_last_run, on_chunk=on_chunk, state=state)
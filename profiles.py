@@ -0,0 +1,239 @@
+"""
+Several newsletters from one run (python main.py --profiles).
+Each profile in PROFILES_FILE (see profiles.example.json) has its own name, subject, sources,
+system prompt and recipients; anything left out falls back to config (NEWS_SOURCES,
+SYSTEM_PROMPT, RECIPIENT_EMAILS / RECIPIENTS_FILE). One run:
+- scrapes every URL once, however many profiles list it, over the shared HTTP pool;
+- selects each profile's articles (dedup against its own past issues, new since its own last
+  run, ranked against its own focus areas) and generates the profiles' issues concurrently;
+- sends each issue as soon as it is written, all over one pool of SMTP sessions (with
+  --send-at, opened WARM_START_SEC before the send time rather than at the start).
+Profile state (last run, covered stories) lives in PROFILES_STATE_DIR/<name>/. A profile that
+fails does not stop the others; the run fails at the end if any did.
+"""
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config import PROFILES_FILE, PROFILES_STATE_DIR, NEWS_SOURCES, SYSTEM_PROMPT, NEW_ARTICLES_ONLY
+import metrics
+from segments import load_recipients
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROFILE_KEYS = frozenset(['name', 'subject', 'sources', 'system_prompt', 'system_prompt_file',
+                          'recipients', 'recipients_file'])
+_NAME_RE = re.compile(r'^[a-z0-9][a-z0-9_-]*$')
+# With a later send time, the SMTP sessions are opened this long before it (idle ones time out)
+WARM_START_SEC = 60
+
+
+@dataclass
+class Profile:
+    name: str
+    subject: str = 'MBT Newsletter'
+    sources: List[str] = field(default_factory=lambda: list(NEWS_SOURCES))
+    system_prompt: str = SYSTEM_PROMPT
+    recipients: List[Tuple[str, Tuple[str, ...]]] = field(default_factory=list)
+
+    @property
+    def state_dir(self) -> str:
+        return os.path.join(PROFILES_STATE_DIR, self.name)
+
+    @property
+    def last_run_file(self) -> str:
+        return os.path.join(self.state_dir, 'last_run.json')
+
+    @property
+    def dedup_index_file(self) -> str:
+        return os.path.join(self.state_dir, 'dedup_index.json')
+
+
+def _read_text(path: str, base_dir: str) -> str:
+    with open(os.path.join(base_dir, path), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def parse_profile(entry: Dict, base_dir: str = '.') -> Profile:
+    """A Profile from one entry of the profiles file (paths are relative to the file)."""
+    unknown = set(entry) - PROFILE_KEYS
+    if unknown:
+        raise ValueError(f"Unknown profile key(s) {sorted(unknown)}; allowed: {sorted(PROFILE_KEYS)}")
+    name = str(entry.get('name') or '')
+    if not _NAME_RE.match(name):
+        raise ValueError(f"Profile name must be lowercase letters, digits, - or _, got {name!r}")
+    profile = Profile(name=name)
+    if entry.get('subject'):
+        profile.subject = entry['subject']
+    if entry.get('sources'):
+        profile.sources = list(entry['sources'])
+    if entry.get('system_prompt_file'):
+        profile.system_prompt = _read_text(entry['system_prompt_file'], base_dir)
+    elif entry.get('system_prompt'):
+        profile.system_prompt = entry['system_prompt']
+    if entry.get('recipients_file'):
+        profile.recipients = load_recipients(path=os.path.join(base_dir, entry['recipients_file']))
+    elif entry.get('recipients'):
+        profile.recipients = load_recipients(entries=entry['recipients'])
+    else:
+        profile.recipients = load_recipients()
+    return profile
+
+
+def load_profiles(path: str = PROFILES_FILE) -> List[Profile]:
+    """Every profile of the profiles file ({"profiles": [...]})."""
+    if not os.path.exists(path):
+        raise ValueError(f"Profiles file {path} not found (see profiles.example.json)")
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    profiles = [parse_profile(entry, base_dir) for entry in data.get('profiles', [])]
+    if not profiles:
+        raise ValueError(f"No profiles defined in {path}")
+    names = [p.name for p in profiles]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Profile names must be unique in {path}: {names}")
+    return profiles
+
+
+def shared_sources(profiles: List[Profile]) -> List[str]:
+    """Every profile's sources, each URL once, in first-listed order."""
+    return list(dict.fromkeys(url for profile in profiles for url in profile.sources))
+
+
+def _select(profile: Profile, scraped: Dict[str, Dict], store) -> List[Dict]:
+    """The profile's share of the scrape: deduplicated, new since its last run, ranked for it."""
+    from dedup import DedupIndex, dedup_items
+    from ranking import rank_items
+    from scheduler import get_last_run
+
+    items = [scraped[url] for url in profile.sources if scraped[url].get('success')]
+    items = dedup_items(items, history=DedupIndex.load(profile.dedup_index_file))
+    last_run = get_last_run(profile.last_run_file)
+    if NEW_ARTICLES_ONLY and last_run is not None:
+        items = store.filter_new_since(items, last_run)
+    return rank_items(items, system_prompt=profile.system_prompt)
+
+
+def _generate(profile: Profile, items: List[Dict], state) -> str:
+    from map_reduce import generate_newsletter
+    from scheduler import get_days_since_last_run
+
+    with metrics.span('stage', stage='generate', profile=profile.name):
+        content = generate_newsletter(items, get_days_since_last_run(profile.last_run_file), state=state,
+                                      system_prompt=profile.system_prompt)
+    if not content or not content.strip():
+        raise RuntimeError("AI returned empty newsletter content.")
+    return content
+
+
+def _send(profile: Profile, items: List[Dict], content: str, subject: str, pool) -> None:
+    from dedup import record_issue
+    from email_sender import send_email
+    from scheduler import update_last_run
+    from smtp_delivery import issue_id_for
+
+    with metrics.span('stage', stage='send', profile=profile.name):
+        send_email(content, subject, issue_id=f"{profile.name}-{issue_id_for(subject)}",
+                   connect_fn=pool.connect, release_fn=pool.release, recipients=profile.recipients)
+    os.makedirs(profile.state_dir, exist_ok=True)
+    update_last_run(path=profile.last_run_file)
+    try:
+        record_issue(items, content, path=profile.dedup_index_file)
+    except OSError as e:
+        logger.warning("Could not update dedup index of profile %s: %s", profile.name, e)
+
+
+def run_profiles(test_mode: bool = False, send_at: Optional[datetime] = None,
+                 path: str = PROFILES_FILE) -> Dict[str, str]:
+    """Generate and send every profile's newsletter. Returns {profile name: content}.
+
+    In test mode the issues are printed instead of sent. With `send_at` the issues are
+    prepared now and sent at that time. Raises RuntimeError if any profile failed.
+    """
+    metrics.start_run('profiles-test' if test_mode else 'profiles')
+    status = 'error'
+    try:
+        contents = _run_profiles(load_profiles(path), test_mode, send_at)
+        status = 'success'
+        return contents
+    finally:
+        metrics.finish_run(status)
+
+
+def _run_profiles(profiles: List[Profile], test_mode: bool, send_at: Optional[datetime]) -> Dict[str, str]:
+    import llm_router
+    from article_store import ArticleStore
+    from scraper import scrape_all_sources
+
+    urls = shared_sources(profiles)
+    logger.info("Profiles %s: scraping %d unique source(s) (%d listed)",
+                ', '.join(p.name for p in profiles), len(urls), sum(len(p.sources) for p in profiles))
+    with metrics.span('stage', stage='scrape'):
+        scraped = {item['url']: item for item in scrape_all_sources(urls)}
+    successful = [item for item in scraped.values() if item.get('success')]
+    if not successful:
+        raise RuntimeError("Failed to scrape any news sources. Check network and that source URLs are reachable.")
+
+    with metrics.span('stage', stage='select'):
+        with ArticleStore() as store:
+            store.record_scrape(successful)
+            selected = {p.name: _select(p, scraped, store) for p in profiles}
+
+    pool = None
+    warm_at = None
+    if not test_mode:
+        # One pool of SMTP sessions for every profile, opened while the issues are written
+        # or, when they go out later, shortly before the send time
+        from smtp_delivery import WarmConnections
+        pool = WarmConnections()
+        if send_at is not None:
+            warm_at = send_at - timedelta(seconds=WARM_START_SEC)
+        if warm_at is None or warm_at <= datetime.now():
+            pool.start()
+            warm_at = None
+    contents: Dict[str, str] = {}
+    failed: Dict[str, str] = {}
+    # Breaker state and latency history are shared by the concurrent generations
+    state = llm_router.RouterState()
+    date = (send_at or datetime.now()).strftime('%B %d, %Y')
+    try:
+        with ThreadPoolExecutor(max_workers=len(profiles), thread_name_prefix='profile') as executor:
+            futures = {executor.submit(_generate, p, selected[p.name], state): p
+                       for p in profiles if selected[p.name]}
+            for p in profiles:
+                if not selected[p.name]:
+                    failed[p.name] = "none of its sources could be scraped"
+            # Each issue is sent as soon as it is written, while the others are still generating
+            for future in as_completed(futures):
+                profile = futures[future]
+                try:
+                    contents[profile.name] = content = future.result()
+                    if test_mode:
+                        print(f"\n{'=' * 30} {profile.name}: {profile.subject} {'=' * 30}\n{content}")
+                        continue
+                    if send_at is not None:
+                        from scheduler import sleep_until
+                        if warm_at is not None:
+                            sleep_until(warm_at)
+                            pool.start()
+                            warm_at = None
+                        sleep_until(send_at)
+                    _send(profile, selected[profile.name], content, f"{profile.subject} - {date}", pool)
+                    logger.info("Profile %s: sent to %d recipient(s)", profile.name, len(profile.recipients))
+                except Exception as e:
+                    logger.error("Profile %s failed: %s", profile.name, e)
+                    failed[profile.name] = str(e)
+    finally:
+        if pool is not None:
+            pool.close()
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(profiles)} profile(s) failed: "
+                           + '; '.join(f"{name}: {error}" for name, error in failed.items()))
+    return contents
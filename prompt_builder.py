@@ -0,0 +1,247 @@
+"""
+Shared user-prompt builder for the LLM clients.
+Serializes sources compactly (plain lines instead of Python reprs of dicts) and packs
+them into a token budget: each source gets a share weighted by how relevant it is to
+the focus areas in SYSTEM_PROMPT and how dense its text is, and budget a source cannot
+use is handed on to the others. With STORY_CLUSTERING the articles are sent as stories
+instead (see clustering), each listing every source that covered it. Token counts are
+estimated locally; report_usage() compares the estimate with what the provider billed.
+"""
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from clustering import cluster_stories
+from config import PROMPT_TOKEN_BUDGET, PROMPT_CHARS_PER_TOKEN, SYSTEM_PROMPT, STORY_CLUSTERING
+import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+USER_PROMPT_TEMPLATE = """Analyze these tech news sources from the past {days} days. Find the 3-4 stories with the deepest strategic implications for someone building a career in business + AI.
+
+SOURCES:
+
+{sources}
+
+Focus on:
+
+- What's genuinely NEW or SURPRISING (not just incremental updates)
+
+- Stories that reveal competitive dynamics or market shifts
+
+- Developments that create opportunities for students/professionals
+
+- Insights that challenge conventional thinking
+
+Be ruthless: Skip stories that are surface-level or already widely understood."""
+
+# Share of a source's allocation spent on headlines before the page excerpt
+ARTICLE_SHARE = 0.6
+# Sources that would get fewer tokens than this are left out entirely
+MIN_SOURCE_TOKENS = 40
+# Per clustered story: page-text excerpt size, alternative headlines and extra links shown
+STORY_CONTEXT_TOKENS = 60
+MAX_STORY_ALT_TITLES = 3
+MAX_STORY_LINKS = 4
+
+_WORD_RE = re.compile(r"[a-z][a-z0-9+\-]{2,}")
+_STOPWORDS = frozenset(
+    "the and for with that this from are was not but you your what how why who when "
+    "just like into over more most than they them their its it's has have had been "
+    "will can about also our out any all new one".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (characters / PROMPT_CHARS_PER_TOKEN)."""
+    return int(len(text) / PROMPT_CHARS_PER_TOKEN + 0.5)
+
+
+def words(text: str) -> List[str]:
+    """Lowercase content words (3+ characters, stopwords removed)."""
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def focus_section(system_prompt: str = SYSTEM_PROMPT) -> str:
+    """The FOCUS AREAS list of the system prompt (the whole prompt if there is none)."""
+    match = re.search(r'FOCUS AREAS[^\n]*\n(.*?)\n\s*AVOID:', system_prompt, re.S)
+    return match.group(1).strip() if match else system_prompt
+
+
+def focus_terms(system_prompt: str = SYSTEM_PROMPT) -> frozenset:
+    """Vocabulary of the FOCUS AREAS section of the system prompt."""
+    return frozenset(words(focus_section(system_prompt)))
+
+
+_FOCUS_TERMS = focus_terms()
+
+
+def _short_url(url: str) -> str:
+    url = re.sub(r'^https?://', '', url)
+    return url[4:] if url.startswith('www.') else url
+
+
+def _source_weight(item: Dict) -> float:
+    """Relevance to the focus areas times text density, plus a floor so no source starves."""
+    tokens = words(item.get('text', '') + ' ' + ' '.join(a['title'] for a in item.get('articles', [])))
+    if not tokens:
+        return 0.1
+    counts = Counter(tokens)
+    relevance = sum(counts[t] for t in _FOCUS_TERMS) / len(tokens)
+    density = len(counts) / len(tokens)  # boilerplate-heavy pages repeat themselves
+    return 0.2 + (10 * relevance + 0.5) * density + item.get('relevance', 0.0)
+
+
+def _allocate(needs: List[int], weights: List[float], budget: int) -> List[int]:
+    """Split `budget` proportionally to `weights`, capping each share at its need.
+
+    Water-filling: sources that need less than their share are satisfied first and
+    the remainder is re-split among the rest.
+    """
+    alloc = [0] * len(needs)
+    active = [i for i, need in enumerate(needs) if need > 0]
+    remaining = budget
+    while active and remaining > 0:
+        total_weight = sum(weights[i] for i in active)
+        shares = {i: remaining * weights[i] / total_weight for i in active}
+        satisfied = [i for i in active if needs[i] <= shares[i]]
+        if not satisfied:
+            for i in active:
+                alloc[i] = int(shares[i])
+            break
+        for i in satisfied:
+            alloc[i] = needs[i]
+            remaining -= needs[i]
+            active.remove(i)
+    return alloc
+
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    max_chars = int(tokens * PROMPT_CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > 0 else max_chars] + ' …'
+
+
+def _render_source(index: int, item: Dict, budget: int) -> str:
+    lines = [f"[{index}] {_short_url(item['url'])}"]
+    used = estimate_tokens(lines[0])
+    articles = item.get('articles', [])
+    text = item.get('text', '')
+    article_budget = budget if not text else max(int(budget * ARTICLE_SHARE), budget - estimate_tokens(text))
+    for article in articles:
+        line = f"- {article['title']} ({_short_url(article['url'])})"
+        cost = estimate_tokens(line) + 1
+        if used + cost > article_budget:
+            break
+        lines.append(line)
+        used += cost
+    if text and budget - used > 8:
+        lines.append(f"> {_truncate_to_tokens(text, budget - used - 2)}")
+    return '\n'.join(lines)
+
+
+def source_tokens(item: Dict) -> int:
+    """Estimated tokens of a source rendered in full (all headlines and the whole excerpt)."""
+    return estimate_tokens(_render_source(1, item, 10 ** 9))
+
+
+def pack_sources(scraped_items: List[Dict], budget_tokens: int) -> Tuple[str, int]:
+    """Serialize successful sources into at most ~`budget_tokens` tokens.
+
+    Returns (sources_text, estimated_tokens).
+    """
+    items = [item for item in scraped_items if item.get('success')]
+    full = [_render_source(i, item, 10 ** 9) for i, item in enumerate(items, 1)]
+    needs = [estimate_tokens(block) for block in full]
+    weights = [_source_weight(item) for item in items]
+    alloc = _allocate(needs, weights, budget_tokens)
+    blocks = []
+    for i, (item, tokens) in enumerate(zip(items, alloc)):
+        if tokens >= needs[i]:
+            blocks.append(full[i])
+        elif tokens >= MIN_SOURCE_TOKENS:
+            blocks.append(_render_source(i + 1, item, tokens))
+        else:
+            logger.info("Prompt budget: dropped %s (share %d tokens)", item['url'], tokens)
+    text = '\n\n'.join(blocks)
+    return text, estimate_tokens(text)
+
+
+def _render_story(index: int, story: Dict, with_context: bool = True) -> str:
+    lines = [f"[{index}] {story['title']} ({_short_url(story['urls'][0])})"]
+    if story['titles']:
+        lines.append(f"- Also headlined: {'; '.join(story['titles'][:MAX_STORY_ALT_TITLES])}")
+    if len(story['sources']) > 1:
+        lines.append(f"- Covered by: {', '.join(_short_url(u) for u in story['sources'])}")
+    if len(story['urls']) > 1:
+        lines.append(f"- More: {' '.join(_short_url(u) for u in story['urls'][1:MAX_STORY_LINKS])}")
+    if with_context and story['context']:
+        lines.append(f"> {_truncate_to_tokens(story['context'], STORY_CONTEXT_TOKENS)}")
+    return '\n'.join(lines)
+
+
+def pack_stories(stories: List[Dict], scraped_items: List[Dict], budget_tokens: int) -> Tuple[str, int]:
+    """Serialize clustered stories (in order) into ~`budget_tokens` tokens.
+
+    Budget left over goes to the page text of sources that had no articles.
+    Returns (stories_text, estimated_tokens).
+    """
+    blocks, used = [], 0
+    for story in stories:
+        block = _render_story(len(blocks) + 1, story)
+        if used + estimate_tokens(block) + 1 > budget_tokens:
+            block = _render_story(len(blocks) + 1, story, with_context=False)
+            if used + estimate_tokens(block) + 1 > budget_tokens:
+                logger.info("Prompt budget: %d of %d stor%s left out", len(stories) - len(blocks),
+                            len(stories), 'y' if len(stories) == 1 else 'ies')
+                break
+        blocks.append(block)
+        used += estimate_tokens(block) + 1
+    text_only = [item for item in scraped_items if item.get('success') and not item.get('articles')]
+    if text_only and budget_tokens - used >= MIN_SOURCE_TOKENS:
+        extra, _ = pack_sources(text_only, budget_tokens - used)
+        if extra:
+            blocks.append(extra)
+    text = '\n\n'.join(blocks)
+    return text, estimate_tokens(text)
+
+
+def build_user_prompt(scraped_items: List[Dict], days_since_last_run: int,
+                      budget_tokens: Optional[int] = None) -> str:
+    """Build the user prompt, packing sources into PROMPT_TOKEN_BUDGET tokens by default."""
+    budget = PROMPT_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+    overhead = estimate_tokens(USER_PROMPT_TEMPLATE)
+    with metrics.span('prompt_build'):
+        stories = cluster_stories(scraped_items) if STORY_CLUSTERING else None
+        if stories:
+            sources, used = pack_stories(stories, scraped_items, max(0, budget - overhead))
+        else:
+            sources, used = pack_sources(scraped_items, max(0, budget - overhead))
+    logger.info("Prompt packed: ~%d source tokens (budget %d)", used, budget)
+    metrics.observe('prompt_source_tokens', used)
+    return USER_PROMPT_TEMPLATE.format(days=days_since_last_run, sources=sources)
+
+
+def report_usage(provider: str, estimated_tokens: int, actual_tokens: Optional[int],
+                 output_tokens: Optional[int] = None) -> Optional[float]:
+    """Log estimated vs. billed prompt tokens; returns actual/estimated (None if unknown).
+
+    The billed prompt tokens (else the estimate) and output tokens are recorded in the run metrics.
+    """
+    metrics.observe('llm_prompt_tokens', actual_tokens or estimated_tokens, provider=provider,
+                    billed='yes' if actual_tokens else 'no')
+    if output_tokens:
+        metrics.observe('llm_output_tokens', output_tokens, provider=provider)
+    if not actual_tokens or not estimated_tokens:
+        logger.info("Prompt tokens (%s): estimated %d, actual unknown", provider, estimated_tokens)
+        return None
+    ratio = actual_tokens / estimated_tokens
+    logger.info(
+        "Prompt tokens (%s): estimated %d, actual %d (ratio %.2f; PROMPT_CHARS_PER_TOKEN=%.2f would match)",
+        provider, estimated_tokens, actual_tokens, ratio, PROMPT_CHARS_PER_TOKEN / ratio,
+    )
+    return ratio
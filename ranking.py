@@ -0,0 +1,131 @@
+"""
+Local relevance ranking of scraped articles before the LLM call.
+Every extracted headline is scored against the FOCUS AREAS of SYSTEM_PROMPT with BM25
+(vectorized with NumPy), navigation and call-to-action links are down-weighted, and only
+the global top RANK_TOP_K articles are kept. Each source also gets a 'relevance' score
+(0-1) that prompt_builder uses when splitting the token budget.
+NumPy is optional: without it articles are passed on unranked.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from config import RANKING_ENABLED, RANK_TOP_K
+from prompt_builder import focus_terms, words
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Link text that is site chrome rather than a story
+BOILERPLATE_RE = re.compile(
+    r"\b(subscribe|sign ?up|sign in|log ?in|newsletters?|advertis\w*|sponsor\w*|privacy|terms of|"
+    r"cookies?|careers|contact|about us|read more|learn more|view all|see all|follow us|"
+    r"all rights|download (the|our) app)\b"
+)  # matched against lowercased titles
+BOILERPLATE_PENALTY = 0.1
+# The same link text appearing several times is usually navigation
+REPEATED_PENALTY = 0.3
+# Bonus (up to this much) for headline-length titles, so that among titles without
+# focus terms real headlines still beat short menu entries
+HEADLINE_PRIOR = 0.2
+HEADLINE_WORDS = 8
+
+
+@lru_cache(maxsize=65536)
+def _stem(word: str) -> str:
+    """Strip a plural 's' so 'startups' matches the focus term 'startup'."""
+    return word[:-1] if len(word) > 4 and word.endswith('s') and not word.endswith('ss') else word
+
+
+def _terms(title: str) -> List[str]:
+    return [_stem(w) for w in words(title)]
+
+
+def score_titles(titles: List[List[str]], query: Iterable[str]):
+    """BM25 score of each tokenized title (see _terms) against the query terms.
+
+    Returns a NumPy array with one score per title.
+    """
+    import numpy as np
+
+    vocab = {term: j for j, term in enumerate(sorted({_stem(q) for q in query}))}
+    lengths = np.zeros(len(titles))
+    rows, cols = [], []
+    for i, terms in enumerate(titles):
+        lengths[i] = len(terms)
+        for term in terms:
+            j = vocab.get(term)
+            if j is not None:
+                rows.append(i)
+                cols.append(j)
+    tf = np.zeros((len(titles), len(vocab)))
+    np.add.at(tf, (np.array(rows, dtype=int), np.array(cols, dtype=int)), 1)
+
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(titles) - df + 0.5) / (df + 0.5))
+    avgdl = lengths.mean() or 1.0
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avgdl)
+    bm25 = (tf * (BM25_K1 + 1) / (tf + norm[:, None])) @ idf
+    return bm25 + HEADLINE_PRIOR * np.minimum(lengths, HEADLINE_WORDS) / HEADLINE_WORDS
+
+
+def boilerplate_weights(titles: List[str], terms: List[List[str]]) -> List[float]:
+    """Multiplier per title: low for call-to-action text and repeated link text."""
+    keys = [' '.join(t) for t in terms]
+    counts = Counter(keys)
+    weights = []
+    for title, key in zip(titles, keys):
+        weight = BOILERPLATE_PENALTY if BOILERPLATE_RE.search(title.lower()) else 1.0
+        if key and counts[key] > 1:
+            weight *= REPEATED_PENALTY
+        weights.append(weight)
+    return weights
+
+
+def rank_items(scraped_items: List[Dict], top_k: Optional[int] = None,
+               system_prompt: Optional[str] = None) -> List[Dict]:
+    """Keep the global top-k articles (best first within each source) and set item['relevance'].
+
+    Returns new item dicts whose articles carry their 'score'; sources left without
+    articles keep their page text. Articles are scored against the FOCUS AREAS of
+    `system_prompt` (default SYSTEM_PROMPT).
+    """
+    top_k = RANK_TOP_K if top_k is None else top_k
+    if not RANKING_ENABLED:
+        return scraped_items
+    try:
+        import numpy as np
+    except ImportError:
+        logger.warning("numpy is not installed; articles are passed to the prompt unranked")
+        return scraped_items
+
+    flat = [(i, article) for i, item in enumerate(scraped_items) for article in item.get('articles', [])]
+    if not flat:
+        return scraped_items
+
+    started = time.perf_counter()
+    titles = [article['title'] for _, article in flat]
+    terms = [_terms(title) for title in titles]
+    focus = focus_terms(system_prompt) if system_prompt else focus_terms()
+    scores = score_titles(terms, focus) * np.array(boilerplate_weights(titles, terms))
+    top = np.argsort(-scores, kind='stable')[:top_k]
+
+    kept = [[] for _ in scraped_items]
+    totals = np.zeros(len(scraped_items))
+    for idx in top:
+        i, article = flat[idx]
+        kept[i].append(dict(article, score=round(float(scores[idx]), 3)))
+        totals[i] += scores[idx]
+    best = totals.max()
+    ranked = [
+        dict(item, articles=articles, relevance=round(float(total / best), 3) if best > 0 else 0.0)
+        for item, articles, total in zip(scraped_items, kept, totals)
+    ]
+    logger.info("Ranked %d article(s) in %.1fms; kept the top %d",
+                len(flat), (time.perf_counter() - started) * 1000, len(top))
+    return ranked
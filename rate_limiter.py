@@ -0,0 +1,225 @@
+"""
+Client-side rate limiting and retry scheduling for LLM calls.
+- Token buckets sized to the provider's requests-per-minute and tokens-per-minute quotas.
+- FIFO queueing, so concurrent callers share one quota instead of racing for it.
+- 429/5xx handling: Retry-After headers and Gemini RetryInfo details are honored
+  (a 429 pauses every caller of that provider), otherwise jittered exponential
+  backoff, all bounded by a total deadline.
+- Wait-time metrics per provider.
+"""
+import email.utils
+import logging
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from config import (GEMINI_RPM, GEMINI_TPM, OPENAI_RPM, OPENAI_TPM,
+                    LLM_RETRY_DEADLINE_SEC, LLM_BACKOFF_BASE_SEC, LLM_BACKOFF_MAX_SEC)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = frozenset([429, 500, 502, 503, 504])
+
+
+class RateLimitTimeout(TimeoutError):
+    """The quota would not allow the call before its deadline."""
+
+
+class TokenBucket:
+    """Continuously refilling bucket: `capacity` units, refilled at `rate` units per second."""
+
+    def __init__(self, capacity: float, rate: float, now: Optional[float] = None):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (requests above capacity wait for a full bucket)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Shared RPM/TPM quota for one provider. A limit of 0 means unlimited.
+
+    `clock` gives the monotonic time in seconds (time.monotonic; replaced in tests).
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.clock = clock
+        self._requests = TokenBucket(rpm, rpm / 60.0, clock()) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm, tpm / 60.0, clock()) if tpm > 0 else None
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._blocked_until = 0.0
+        self._metrics = {'calls': 0, 'waited_calls': 0, 'total_wait_sec': 0.0,
+                         'max_wait_sec': 0.0, 'throttled': 0, 'retries': 0}
+
+    def _delay(self, tokens: int, now: float) -> float:
+        delay = self._blocked_until - now
+        if self._requests is not None:
+            delay = max(delay, self._requests.wait_time(1, now))
+        if self._tokens is not None:
+            delay = max(delay, self._tokens.wait_time(tokens, now))
+        return delay
+
+    def acquire(self, tokens: int, deadline: Optional[float] = None) -> float:
+        """Block in FIFO order until one request of `tokens` tokens fits the quota.
+
+        `deadline` is a clock() value; returns the seconds waited.
+        """
+        ticket = object()
+        start = self.clock()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    now = self.clock()
+                    delay = self._delay(tokens, now) if self._queue[0] is ticket else None
+                    if delay is not None and delay <= 0:
+                        break
+                    if deadline is not None and now + (delay or 0) > deadline:
+                        raise RateLimitTimeout(f"{self.name}: quota would not allow the call before its deadline")
+                    timeout = delay
+                    if deadline is not None:
+                        timeout = min(timeout, deadline - now) if timeout is not None else deadline - now
+                    self._cond.wait(timeout)
+                if self._requests is not None:
+                    self._requests.take(1)
+                if self._tokens is not None:
+                    self._tokens.take(tokens)
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+            waited = self.clock() - start
+            self._metrics['calls'] += 1
+            if waited > 0.001:
+                self._metrics['waited_calls'] += 1
+                self._metrics['total_wait_sec'] += waited
+                self._metrics['max_wait_sec'] = max(self._metrics['max_wait_sec'], waited)
+        if waited > 1:
+            logger.info("Rate limiter %s: waited %.1fs for quota", self.name, waited)
+        return waited
+
+    def block_for(self, seconds: float) -> None:
+        """Pause every caller of this provider (e.g. after a 429 with Retry-After)."""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, self.clock() + seconds)
+            self._metrics['throttled'] += 1
+            self._cond.notify_all()
+
+    def note_retry(self) -> None:
+        with self._cond:
+            self._metrics['retries'] += 1
+
+    def metrics(self) -> Dict[str, float]:
+        with self._cond:
+            return dict(self._metrics)
+
+
+_limiters = {
+    'gemini': RateLimiter('gemini', GEMINI_RPM, GEMINI_TPM),
+    'openai': RateLimiter('openai', OPENAI_RPM, OPENAI_TPM),
+}
+
+
+def get_limiter(name: str) -> RateLimiter:
+    return _limiters[name]
+
+
+def log_metrics() -> None:
+    for name, limiter in _limiters.items():
+        m = limiter.metrics()
+        if m['calls']:
+            logger.info("Rate limiter %s: %d call(s), %d waited (total %.1fs, max %.1fs), %d throttled, %d retried",
+                        name, m['calls'], m['waited_calls'], m['total_wait_sec'], m['max_wait_sec'],
+                        m['throttled'], m['retries'])
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status of a requests HTTPError or an OpenAI APIStatusError."""
+    code = getattr(exc, 'status_code', None)
+    if code is None:
+        response = getattr(exc, 'response', None)
+        code = getattr(response, 'status_code', None)
+    return code
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Protobuf Duration string ("12s", "1.5s") in seconds."""
+    try:
+        return float(value.rstrip('s'))
+    except (AttributeError, ValueError):
+        return None
+
+
+def retry_after_seconds(exc: BaseException, now: Optional[datetime] = None) -> Optional[float]:
+    """Delay requested by the server: Retry-After header (seconds or an HTTP date, compared
+    with `now`), else Gemini's RetryInfo detail."""
+    response = getattr(exc, 'response', None)
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After') if getattr(response, 'headers', None) is not None else None
+    if value:
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)  # "-0000": UTC with no source zone
+            return max(0.0, (when - (now or datetime.now(timezone.utc))).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    try:
+        details = response.json().get('error', {}).get('details', [])
+    except Exception:
+        return None
+    for detail in details:
+        if str(detail.get('@type', '')).endswith('google.rpc.RetryInfo'):
+            return _parse_duration(detail.get('retryDelay'))
+    return None
+
+
+def call_with_limits(limiter: RateLimiter, fn: Callable, tokens: int,
+                     deadline_sec: float = LLM_RETRY_DEADLINE_SEC):
+    """Run `fn` within the provider quota, retrying 429/5xx until `deadline_sec` passes."""
+    deadline = limiter.clock() + deadline_sec
+    attempt = 0
+    while True:
+        limiter.acquire(tokens, deadline)
+        try:
+            return fn()
+        except Exception as e:
+            status = status_code(e)
+            if status not in RETRYABLE_STATUS:
+                raise
+            attempt += 1
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = min(LLM_BACKOFF_MAX_SEC, LLM_BACKOFF_BASE_SEC * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.5)
+            if limiter.clock() + delay > deadline:
+                logger.warning("%s: HTTP %s, retry in %.1fs would pass the %gs deadline; giving up",
+                               limiter.name, status, delay, deadline_sec)
+                raise
+            logger.warning("%s: HTTP %s, retrying in %.1fs (attempt %d)", limiter.name, status, delay, attempt)
+            limiter.note_retry()
+            if status == 429:
+                limiter.block_for(delay)  # every queued caller waits, not just this one
+            else:
+                time.sleep(delay)
@@ -1,63 +1,145 @@
-import schedule
-import time
-import logging
-from datetime import datetime, timedelta
+"""
+Newsletter scheduling and last-run tracking.
+The next send time is computed from the last send persisted in last_run.json: the day
+SCHEDULE_INTERVAL_DAYS later at SCHEDULE_SEND_TIME, or right away if that was missed while
+the scheduler was down. Each run starts SCHEDULE_LEAD_MINUTES before the send time in a
+child process (`python main.py --send-at <time>`) that scrapes and generates, waits for the
+send time and sends, so the scheduler itself stays small between runs.
+"""
 import json
+import logging
 import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 LAST_RUN_FILE = 'last_run.json'
+# Long sleeps are split so a changed clock or a suspended machine is noticed within this
+MAX_SLEEP_SEC = 300
 
-def get_days_since_last_run() -> int:
-    """Get number of days since last newsletter run."""
-    if os.path.exists(LAST_RUN_FILE):
+def get_last_run(path: str = LAST_RUN_FILE) -> Optional[datetime]:
+    """Get the timestamp of the last newsletter run, or None if there is none."""
+    if os.path.exists(path):
         try:
-            with open(LAST_RUN_FILE, 'r') as f:
+            with open(path, 'r') as f:
                 data = json.load(f)
-                last_run = datetime.fromisoformat(data['last_run'])
-                days = (datetime.now() - last_run).days
-                return max(days, 5)  # Minimum 5 days
+                return datetime.fromisoformat(data['last_run'])
         except Exception as e:
             logger.warning(f"Error reading last run file: {e}")
-            return 5
-    return 5
-
-def update_last_run():
-    """Update the last run timestamp."""
-    data = {
-        'last_run': datetime.now().isoformat()
-    }
-    with open(LAST_RUN_FILE, 'w') as f:
-        json.dump(data, f)
-    logger.info(f"Last run updated to {datetime.now().isoformat()}")
-
-def run_newsletter():
-    """Main function to run the newsletter generation and sending."""
-    from main import generate_and_send_newsletter
-    
+    return None
+
+def get_days_since_last_run(path: str = LAST_RUN_FILE) -> int:
+    """Get number of days since last newsletter run (at least the schedule interval)."""
+    from config import SCHEDULE_INTERVAL_DAYS
+
+    last_run = get_last_run(path)
+    if last_run is None:
+        return SCHEDULE_INTERVAL_DAYS
+    days = (datetime.now() - last_run).days
+    return max(days, SCHEDULE_INTERVAL_DAYS)
+
+def update_last_run(when: Optional[datetime] = None, path: str = LAST_RUN_FILE):
+    """Update the last run timestamp (written atomically: the schedule is computed from it)."""
+    when = when or datetime.now()
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'last_run': when.isoformat()}, f)
+    os.replace(tmp, path)
+    logger.info(f"Last run updated to {when.isoformat()}")
+
+def _send_time_of_day() -> Tuple[int, int]:
+    from config import SCHEDULE_SEND_TIME
+
     try:
-        logger.info("Starting newsletter generation...")
-        generate_and_send_newsletter()
-        update_last_run()
-        logger.info("Newsletter process completed successfully")
-    except Exception as e:
-        logger.error(f"Error in newsletter generation: {str(e)}")
-        raise
-
-def start_scheduler():
-    """Start the scheduler to run newsletter every 5 days."""
-    # Schedule to run every 5 days
-    schedule.every(5).days.do(run_newsletter)
-    
-    logger.info("Scheduler started. Newsletter will run every 5 days.")
-    logger.info("First run will be in 5 days, or run manually with: python main.py")
-    
-    # Run continuously
+        hour, minute = (int(part) for part in SCHEDULE_SEND_TIME.split(':'))
+        if 0 <= hour < 24 and 0 <= minute < 60:
+            return hour, minute
+    except ValueError:
+        pass
+    raise ValueError(f"SCHEDULE_SEND_TIME must be HH:MM (24-hour), got {SCHEDULE_SEND_TIME!r}")
+
+def next_send_time(last_run: Optional[datetime], now: Optional[datetime] = None) -> datetime:
+    """When the next issue should go out.
+
+    SCHEDULE_INTERVAL_DAYS after the day of the last send, at SCHEDULE_SEND_TIME; with no
+    last run, the next SCHEDULE_SEND_TIME. A send time already past (missed during downtime)
+    becomes `now`: one catch-up issue, then the schedule continues from it.
+    """
+    from config import SCHEDULE_INTERVAL_DAYS
+
+    now = now or datetime.now()
+    hour, minute = _send_time_of_day()
+    if last_run is None:
+        send_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if send_at <= now:
+            send_at += timedelta(days=1)
+        return send_at
+    # Anchored to the day, not the exact time, so a late send does not push later issues back
+    send_at = datetime.combine(last_run.date() + timedelta(days=SCHEDULE_INTERVAL_DAYS),
+                               datetime.min.time()).replace(hour=hour, minute=minute)
+    return max(send_at, now)
+
+def plan_run(last_run: Optional[datetime], now: Optional[datetime] = None,
+             retry_at: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """(when to start preparing, when to send) for the next issue.
+
+    Preparation starts SCHEDULE_LEAD_MINUTES before the send time (already past if the send
+    time is closer than that, i.e. right away). After a failed run neither is before `retry_at`.
+    """
+    from config import SCHEDULE_LEAD_MINUTES
+
+    send_at = next_send_time(last_run, now)
+    start_at = send_at - timedelta(minutes=SCHEDULE_LEAD_MINUTES)
+    if retry_at is not None:
+        start_at = max(start_at, retry_at)
+        send_at = max(send_at, start_at)
+    return start_at, send_at
+
+def sleep_until(when: datetime):
+    """Sleep until the wall-clock time `when` (returns at once if it has passed)."""
     while True:
-        schedule.run_pending()
-        time.sleep(3600)  # Check every hour
+        remaining = (when - datetime.now()).total_seconds()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, MAX_SLEEP_SEC))
 
+def run_newsletter(send_at: Optional[datetime] = None, profiles: bool = False) -> bool:
+    """Run the pipeline in a child process that sends at `send_at` (now if None).
 
+    With `profiles` the child runs every newsletter of PROFILES_FILE (see profiles).
+    Returns whether it succeeded; on success the send is recorded in last_run.json.
+    """
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')]
+    if profiles:
+        command.append('--profiles')
+    if send_at is not None:
+        command += ['--send-at', send_at.isoformat(timespec='seconds')]
+    logger.info("Starting newsletter generation...")
+    result = subprocess.run(command)
+    if result.returncode != 0:
+        logger.error(f"Newsletter run failed (exit code {result.returncode})")
+        return False
+    update_last_run()
+    logger.info("Newsletter process completed successfully")
+    return True
 
+def start_scheduler(profiles: bool = False):
+    """Send the newsletter (every profile's with `profiles`) every SCHEDULE_INTERVAL_DAYS at
+    SCHEDULE_SEND_TIME, until stopped."""
+    from config import SCHEDULE_INTERVAL_DAYS, SCHEDULE_RETRY_MINUTES
+
+    logger.info(f"Scheduler started. Newsletter will go out every {SCHEDULE_INTERVAL_DAYS} days.")
+    retry_at: Optional[datetime] = None
+    while True:
+        start_at, send_at = plan_run(get_last_run(), retry_at=retry_at)
+        logger.info(f"Next newsletter at {send_at:%Y-%m-%d %H:%M} (preparation starts {start_at:%Y-%m-%d %H:%M})")
+        sleep_until(start_at)
+        if run_newsletter(send_at, profiles):
+            retry_at = None
+        else:
+            retry_at = datetime.now() + timedelta(minutes=SCHEDULE_RETRY_MINUTES)
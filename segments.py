@@ -0,0 +1,106 @@
+"""
+Recipient segments for personalized issues.
+Recipients carry interest tags ("reader@example.com:fintech|ai" in RECIPIENT_EMAILS or
+RECIPIENTS_FILE). Everyone with the same set of tags forms one segment, and the issue is
+rendered once per segment: stories matching the segment's tags (SEGMENT_TAG_KEYWORDS) come
+first, and with SEGMENT_FILTER the others are dropped down to SEGMENT_MIN_STORIES.
+Per-recipient fields are then filled into the rendered segment by slot substitution
+(see smtp_delivery.message_for), so rendering cost grows with the number of segments,
+not with the number of recipients.
+"""
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import (RECIPIENT_EMAILS, RECIPIENT_TAGS, RECIPIENTS_FILE, SEGMENT_FILTER,
+                    SEGMENT_MIN_STORIES, SEGMENT_TAG_KEYWORDS)
+from newsletter_markdown import Section, plain_text
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+\-]*")
+# A keyword found in the story title counts this many times
+TITLE_WEIGHT = 2
+
+
+def parse_entry(entry: str) -> Tuple[str, Tuple[str, ...]]:
+    """'reader@example.com:fintech|AI' -> ('reader@example.com', ('ai', 'fintech'))."""
+    email, _, tags = entry.partition(':')
+    return email.strip(), segment_key(tags.split('|'))
+
+
+def segment_key(tags: Iterable[str]) -> Tuple[str, ...]:
+    """Canonical segment for a set of tags (lowercased, sorted, no duplicates)."""
+    return tuple(sorted({t.strip().lower() for t in tags if t.strip()}))
+
+
+def load_recipients(path: Optional[str] = None,
+                    entries: Optional[Iterable[str]] = None) -> List[Tuple[str, Tuple[str, ...]]]:
+    """(email, segment) for every recipient, from RECIPIENTS_FILE if set, else RECIPIENT_EMAILS.
+
+    A file at `path` or "email[:tag|tag]" `entries` (a profile's, see profiles) replace both.
+    Duplicate addresses keep their first entry.
+    """
+    path = path or (RECIPIENTS_FILE if entries is None else None)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = [parse_entry(line) for line in f if line.strip() and not line.lstrip().startswith('#')]
+    elif entries is not None:
+        entries = [parse_entry(entry) for entry in entries]
+    else:
+        entries = [(email, segment_key(RECIPIENT_TAGS.get(email, ()))) for email in RECIPIENT_EMAILS]
+    recipients = {}
+    for email, segment in entries:
+        if email:
+            recipients.setdefault(email, segment)
+    return list(recipients.items())
+
+
+def group_by_segment(recipients: Iterable[Tuple[str, Tuple[str, ...]]]) -> Dict[Tuple[str, ...], List[str]]:
+    """Recipient emails per segment, in first-seen order."""
+    segments: Dict[Tuple[str, ...], List[str]] = {}
+    for email, segment in recipients:
+        segments.setdefault(segment, []).append(email)
+    return segments
+
+
+def _keywords(segment: Tuple[str, ...]) -> Tuple[frozenset, List[str]]:
+    """Single-word keywords and multi-word phrases for the segment's tags."""
+    words, phrases = set(), []
+    for tag in segment:
+        for keyword in SEGMENT_TAG_KEYWORDS.get(tag, [tag]):
+            keyword = keyword.lower()
+            if ' ' in keyword:
+                phrases.append(keyword)
+            else:
+                words.add(keyword)
+    return frozenset(words), phrases
+
+
+def _matches(text: str, words: frozenset, phrases: List[str]) -> int:
+    text = text.lower()
+    return len(words.intersection(_TOKEN_RE.findall(text))) + sum(1 for p in phrases if p in text)
+
+
+def story_scores(sections: List[Section], segment: Tuple[str, ...]) -> List[int]:
+    """How strongly each parsed story section (see newsletter_markdown.parse) matches the tags."""
+    words, phrases = _keywords(segment)
+    scores = []
+    for section in sections:
+        body = ' '.join([plain_text(p) for p in section.paragraphs] + [plain_text(section.insight), plain_text(section.action)])
+        scores.append(TITLE_WEIGHT * _matches(plain_text(section.title), words, phrases) + _matches(body, words, phrases))
+    return scores
+
+
+def personalize(sections: List[Section], segment: Tuple[str, ...]) -> List[Section]:
+    """The segment's story order: matching stories first (best match first, ties keep the
+    original order), then the rest unless SEGMENT_FILTER drops them."""
+    if not segment or not sections:
+        return sections
+    scores = story_scores(sections, segment)
+    order = sorted(range(len(sections)), key=lambda i: -scores[i])
+    if SEGMENT_FILTER:
+        matched = sum(1 for s in scores if s > 0)
+        order = order[:max(matched, min(SEGMENT_MIN_STORIES, len(order)))]
+    return [sections[i] for i in order]
@@ -0,0 +1,376 @@
+"""
+Parallel SMTP delivery with a resumable journal.
+- SMTP_CONCURRENCY sessions send the pre-rendered message at the same time, each
+  reconnecting after SMTP_MAX_MESSAGES_PER_CONNECTION messages (providers cap them).
+- A shared FIFO rate limiter keeps total throughput under SMTP_MAX_PER_MINUTE.
+- Transient failures (4xx replies, dropped connections) reconnect and retry; permanent
+  ones (5xx) fail that recipient only. Authentication errors stop the whole delivery.
+- Every delivered recipient is appended to DELIVERY_JOURNAL_DIR/<issue_id>.log, so a rerun
+  for the same issue skips them.
+- WarmConnections opens and authenticates sessions ahead of delivery (while the model is
+  still writing, see pipeline) and hands them to deliver() through connect_fn; with
+  release_fn they come back after a delivery, so several deliveries share them (see profiles).
+"""
+import html
+import logging
+import os
+import queue
+import re
+import smtplib
+import threading
+import time
+from email import policy
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Set, Union
+
+from config import (EMAIL_ADDRESS, EMAIL_PASSWORD, SMTP_SERVER, SMTP_PORT, SMTP_CONCURRENCY,
+                    SMTP_MAX_MESSAGES_PER_CONNECTION, SMTP_MAX_PER_MINUTE, SMTP_SEND_RETRIES,
+                    SMTP_TIMEOUT_SEC, DELIVERY_JOURNAL_DIR)
+import metrics
+from rate_limiter import RateLimiter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Progress is logged every this many delivered messages
+PROGRESS_EVERY = 500
+RETRY_BACKOFF_MAX_SEC = 30
+
+
+# Per-recipient fields left in the rendered message (see email_sender.render_message) and
+# filled in by message_for. Both sit on short lines of their own, so quoted-printable
+# encoding never splits them.
+RECIPIENT_SLOT = '{{recipient}}'
+RECIPIENT_HTML_SLOT = '{{recipient_html}}'
+_SLOT_RE = re.compile(f"({re.escape(RECIPIENT_SLOT)}|{re.escape(RECIPIENT_HTML_SLOT)})".encode())
+
+
+def _quoted_printable(value: str) -> bytes:
+    """`value` encoded like the quoted-printable body around it."""
+    if value.isascii() and value.isprintable() and ' ' not in value and '=' not in value:
+        return value.encode('ascii')
+    return ''.join(c if '!' <= c <= '~' and c != '=' else ''.join(f"={b:02X}" for b in c.encode('utf-8'))
+                   for c in value).encode('ascii')
+
+
+@lru_cache(maxsize=64)
+def _split_slots(rendered: bytes):
+    """The rendered message split at its recipient slots, once per rendered segment."""
+    # [To header] + literals at odd indices, slots at even
+    pieces = [b''] + _SLOT_RE.split(rendered)
+    return pieces, [(i, pieces[i] == RECIPIENT_HTML_SLOT.encode()) for i in range(2, len(pieces), 2)]
+
+
+def message_for(recipient: str, rendered: bytes) -> bytes:
+    """The rendered message with this recipient's To header prepended and their fields filled in.
+
+    A non-ASCII address gets a UTF-8 To header (RFC 6532); it is sent with SMTPUTF8 (see _Session).
+    """
+    pieces, slots = _split_slots(rendered)
+    pieces = pieces[:]
+    pieces[0] = (policy.SMTP if recipient.isascii() else policy.SMTPUTF8).fold_binary('To', recipient)
+    if slots:
+        values = (_quoted_printable(recipient), _quoted_printable(html.escape(recipient)))
+        for i, is_html in slots:
+            pieces[i] = values[is_html]
+    return b''.join(pieces)
+
+
+class DeliveryError(RuntimeError):
+    """Some recipients could not be delivered to; a rerun of the same issue retries only them."""
+
+    def __init__(self, message: str, report: Dict):
+        super().__init__(message)
+        self.report = report
+
+
+def issue_id_for(subject: str) -> str:
+    """Journal name for an issue: the subject as a filesystem-safe slug."""
+    return re.sub(r'[^a-z0-9]+', '-', subject.lower()).strip('-') or 'issue'
+
+
+class DeliveryJournal:
+    """Append-only log of recipients an issue was delivered to (one address per line)."""
+
+    def __init__(self, issue_id: str, directory: str = DELIVERY_JOURNAL_DIR):
+        self.path = os.path.join(directory, f"{issue_id}.log")
+        self._lock = threading.Lock()
+        self._file = None
+
+    def delivered(self) -> Set[str]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def record(self, recipient: str) -> None:
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(recipient + '\n')
+            # flushed per line: a crash loses at most the message being sent
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+def connect() -> smtplib.SMTP:
+    """Authenticated STARTTLS session to SMTP_SERVER."""
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT_SEC)
+    try:
+        server.starttls()
+        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+class WarmConnections:
+    """SMTP sessions opened in the background before there is anything to send.
+
+    start() opens `count` sessions; connect() (pass it to deliver() as connect_fn) waits for
+    those still opening, hands them out after a NOOP shows they are alive and falls back to
+    new connections. release() (deliver()'s release_fn) takes a session back for the next
+    delivery. close() quits the sessions that are not in use.
+    """
+
+    def __init__(self, count: int = SMTP_CONCURRENCY, connect_fn: Callable[[], smtplib.SMTP] = connect):
+        self._count = max(1, count)
+        self._connect = connect_fn
+        self._ready: queue.Queue = queue.Queue()
+        self._threads: List[threading.Thread] = []
+
+    def _open(self) -> None:
+        started = time.monotonic()
+        try:
+            server = self._connect()
+        except Exception as e:
+            # deliver() connects again and reports the error if it persists
+            logger.warning("Could not open an SMTP session ahead of delivery: %s", e)
+            return
+        metrics.observe('smtp_warm_connect_seconds', time.monotonic() - started)
+        self._ready.put(server)
+
+    def start(self) -> None:
+        self._threads = [threading.Thread(target=self._open, name=f"smtp-warm-{n}", daemon=True)
+                         for n in range(self._count)]
+        for thread in self._threads:
+            thread.start()
+
+    def _join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def connect(self) -> smtplib.SMTP:
+        self._join()
+        while True:
+            try:
+                server = self._ready.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            # timed out while idle
+            server.close()
+
+    def release(self, server: smtplib.SMTP) -> None:
+        self._ready.put(server)
+
+    def close(self) -> None:
+        self._join()
+        while True:
+            try:
+                server = self._ready.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+
+def _is_transient(exc: Exception) -> bool:
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    # SMTPServerDisconnected, timeouts and other socket errors
+    return isinstance(exc, (smtplib.SMTPException, OSError))
+
+
+class _Session:
+    """One SMTP connection, opened lazily and recycled after `max_messages` messages."""
+
+    def __init__(self, connect_fn: Callable[[], smtplib.SMTP], max_messages: int,
+                 release_fn: Optional[Callable[[smtplib.SMTP], None]] = None):
+        self._connect = connect_fn
+        self._release = release_fn
+        self._max_messages = max_messages
+        self._server = None
+        self._sent = 0
+        self.connections = 0
+
+    def send(self, sender: str, recipient: str, message: bytes) -> None:
+        if self._server is not None and self._max_messages > 0 and self._sent >= self._max_messages:
+            self._quit()
+        if self._server is None:
+            self._server = self._connect()
+            # A shared connection (release_fn) brings the count of messages it already sent
+            self._sent = getattr(self._server, 'messages_sent', 0)
+            self.connections += 1
+        self._sent += 1
+        self._server.messages_sent = self._sent
+        # smtplib only sends a non-ASCII address (and its UTF-8 header) with SMTPUTF8
+        self._server.sendmail(sender, [recipient], message,
+                              mail_options=() if recipient.isascii() else ('SMTPUTF8',))
+
+    def reset(self) -> None:
+        """Drop the connection after an error; the next send reconnects."""
+        if self._server is not None:
+            try:
+                self._server.close()
+            finally:
+                self._server = None
+
+    def _quit(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                self._server.close()
+            self._server = None
+
+    def close(self) -> None:
+        """Hand the connection back (release_fn) or quit it."""
+        if self._server is not None and self._release is not None:
+            server, self._server = self._server, None
+            self._release(server)
+        else:
+            self._quit()
+
+
+def deliver(rendered: Union[bytes, Dict[str, bytes]], recipients: Iterable[str], issue_id: str,
+            connect_fn: Callable[[], smtplib.SMTP] = connect,
+            concurrency: int = SMTP_CONCURRENCY,
+            max_per_minute: int = SMTP_MAX_PER_MINUTE,
+            max_messages_per_connection: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+            journal_dir: str = DELIVERY_JOURNAL_DIR,
+            release_fn: Optional[Callable[[smtplib.SMTP], None]] = None) -> Dict:
+    """Send the rendered message (see email_sender.render_message), or each recipient's
+    entry of a {recipient: rendered} map, to every recipient not already in the issue's journal.
+    Sessions come from `connect_fn` and, with `release_fn`, are handed back to it when done.
+
+    Returns {'sent', 'skipped', 'failed': {recipient: error}, 'connections', 'seconds'};
+    raises DeliveryError if any recipient failed.
+    """
+    recipients = list(dict.fromkeys(recipients))
+    journal = DeliveryJournal(issue_id, journal_dir)
+    done = journal.delivered()
+    pending = [r for r in recipients if r not in done]
+    report = {'sent': 0, 'skipped': len(recipients) - len(pending), 'failed': {},
+              'connections': 0, 'seconds': 0.0}
+    if report['skipped']:
+        logger.info("Delivery journal %s: %d recipient(s) already delivered, skipping them",
+                    journal.path, report['skipped'])
+    if not pending:
+        return report
+
+    work = queue.Queue()
+    for recipient in pending:
+        work.put(recipient)
+    limiter = RateLimiter('smtp', max_per_minute, 0)
+    lock = threading.Lock()
+    stop = threading.Event()
+    fatal: List[Exception] = []
+    started = time.monotonic()
+
+    def send_one(session: _Session, recipient: str) -> None:
+        message = message_for(recipient, rendered[recipient] if isinstance(rendered, dict) else rendered)
+        for attempt in range(SMTP_SEND_RETRIES + 1):
+            limiter.acquire(1)
+            sending = time.monotonic()
+            try:
+                session.send(EMAIL_ADDRESS, recipient, message)
+                metrics.observe('smtp_send_seconds', time.monotonic() - sending)
+                return
+            except smtplib.SMTPAuthenticationError:
+                raise
+            except Exception as e:
+                session.reset()
+                if attempt == SMTP_SEND_RETRIES or not _is_transient(e):
+                    raise
+                delay = min(RETRY_BACKOFF_MAX_SEC, 2 ** attempt)
+                logger.warning("Send to %s failed (%s); retrying in %ds", recipient, e, delay)
+                limiter.note_retry()
+                time.sleep(delay)
+
+    def worker() -> None:
+        session = _Session(connect_fn, max_messages_per_connection, release_fn)
+        try:
+            while not stop.is_set():
+                try:
+                    recipient = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    send_one(session, recipient)
+                except smtplib.SMTPAuthenticationError as e:
+                    fatal.append(e)
+                    stop.set()
+                    return
+                except Exception as e:
+                    logger.error("Could not deliver to %s: %s", recipient, e)
+                    with lock:
+                        report['failed'][recipient] = str(e)
+                    continue
+                try:
+                    journal.record(recipient)
+                except OSError as e:
+                    # without the journal a rerun would send duplicates: stop here
+                    fatal.append(e)
+                    stop.set()
+                    return
+                with lock:
+                    report['sent'] += 1
+                    if report['sent'] % PROGRESS_EVERY == 0:
+                        logger.info("Delivered %d/%d", report['sent'], len(pending))
+        finally:
+            session.close()
+            with lock:
+                report['connections'] += session.connections
+
+    threads = [threading.Thread(target=worker, name=f"smtp-{n}", daemon=True)
+               for n in range(max(1, min(concurrency, len(pending))))]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        journal.close()
+    report['seconds'] = round(time.monotonic() - started, 3)
+    for outcome in ('sent', 'skipped'):
+        metrics.observe('smtp_messages', report[outcome], outcome=outcome)
+    metrics.observe('smtp_messages', len(report['failed']), outcome='failed')
+    metrics.observe('smtp_connections', report['connections'])
+
+    if fatal:
+        raise fatal[0]
+    logger.info("Delivered %d message(s) over %d connection(s) with %d session(s) in %.1fs; "
+                "%d skipped, %d failed", report['sent'], report['connections'], len(threads),
+                report['seconds'], report['skipped'], len(report['failed']))
+    if report['failed']:
+        raise DeliveryError(f"{len(report['failed'])} of {len(recipients)} recipient(s) failed; "
+                            f"rerun to retry them (journal: {journal.path})", report)
+    return report
@@ -0,0 +1,105 @@
+"""
+Tests for clustering.py: the LSH banding chosen for the similarity threshold, and that
+known near-duplicate stories from different sources are clustered while unrelated ones,
+and repeats within one source, are not.
+
+    python -m pytest test_clustering.py
+"""
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import clustering
+from clustering import LSH_MIN_RECALL, NUM_PERM, cluster_articles, cluster_stories, lsh_shape
+
+VOCABULARY = [f"w{i}" for i in range(5000)]
+
+
+def candidate_probability(similarity, bands, rows):
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+@pytest.mark.parametrize('threshold', [0.2, 0.3, 0.4, 0.5, 0.7])
+def test_lsh_shape_keeps_recall_at_the_threshold(threshold):
+    bands, rows = lsh_shape(threshold)
+    assert bands * rows <= NUM_PERM
+    assert candidate_probability(threshold, bands, rows) >= LSH_MIN_RECALL
+    # One more row per band would drop below it: the fewest candidates for that recall
+    assert candidate_probability(threshold, NUM_PERM // (rows + 1), rows + 1) < LSH_MIN_RECALL
+
+
+def test_default_threshold_uses_more_than_two_rows_per_band():
+    bands, rows = lsh_shape(0.3)
+    assert rows >= 3
+    assert candidate_probability(0.1, bands, rows) < 0.1
+
+
+def corpus(seed=0, sources=6, per_source=60, near_duplicates=20):
+    """Unrelated articles, plus `near_duplicates` stories retold by a second source
+    (about 0.5 Jaccard-similar to the original). Returns token sets, sources, planted pairs."""
+    rng = random.Random(seed)
+    token_sets, groups = [], []
+    for s in range(sources):
+        for _ in range(per_source):
+            token_sets.append(rng.sample(VOCABULARY, 30))
+            groups.append(f"source{s}")
+    pairs = []
+    for original in rng.sample(range(len(token_sets)), near_duplicates):
+        kept = rng.sample(token_sets[original], 21)
+        token_sets.append(kept + rng.sample(VOCABULARY, 9))
+        groups.append(f"source{(int(groups[original][6:]) + 1) % sources}")
+        pairs.append((original, len(token_sets) - 1))
+    return token_sets, groups, pairs
+
+
+def test_known_near_duplicates_are_clustered():
+    token_sets, groups, pairs = corpus()
+    clusters = cluster_articles(token_sets, groups, threshold=0.3)
+    cluster_of = {i: n for n, members in enumerate(clusters) for i in members}
+    for original, retold in pairs:
+        assert cluster_of[original] == cluster_of[retold]
+    # Nothing else is merged
+    assert sorted(sorted(c) for c in clusters if len(c) > 1) == sorted(sorted(p) for p in pairs)
+
+
+def test_unrelated_articles_are_rarely_candidates():
+    token_sets, groups, _ = corpus(near_duplicates=0)
+    signatures = clustering.minhash_signatures(token_sets)
+    indices = np.arange(len(token_sets))
+    candidates = clustering._candidate_pairs(signatures, indices, *lsh_shape(0.3))
+    total = len(indices) * (len(indices) - 1) // 2
+    assert len(candidates) < 0.01 * total
+
+
+def test_repeats_within_one_source_are_not_merged():
+    tokens = VOCABULARY[:30]
+    clusters = cluster_articles([tokens, list(tokens), list(tokens)], ['a', 'a', 'b'], threshold=0.3)
+    assert sorted(sorted(c) for c in clusters) == [[0, 2], [1]]
+
+
+def test_cluster_stories_merges_coverage_from_several_sources():
+    def item(url, articles):
+        text = ' '.join(f"{title} {context}" for title, _, context in articles)
+        return {'url': url, 'success': True, 'text': text,
+                'articles': [{'title': title, 'url': link} for title, link, _ in articles]}
+
+    context = ("The regulator said the review covers bundling of cloud licenses with productivity "
+               "software and could lead to fines of up to ten percent of global turnover.")
+    items = [
+        item('https://a.example.com', [
+            ('EU opens antitrust probe into Microsoft cloud licensing', 'https://a.example.com/eu', context),
+            ('Quantum startup raises seed round', 'https://a.example.com/q',
+             'The company builds error-corrected qubits in a former warehouse in Delft.'),
+        ]),
+        item('https://b.example.com', [
+            ('Brussels investigates Microsoft over cloud licensing', 'https://b.example.com/ms', context),
+        ]),
+        {'url': 'https://down.example.com', 'success': False, 'articles': []},
+    ]
+    stories = cluster_stories(items)
+    assert len(stories) == 2
+    assert stories[0]['sources'] == ['https://a.example.com', 'https://b.example.com']
+    assert set(stories[0]['urls']) == {'https://a.example.com/eu', 'https://b.example.com/ms'}
+    assert stories[1]['urls'] == ['https://a.example.com/q']
@@ -0,0 +1,136 @@
+"""
+Tests for dedup.py: canonical URLs (tracking parameters, trailing slashes, `www.`),
+near-duplicate titles, the persistent index of covered stories and the
+DEDUP_TITLE_MAX_DISTANCE setting.
+
+    python -m pytest test_dedup.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from dedup import (DedupIndex, SimHashIndex, canonical_url, dedup_items, record_issue, simhash, title_tokens,
+                   url_hash)
+
+TITLE = ("European regulators open formal antitrust investigation into Microsoft cloud "
+         "licensing practices after complaints from rivals")
+
+
+@pytest.mark.parametrize('url, canonical', [
+    ('https://example.com/story?utm_source=x&utm_medium=email&id=7', 'https://example.com/story?id=7'),
+    ('https://example.com/story?fbclid=abc&gclid=def&ref=hn', 'https://example.com/story'),
+    ('https://example.com/story?UTM_Campaign=x&b=2&a=1', 'https://example.com/story?a=1&b=2'),
+    ('https://example.com/story/', 'https://example.com/story'),
+    ('https://example.com/', 'https://example.com/'),
+    ('https://example.com', 'https://example.com/'),
+    ('HTTPS://Example.COM:443/Story#comments', 'https://example.com/Story'),
+    ('http://example.com:80/story', 'http://example.com/story'),
+    ('http://example.com:8080/story', 'http://example.com:8080/story'),
+    ('  https://www.example.com/story  ', 'https://www.example.com/story'),
+    ('/relative/path#x', '/relative/path'),
+])
+def test_canonical_url(url, canonical):
+    assert canonical_url(url) == canonical
+
+
+def test_url_hash_ignores_scheme_www_and_tracking():
+    key = url_hash('https://example.com/story?id=7')
+    for url in ('http://example.com/story?id=7', 'https://www.example.com/story/?id=7',
+                'https://WWW.example.com/story?utm_source=feed&id=7#top'):
+        assert url_hash(url) == key
+    assert url_hash('https://example.com/story?id=8') != key
+    assert url_hash('https://blog.example.com/story?id=7') != key
+
+
+def test_title_tokens_drop_case_punctuation_and_stopwords():
+    assert title_tokens("What's Next for the AI Boom?") == ["what's", 'next', 'ai', 'boom']
+
+
+@pytest.mark.parametrize('variant', [
+    TITLE.upper() + '!',
+    TITLE + ' today',
+    'Widening: ' + TITLE,
+])
+def test_near_duplicate_titles_match(variant):
+    distance = bin(simhash(title_tokens(TITLE)) ^ simhash(title_tokens(variant))).count('1')
+    assert distance <= 3
+    index = SimHashIndex(max_distance=3)
+    index.add(simhash(title_tokens(TITLE)))
+    assert index.contains_near(simhash(title_tokens(variant)))
+
+
+def test_distinct_titles_do_not_match():
+    index = SimHashIndex(max_distance=3)
+    index.add(simhash(title_tokens(TITLE)))
+    for other in ('Apple reports record quarterly revenue driven by iPhone sales',
+                  'European regulators open formal antitrust investigation into Google ad tech practices'):
+        assert not index.contains_near(simhash(title_tokens(other)))
+
+
+def test_index_max_distance_is_bounded():
+    SimHashIndex(max_distance=0)
+    for bad in (4, -1):
+        with pytest.raises(ValueError, match='0-3'):
+            SimHashIndex(max_distance=bad)
+
+
+def test_dedup_items_across_sources():
+    items = [
+        {'source': 'a', 'articles': [
+            {'title': TITLE, 'url': 'https://news.example.com/eu-microsoft?utm_source=rss'},
+            {'title': 'Short title', 'url': 'https://a.example.com/1'},
+        ]},
+        {'source': 'b', 'articles': [
+            # Same page, different link
+            {'title': 'EU probes Microsoft', 'url': 'https://www.news.example.com/eu-microsoft/'},
+            # Same story, another site
+            {'title': TITLE + ' today', 'url': 'https://b.example.com/2'},
+            # Short titles only match exactly
+            {'title': 'Short Title!', 'url': 'https://b.example.com/3'},
+            {'title': 'Short title again', 'url': 'https://b.example.com/4'},
+        ]},
+    ]
+    first, second = dedup_items(items)
+    assert [a['url'] for a in first['articles']] == ['https://news.example.com/eu-microsoft', 'https://a.example.com/1']
+    assert [a['url'] for a in second['articles']] == ['https://b.example.com/4']
+    # The input is not modified
+    assert len(items[1]['articles']) == 4
+
+
+def test_covered_stories_are_skipped_in_later_issues(tmp_path):
+    path = str(tmp_path / 'dedup_index.json')
+    items = [{'source': 'a', 'articles': [
+        {'title': TITLE, 'url': 'https://news.example.com/eu-microsoft'},
+        {'title': 'Quantum startup raises seed round for error correction', 'url': 'https://a.example.com/q'},
+    ]}]
+    newsletter = "**EU Opens Antitrust Investigation Into Microsoft Cloud Licensing**\n\nRegulators acted " \
+                 "after complaints from rivals about its practices."
+    assert record_issue(items, newsletter, path=path) == 1
+
+    history = DedupIndex.load(path)
+    later = [{'source': 'b', 'articles': [
+        {'title': 'Widening: ' + TITLE, 'url': 'https://c.example.com/eu'},
+        {'title': 'Quantum startup raises seed round for error correction', 'url': 'https://a.example.com/q'},
+    ]}]
+    assert [a['url'] for a in dedup_items(later, history)[0]['articles']] == ['https://a.example.com/q']
+
+
+def test_index_entries_expire(tmp_path):
+    path = str(tmp_path / 'dedup_index.json')
+    index = DedupIndex(path)
+    index.add({'title': TITLE, 'url': 'https://news.example.com/eu-microsoft'}, ts=time.time() - 365 * 86400)
+    index.save()
+    assert DedupIndex.load(path).entries == []
+
+
+@pytest.mark.parametrize('value, ok', [('0', True), ('3', True), ('4', False), ('-1', False)])
+def test_title_max_distance_setting_is_validated(value, ok):
+    env = {**os.environ, 'DEDUP_TITLE_MAX_DISTANCE': value}
+    result = subprocess.run([sys.executable, '-c', 'import config'], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=60)
+    assert (result.returncode == 0) == ok
+    if not ok:
+        assert 'DEDUP_TITLE_MAX_DISTANCE must be 0-3' in result.stderr
@@ -0,0 +1,79 @@
+"""
+Tests for extractor.py: both backends give the same result whether a page is fed
+whole or in chunks split anywhere (mid-word, mid-tag, mid-headline).
+
+    python -m pytest test_extractor.py
+"""
+import pytest
+
+import extractor
+
+PAGE = """<html><head><title>Daily tech</title><style>.x { color: red }</style></head>
+<body><nav>Home | About</nav>
+<h1>Artificial intelligence weekly</h1>
+<p>Startups raised   record rounds in
+artificial intelligence this week.<!-- ad --> More below.</p>
+<ul>
+  <li><a href="/story/1">First story headline here</a></li>
+  <li><a href="https://example.com/2">Second <b>story</b> with bold text</a></li>
+  <li><a href="/short">Short</a></li>
+</ul>
+<script>var artificial = 1;</script>
+<footer>Copyright</footer></body></html>"""
+
+BACKENDS = sorted(extractor.BACKENDS)
+
+
+def feed_in_chunks(backend: str, html: str, size: int, **budgets) -> dict:
+    parser = extractor.make_extractor('https://example.com/news', backend, **budgets)
+    for i in range(0, len(html), size):
+        parser.feed(html[i:i + size])
+    parser.close()
+    return parser.result()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_extracts_text_and_articles(backend):
+    result = extractor.extract(PAGE, 'https://example.com/news', backend)
+    assert 'Artificial intelligence weekly' in result['text']
+    assert 'Startups raised record rounds in artificial intelligence this week.' in result['text']
+    assert 'Home' not in result['text'] and 'var artificial' not in result['text']
+    assert 'Copyright' not in result['text']
+    assert result['articles'] == [
+        {'title': 'First story headline here', 'url': 'https://example.com/story/1'},
+        {'title': 'Second story with bold text', 'url': 'https://example.com/2'},
+    ]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('size', [1, 3, 7, 64, 16 * 1024])
+def test_chunked_feed_matches_whole_page(backend, size):
+    whole = extractor.extract(PAGE, 'https://example.com/news', backend)
+    assert feed_in_chunks(backend, PAGE, size) == whole
+
+
+@pytest.mark.parametrize('size', [1, 7])
+def test_chunked_feed_matches_whole_page_with_budgets(size):
+    budgets = {'max_text_chars': 60, 'max_articles': 1}
+    whole = extractor.extract(PAGE, 'https://example.com/news', 'stream', **budgets)
+    assert feed_in_chunks('stream', PAGE, size, **budgets) == whole
+    assert len(whole['text']) == 60 and len(whole['articles']) == 1
+
+
+def test_stream_parse_keeps_words_across_download_chunks(monkeypatch):
+    import scraper
+
+    class Response:
+        headers = {'Content-Type': 'text/html; charset=utf-8'}
+        body = PAGE.encode('utf-8')
+
+        def iter_content(self, chunk_size):
+            for i in range(0, len(self.body), chunk_size):
+                yield self.body[i:i + chunk_size]
+
+    monkeypatch.setattr(scraper, 'SCRAPE_PARSER', 'stream')
+    monkeypatch.setattr(scraper, 'CHUNK_BYTES', 5)
+    result = scraper._stream_parse(Response(), 'https://example.com/news')
+    assert result == extractor.extract(PAGE, 'https://example.com/news', 'stream', scraper.MAX_TEXT_CHARS,
+                                       scraper.SCRAPE_MAX_ARTICLES)
+    assert 'artificial intelligence' in result['text']
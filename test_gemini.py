@@ -17,6 +17,7 @@ def main():
         sys.exit(1)
 
     import requests
+    import http_transport
     url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
     payload = {
         "contents": [{"parts": [{"text": "Reply in one short sentence: confirm you are working."}]}],
@@ -24,7 +25,7 @@ def main():
     }
     print(f"Testing Gemini (model={model_name}, timeout=30s)...")
     try:
-        r = requests.post(url, params={"key": api_key}, json=payload, timeout=30)
+        r = http_transport.post(url, params={"key": api_key}, json=payload, timeout=30)
         r.raise_for_status()
         data = r.json()
         candidates = data.get("candidates") or []
@@ -46,10 +47,15 @@ def main():
         print("FAIL: Request timed out after 30s")
         sys.exit(1)
     except requests.exceptions.HTTPError as e:
-        code = e.response.status_code if e.response else None
+        # A 4xx/5xx Response is falsy, so compare with None
+        code = e.response.status_code if e.response is not None else None
         err = e.response.text if e.response is not None else str(e)
         if code == 429:
+            from rate_limiter import retry_after_seconds
+            delay = retry_after_seconds(e)
             print("FAIL: 429 Quota exceeded. Check plan/billing at https://ai.google.dev/gemini-api")
+            if delay is not None:
+                print(f"Server asks to retry in {delay:.0f}s (lower GEMINI_RPM/GEMINI_TPM in .env if this repeats)")
         else:
             print("FAIL:", code or "HTTP error", err[:200])
         sys.exit(1)
@@ -0,0 +1,149 @@
+"""
+Tests for llm_router.py: hedging (streamed and blocking calls), cancelling the losing
+attempt and the per-provider circuit breaker, with fake providers.
+
+    python -m pytest test_llm_router.py
+"""
+import threading
+import time
+
+import pytest
+
+import llm_router
+from config import LLM_BREAKER_COOLDOWN_SEC, LLM_BREAKER_FAILURE_THRESHOLD, LLM_HEDGE_MAX_DELAY_SEC
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_router, 'LLM_HEDGING', True)
+    return llm_router.RouterState(path=str(tmp_path / 'llm_state.json'))
+
+
+def streaming_provider(first_token_after: float, text: str, calls: list, chunks: int = 3):
+    def complete(system_prompt, user_prompt, on_chunk=None, **kwargs):
+        calls.append(on_chunk is not None)
+        time.sleep(first_token_after)
+        for _ in range(chunks):
+            if on_chunk is not None:
+                on_chunk(text)
+            time.sleep(0.02)
+        return text * chunks
+    return complete
+
+
+def blocking_provider(seconds: float, text: str, calls: list):
+    def complete(system_prompt, user_prompt, **kwargs):
+        calls.append('on_chunk' in kwargs)
+        time.sleep(seconds)
+        return text
+    return complete
+
+
+def test_no_hedge_when_the_primary_streams_in_time(state, monkeypatch):
+    monkeypatch.setattr(state, 'hedge_delay', lambda name, streaming=True: 0.5)
+    primary, backup = [], []
+    text = llm_router.complete('s', 'u', providers=[('a', streaming_provider(0.05, 'a', primary)),
+                                                    ('b', streaming_provider(0.0, 'b', backup))], state=state)
+    assert text == 'aaa' and primary == [True] and backup == []
+
+
+def test_hedge_when_the_first_token_is_late_and_the_loser_is_stopped(state, monkeypatch):
+    monkeypatch.setattr(state, 'hedge_delay', lambda name, streaming=True: 0.1)
+    primary, backup = [], []
+    text = llm_router.complete('s', 'u', providers=[('a', streaming_provider(0.6, 'a', primary, chunks=20)),
+                                                    ('b', streaming_provider(0.0, 'b', backup))], state=state)
+    assert text == 'bbb' and primary == [True] and backup == [True]
+    time.sleep(0.8)
+    # The loser raised AttemptCancelled at its first chunk: neither a success nor a failure
+    assert state._entry('a') == {'failures': 0, 'opened_at': None, 'ttft': [], 'latency': []}
+    assert state._entry('b')['latency'] and state._entry('b')['ttft']
+
+
+def test_blocking_calls_are_hedged_on_total_latency(state, monkeypatch):
+    monkeypatch.setattr(llm_router, 'LLM_STREAMING', False)
+    # Not enough history: wait up to LLM_HEDGE_MAX_DELAY_SEC
+    assert state.hedge_delay('a', streaming=False) == LLM_HEDGE_MAX_DELAY_SEC
+    for latency in [0.2] * llm_router.MIN_SAMPLES_FOR_P95:
+        state.record_success('a', None, latency)
+    assert state._entry('a')['ttft'] == []
+    monkeypatch.setattr(llm_router, 'LLM_HEDGE_MIN_DELAY_SEC', 0.1)
+    assert state.hedge_delay('a', streaming=False) == pytest.approx(0.2)
+
+    # Answering within its p95: the backup is never started, and no callback is passed
+    primary, backup = [], []
+    text = llm_router.complete('s', 'u', providers=[('a', blocking_provider(0.05, 'fast', primary)),
+                                                    ('b', blocking_provider(0.0, 'other', backup))], state=state)
+    assert text == 'fast' and primary == [False] and backup == []
+
+    # Slower than its p95: the backup is started and wins
+    primary, backup = [], []
+    text = llm_router.complete('s', 'u', providers=[('a', blocking_provider(1.0, 'slow', primary)),
+                                                    ('b', blocking_provider(0.0, 'backup', backup))], state=state)
+    assert text == 'backup' and backup == [False]
+
+
+def test_a_failed_primary_falls_back_without_waiting_for_the_hedge(state, monkeypatch):
+    monkeypatch.setattr(state, 'hedge_delay', lambda name, streaming=True: 10)
+
+    def failing(system_prompt, user_prompt, **kwargs):
+        raise ConnectionError("down")
+
+    started = time.monotonic()
+    text = llm_router.complete('s', 'u', providers=[('a', failing), ('b', blocking_provider(0.0, 'ok', []))],
+                               state=state)
+    assert text == 'ok' and time.monotonic() - started < 5
+    assert state._entry('a')['failures'] == 1
+
+
+def test_all_providers_failing_raises(state):
+    def empty(system_prompt, user_prompt, **kwargs):
+        return '  '
+
+    with pytest.raises(RuntimeError, match="All AI providers failed"):
+        llm_router.complete('s', 'u', providers=[('a', empty)], state=state)
+
+
+def test_circuit_breaker_opens_skips_and_closes(state):
+    for _ in range(LLM_BREAKER_FAILURE_THRESHOLD):
+        assert state.is_available('a')
+        state.record_failure('a')
+    opened_at = state._entry('a')['opened_at']
+    assert opened_at is not None
+    assert not state.is_available('a', now=opened_at + LLM_BREAKER_COOLDOWN_SEC - 1)
+    # Half-open after the cooldown: one failed trial opens it again at once
+    assert state.is_available('a', now=opened_at + LLM_BREAKER_COOLDOWN_SEC)
+    state.record_failure('a')
+    assert state._entry('a')['opened_at'] >= opened_at
+    state.record_success('a', 0.5, 1.0)
+    assert state.is_available('a') and state._entry('a')['failures'] == 0
+
+
+def test_open_circuit_is_skipped_by_complete(state):
+    for _ in range(LLM_BREAKER_FAILURE_THRESHOLD):
+        state.record_failure('a')
+    primary, backup = [], []
+    text = llm_router.complete('s', 'u', providers=[('a', blocking_provider(0.0, 'a', primary)),
+                                                    ('b', blocking_provider(0.0, 'b', backup))], state=state)
+    assert text == 'b' and primary == [] and len(backup) == 1
+
+
+def test_state_persists(state, tmp_path):
+    state.record_success('a', 0.4, 2.0)
+    state.save()
+    loaded = llm_router.RouterState(path=str(tmp_path / 'llm_state.json'))
+    assert loaded._entry('a')['latency'] == [2.0]
+
+
+def test_streamed_output_comes_from_one_provider(state, monkeypatch):
+    monkeypatch.setattr(state, 'hedge_delay', lambda name, streaming=True: 0.05)
+    seen = []
+    lock = threading.Lock()
+
+    def on_chunk(chunk):
+        with lock:
+            seen.append(chunk)
+
+    text = llm_router.complete('s', 'u', providers=[('a', streaming_provider(0.3, 'a', [], chunks=5)),
+                                                    ('b', streaming_provider(0.0, 'b', []))],
+                               on_chunk=on_chunk, state=state)
+    assert text == 'bbb' and set(seen) == {'b'}
@@ -0,0 +1,119 @@
+"""
+Tests for newsletter_markdown.py: the AST built from the model's output, inline bold and
+links, the format drift it accepts, and the text/HTML renderings of one AST.
+
+    python -m pytest test_newsletter_markdown.py
+"""
+import pytest
+
+from newsletter_markdown import (Bold, Link, Newsletter, Section, Text, inline_html, parse, parse_inline,
+                                 plain_text, render_text)
+
+CANONICAL = """**Stripe Opens Its Ledger**
+
+Stripe launched a public API for its ledger.
+Finance teams no longer need CSV exports.
+
+Strategic insight: Platforms absorb what is built on them.
+
+Your move: Read the [launch post](https://stripe.com/blog/ledger).
+
+**Open Coding Agents Catch Up**
+
+An open-weight agent resolved 48% of issues.
+
+Strategic insight: Value moves to the tooling.
+
+Your move: Try one locally.
+
+Key takeaways:
+
+- Platforms absorb products built on their data.
+- Open models are **good enough** now."""
+
+
+def test_canonical_format_builds_the_ast():
+    doc = parse(CANONICAL)
+    assert doc.intro == []
+    assert [plain_text(s.title) for s in doc.sections] == ['Stripe Opens Its Ledger', 'Open Coding Agents Catch Up']
+    first = doc.sections[0]
+    # Consecutive lines are one paragraph
+    assert first.paragraphs == [[Text('Stripe launched a public API for its ledger. '
+                                      'Finance teams no longer need CSV exports.')]]
+    assert first.insight == [Text('Platforms absorb what is built on them.')]
+    assert first.action == [Text('Read the '), Link([Text('launch post')], 'https://stripe.com/blog/ledger'),
+                            Text('.')]
+    assert [plain_text(t) for t in doc.takeaways] == ['Platforms absorb products built on their data.',
+                                                      'Open models are good enough now.']
+    assert doc.takeaways[1][1] == Bold([Text('good enough')])
+
+
+def test_inline_bold_and_links():
+    assert parse_inline('plain text') == [Text('plain text')]
+    assert parse_inline('a **bold [link](https://x.io/a)** b') == [
+        Text('a '), Bold([Text('bold '), Link([Text('link')], 'https://x.io/a')]), Text(' b')]
+    # Trailing punctuation is not part of a bare URL
+    assert parse_inline('see https://x.io/a, then') == [
+        Text('see '), Link([Text('https://x.io/a')], 'https://x.io/a'), Text(', then')]
+
+
+@pytest.mark.parametrize('content', [
+    # Markdown headings, numbered and bold labels, "Key takeaways" as a heading
+    "## Stripe Opens Its Ledger\n\nStripe launched an API.\n\n**Strategic Insight:** Platforms absorb.\n\n"
+    "**Your Move:** Read it.\n\n## Key Takeaways\n\n- One\n- Two",
+    "1. **Stripe Opens Its Ledger**\n\nStripe launched an API.\n\nstrategic insight: Platforms absorb.\n"
+    "YOUR MOVE: Read it.\n\n**Key takeaways:**\n* One\n* Two",
+    "# MBT Newsletter\n\n### 1. Stripe Opens Its Ledger\nStripe launched an API.\n\n"
+    "Strategic insight: Platforms absorb.\n\nYour move: Read it.\n\nKey takeaways: One\n- Two",
+])
+def test_drifted_formats_give_the_same_structure(content):
+    doc = parse(content)
+    assert doc.intro == []
+    assert doc.sections == [Section([Text('Stripe Opens Its Ledger')], [[Text('Stripe launched an API.')]],
+                                    [Text('Platforms absorb.')], [Text('Read it.')])]
+    assert [plain_text(t) for t in doc.takeaways] == ['One', 'Two']
+
+
+def test_text_before_the_first_story_is_the_intro():
+    doc = parse("# MBT Newsletter\n\nHere is this week's issue.\n\n**A Story Title**\n\nBody.")
+    assert doc.intro == [[Text("Here is this week's issue.")]]
+    assert len(doc.sections) == 1
+
+
+def test_unrecognized_output_is_all_intro():
+    doc = parse("The model ignored the format.\n\nIt wrote two paragraphs.")
+    assert doc == Newsletter(intro=[[Text('The model ignored the format.')], [Text('It wrote two paragraphs.')]])
+
+
+def test_text_rendering_parses_back_to_the_same_ast():
+    doc = parse(CANONICAL)
+    text = render_text(doc)
+    assert parse(text) == doc
+    assert 'Your move: Read the [launch post](https://stripe.com/blog/ledger).' in text
+    assert '- Open models are **good enough** now.' in text
+
+
+def test_html_rendering_of_the_same_ast():
+    doc = parse(CANONICAL)
+    assert inline_html(doc.sections[0].action) == \
+        'Read the <a href="https://stripe.com/blog/ledger">launch post</a>.'
+    assert inline_html(doc.takeaways[1]) == 'Open models are <strong>good enough</strong> now.'
+
+
+def test_html_is_escaped_and_unsafe_links_dropped():
+    spans = parse_inline('<b>x</b> & [click](javascript:alert(1)) [ok](mailto:a@b.c)')
+    rendered = inline_html(spans)
+    assert '&lt;b&gt;x&lt;/b&gt; &amp; ' in rendered
+    assert 'javascript:' not in rendered and '<a href="mailto:a@b.c">ok</a>' in rendered
+
+
+def test_email_html_and_text_come_from_one_parse():
+    from email_sender import render_html
+
+    doc = parse(CANONICAL)
+    page = render_html(doc)
+    for section in doc.sections:
+        assert inline_html(section.title) in page
+        assert inline_html(section.insight) in page
+    assert inline_html(doc.takeaways[1]) in page
+    assert plain_text(doc.sections[1].title) in render_text(doc)
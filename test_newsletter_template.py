@@ -0,0 +1,69 @@
+"""
+Tests for newsletter_template.py and the email rendered with it: fragment slots,
+escaping of the newsletter text and the per-recipient slots filled in at send time.
+
+    python -m pytest test_newsletter_template.py
+"""
+import email
+from email import policy
+
+import pytest
+
+from email_sender import render_html, render_message
+from newsletter_markdown import parse
+from newsletter_template import Fragment, load_template
+from smtp_delivery import RECIPIENT_HTML_SLOT, RECIPIENT_SLOT, message_for
+
+NEWSLETTER = """**Acme <script>alert(1)</script> & Co Raise "Series B"**
+
+Acme raised $40M from [Big VC](https://example.com/?a=1&b=2).
+
+Strategic insight: <b>Raw</b> HTML stays text.
+
+Your move: Read it.
+
+Key takeaways:
+
+- One & two"""
+
+
+def test_fragment_fills_slots_in_place():
+    fragment = Fragment('<p class="x">{{text}}</p>{{a}}{{b}} and {{text}}')
+    assert fragment.slots == ['text', 'a', 'b']
+    assert fragment.render(text='hi', a='1', b='2') == '<p class="x">hi</p>12 and hi'
+    assert Fragment('no slots').render() == 'no slots'
+
+
+def test_fragment_without_a_value_for_a_slot_raises():
+    with pytest.raises(ValueError, match="'b'"):
+        Fragment('{{a}}{{b}}').render(a='1')
+
+
+def test_template_blocks_are_fragments():
+    template = load_template()
+    for name in ('page', 'card', 'paragraph', 'insight', 'action', 'takeaways', 'intro'):
+        assert isinstance(template[name], Fragment)
+    assert 'card' in template['page'].slots and 'recipient' in template['page'].slots
+
+
+def test_rendered_html_escapes_newsletter_text():
+    page = render_html(parse(NEWSLETTER))
+    assert '<script>' not in page and '&lt;script&gt;alert(1)&lt;/script&gt; &amp; Co' in page
+    assert '&quot;Series B&quot;' in page
+    assert '&lt;b&gt;Raw&lt;/b&gt; HTML stays text.' in page
+    assert '<a href="https://example.com/?a=1&amp;b=2">Big VC</a>' in page
+    assert 'One &amp; two' in page
+    # The recipient is filled in per message, after rendering
+    assert page.count(RECIPIENT_HTML_SLOT) == 1
+
+
+def test_per_recipient_slots_are_filled_and_escaped():
+    rendered = render_message(NEWSLETTER, 'MBT Newsletter - Test')
+    assert RECIPIENT_SLOT.encode() in rendered and RECIPIENT_HTML_SLOT.encode() in rendered
+    recipient = "o'brien&co@example.com"
+    msg = email.message_from_bytes(message_for(recipient, rendered), policy=policy.SMTP)
+    assert msg['To'] == recipient
+    text, page = (part.get_content() for part in msg.iter_parts())
+    assert text.rstrip().endswith(f"Sent to {recipient}")
+    assert 'o&#x27;brien&amp;co@example.com' in page
+    assert '{{' not in text and '{{' not in page
@@ -0,0 +1,177 @@
+"""
+Tests for rate_limiter.py with an injected clock: token-bucket refill, the shared quota and
+429 pauses, Retry-After (seconds and HTTP-date forms), Gemini RetryInfo and the retry loop.
+
+    python -m pytest test_rate_limiter.py
+"""
+import json
+from datetime import datetime, timezone
+
+import pytest
+import requests
+
+from rate_limiter import RateLimiter, RateLimitTimeout, TokenBucket, call_with_limits, retry_after_seconds
+
+NOW = datetime(2026, 1, 5, 8, 0, 0, tzinfo=timezone.utc)
+
+
+class Clock:
+    """Monotonic clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def http_error(status: int, headers=None, body=None) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = json.dumps(body).encode() if body is not None else b'Too Many Requests'
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def retry_info(delay: str) -> dict:
+    return {'error': {'code': 429, 'details': [
+        {'@type': 'type.googleapis.com/google.rpc.QuotaFailure', 'violations': []},
+        {'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': delay},
+    ]}}
+
+
+def test_token_bucket_refills_continuously():
+    bucket = TokenBucket(60, 1.0, now=0.0)
+    assert bucket.wait_time(60, 0.0) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, 0.0) == 1.0
+    assert bucket.wait_time(1, 0.25) == pytest.approx(0.75)
+    assert bucket.wait_time(30, 10.0) == pytest.approx(20.0)
+    # Refill stops at capacity, and a request above it waits for a full bucket
+    assert bucket.wait_time(60, 500.0) == 0 and bucket.tokens == 60
+    bucket.take(100)
+    assert bucket.tokens == 0 and bucket.wait_time(100, 500.0) == 60.0
+
+
+def test_requests_per_minute_quota():
+    clock = Clock()
+    limiter = RateLimiter('test', rpm=2, tpm=0, clock=clock)
+    assert limiter.acquire(1) == 0 and limiter.acquire(1) == 0
+    # The third request needs 30s of refill: past a 10s deadline, so it fails at once
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(1, deadline=clock() + 10)
+    clock.advance(30)
+    assert limiter.acquire(1, deadline=clock() + 10) == 0
+    assert limiter.metrics()['calls'] == 3
+
+
+def test_tokens_per_minute_quota():
+    clock = Clock()
+    limiter = RateLimiter('test', rpm=0, tpm=1000, clock=clock)
+    limiter.acquire(800)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(500, deadline=clock() + 17)
+    # 300 more tokens at 1000/min take 18s
+    clock.advance(18)
+    limiter.acquire(500, deadline=clock() + 1)
+
+
+def test_block_for_pauses_every_caller():
+    clock = Clock()
+    limiter = RateLimiter('test', rpm=0, tpm=0, clock=clock)
+    limiter.block_for(5)
+    limiter.block_for(2)  # a shorter pause does not shorten the first
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(1, deadline=clock() + 4)
+    clock.advance(5)
+    assert limiter.acquire(1, deadline=clock()) == 0
+    assert limiter.metrics()['throttled'] == 2
+
+
+@pytest.mark.parametrize('value, seconds', [
+    ('30', 30.0),
+    (' 7 ', 7.0),
+    ('0', 0.0),
+    ('Mon, 05 Jan 2026 08:01:30 GMT', 90.0),
+    ('Mon, 05 Jan 2026 08:01:30 -0000', 90.0),
+    ('Mon, 05 Jan 2026 09:01:30 +0100', 90.0),
+    # A date already past means "now"
+    ('Mon, 05 Jan 2026 07:59:00 GMT', 0.0),
+])
+def test_retry_after_header(value, seconds):
+    assert retry_after_seconds(http_error(429, {'Retry-After': value}), now=NOW) == seconds
+
+
+def test_retry_after_header_name_is_case_insensitive():
+    assert retry_after_seconds(http_error(503, {'retry-after': '12'}), now=NOW) == 12.0
+
+
+@pytest.mark.parametrize('delay, seconds', [('12s', 12.0), ('1.5s', 1.5), ('0s', 0.0), ('soon', None)])
+def test_gemini_retry_info(delay, seconds):
+    assert retry_after_seconds(http_error(429, body=retry_info(delay)), now=NOW) == seconds
+
+
+def test_retry_after_header_wins_over_retry_info():
+    error = http_error(429, {'Retry-After': '3'}, retry_info('40s'))
+    assert retry_after_seconds(error, now=NOW) == 3.0
+    # An unparseable header falls back to the RetryInfo detail
+    error = http_error(429, {'Retry-After': 'later'}, retry_info('40s'))
+    assert retry_after_seconds(error, now=NOW) == 40.0
+
+
+def test_no_requested_delay():
+    assert retry_after_seconds(http_error(429), now=NOW) is None
+    assert retry_after_seconds(http_error(429, body={'error': {'code': 429}}), now=NOW) is None
+    assert retry_after_seconds(ConnectionError('down')) is None
+
+
+def failing(errors, result='ok'):
+    """fn for call_with_limits: raises `errors` in turn, then returns `result`."""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn, calls
+
+
+def test_429_pauses_the_provider_then_retries():
+    clock = Clock()
+    limiter = RateLimiter('test', rpm=0, tpm=0, clock=clock)
+    fn, calls = failing([http_error(429, {'Retry-After': '0'})])
+    assert call_with_limits(limiter, fn, 10, deadline_sec=60) == 'ok'
+    assert len(calls) == 2
+    assert limiter.metrics()['throttled'] == 1 and limiter.metrics()['retries'] == 1
+
+
+def test_5xx_is_retried_without_pausing_other_callers():
+    limiter = RateLimiter('test', rpm=0, tpm=0, clock=Clock())
+    fn, calls = failing([http_error(503, {'Retry-After': '0'}), http_error(500, {'Retry-After': '0'})])
+    assert call_with_limits(limiter, fn, 10, deadline_sec=60) == 'ok'
+    assert len(calls) == 3 and limiter.metrics()['throttled'] == 0
+
+
+def test_a_retry_past_the_deadline_gives_up_at_once():
+    limiter = RateLimiter('test', rpm=0, tpm=0, clock=Clock())
+    error = http_error(429, body=retry_info('120s'))
+    fn, calls = failing([error])
+    with pytest.raises(requests.HTTPError) as raised:
+        call_with_limits(limiter, fn, 10, deadline_sec=60)
+    assert raised.value is error and len(calls) == 1
+    assert limiter.metrics()['retries'] == 0
+
+
+def test_other_errors_are_not_retried():
+    limiter = RateLimiter('test', rpm=0, tpm=0, clock=Clock())
+    fn, calls = failing([http_error(400)])
+    with pytest.raises(requests.HTTPError):
+        call_with_limits(limiter, fn, 10, deadline_sec=60)
+    fn, calls = failing([ValueError('bad response')])
+    with pytest.raises(ValueError):
+        call_with_limits(limiter, fn, 10, deadline_sec=60)
+    assert len(calls) == 1
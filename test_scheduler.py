@@ -0,0 +1,161 @@
+"""
+Tests for scheduler.py: the next send time for a fixed `now` (first run, catch-up after
+downtime, late sends), the lead time before it, retries, and the `--send-at` hand-off
+to the child process.
+
+    python -m pytest test_scheduler.py
+"""
+import subprocess
+import sys
+from datetime import datetime
+
+import pytest
+
+import config
+import scheduler
+from scheduler import get_last_run, next_send_time, plan_run, run_newsletter, update_last_run
+
+NOW = datetime(2026, 1, 10, 12, 30, 15)
+
+
+@pytest.fixture(autouse=True)
+def schedule(monkeypatch):
+    """Every 5 days at 08:00, preparing 60 minutes ahead, retrying after 30."""
+    monkeypatch.setattr(config, 'SCHEDULE_INTERVAL_DAYS', 5)
+    monkeypatch.setattr(config, 'SCHEDULE_SEND_TIME', '08:00')
+    monkeypatch.setattr(config, 'SCHEDULE_LEAD_MINUTES', 60)
+    monkeypatch.setattr(config, 'SCHEDULE_RETRY_MINUTES', 30)
+
+
+def test_first_run_is_the_next_send_time_of_day():
+    # 08:00 has passed today: tomorrow
+    assert next_send_time(None, NOW) == datetime(2026, 1, 11, 8, 0)
+    assert next_send_time(None, datetime(2026, 1, 10, 7, 59)) == datetime(2026, 1, 10, 8, 0)
+    # Exactly at the send time counts as passed
+    assert next_send_time(None, datetime(2026, 1, 10, 8, 0)) == datetime(2026, 1, 11, 8, 0)
+
+
+def test_next_send_is_the_interval_after_the_last_send():
+    assert next_send_time(datetime(2026, 1, 8, 8, 0, 4), NOW) == datetime(2026, 1, 13, 8, 0)
+
+
+def test_a_late_send_does_not_push_the_schedule_back():
+    # Sent at 21:40 (after a catch-up): the next issue is still at 08:00
+    assert next_send_time(datetime(2026, 1, 8, 21, 40), NOW) == datetime(2026, 1, 13, 8, 0)
+
+
+def test_a_missed_send_time_is_caught_up_now():
+    # Due on Jan 6 while the scheduler was down: one issue right away, not one per missed interval
+    assert next_send_time(datetime(2026, 1, 1, 8, 0), NOW) == NOW
+    assert next_send_time(datetime(2025, 11, 1, 8, 0), NOW) == NOW
+    # The schedule then continues from the catch-up
+    assert next_send_time(NOW, NOW) == datetime(2026, 1, 15, 8, 0)
+
+
+def test_send_time_setting_is_validated(monkeypatch):
+    monkeypatch.setattr(config, 'SCHEDULE_SEND_TIME', '14:05')
+    assert next_send_time(None, NOW) == datetime(2026, 1, 10, 14, 5)
+    for bad in ('8am', '24:00', '08:60', '08'):
+        monkeypatch.setattr(config, 'SCHEDULE_SEND_TIME', bad)
+        with pytest.raises(ValueError, match='SCHEDULE_SEND_TIME'):
+            next_send_time(None, NOW)
+
+
+def test_preparation_starts_the_lead_time_before_sending():
+    assert plan_run(datetime(2026, 1, 8, 8, 0), NOW) == (datetime(2026, 1, 13, 7, 0), datetime(2026, 1, 13, 8, 0))
+
+
+def test_lead_time_crossing_the_send_time_starts_at_once():
+    # 20 minutes before the send time with a 60-minute lead: the start is already past
+    now = datetime(2026, 1, 13, 7, 40)
+    start_at, send_at = plan_run(datetime(2026, 1, 8, 8, 0), now)
+    assert start_at < now and send_at == datetime(2026, 1, 13, 8, 0)
+    # A caught-up issue is prepared and sent right away
+    start_at, send_at = plan_run(datetime(2026, 1, 1, 8, 0), NOW)
+    assert start_at < NOW and send_at == NOW
+
+
+def test_a_retry_never_starts_or_sends_early():
+    retry_at = datetime(2026, 1, 10, 13, 0)
+    # The catch-up failed: both wait for the retry
+    assert plan_run(datetime(2026, 1, 1, 8, 0), NOW, retry_at) == (retry_at, retry_at)
+    # A retry before the regular start changes nothing
+    assert plan_run(datetime(2026, 1, 8, 8, 0), NOW, retry_at) == \
+        (datetime(2026, 1, 13, 7, 0), datetime(2026, 1, 13, 8, 0))
+
+
+def test_last_run_round_trip(tmp_path):
+    path = str(tmp_path / 'last_run.json')
+    assert get_last_run(path) is None
+    update_last_run(NOW, path)
+    assert get_last_run(path) == NOW
+    (tmp_path / 'last_run.json').write_text('not json')
+    assert get_last_run(path) is None
+
+
+@pytest.fixture
+def child(monkeypatch, tmp_path):
+    """Commands passed to subprocess.run; set `returncode` to the exit code to report."""
+    monkeypatch.chdir(tmp_path)
+    commands = []
+
+    def run(command):
+        commands.append(command)
+        return subprocess.CompletedProcess(command, run.returncode)
+
+    run.returncode = 0
+    monkeypatch.setattr(scheduler.subprocess, 'run', run)
+    return commands, run
+
+
+def test_send_time_is_handed_to_the_child(child):
+    commands, _ = child
+    send_at = datetime(2026, 1, 13, 8, 0, 0, 250000)
+    assert run_newsletter(send_at, profiles=True)
+    command = commands[0]
+    assert command[0] == sys.executable and command[1].endswith('main.py')
+    assert command[2:] == ['--profiles', '--send-at', '2026-01-13T08:00:00']
+    # What main.py parses back (it drops --profiles before reading the mode)
+    assert datetime.fromisoformat(command[-1]) == send_at.replace(microsecond=0)
+    # The send is recorded for the next schedule
+    assert get_last_run() is not None
+
+    assert run_newsletter()
+    assert commands[1][2:] == []
+
+
+def test_a_failed_child_is_not_recorded(child):
+    commands, run = child
+    run.returncode = 1
+    assert not run_newsletter(NOW)
+    assert get_last_run() is None
+
+
+def test_main_rejects_a_bad_send_time():
+    result = subprocess.run([sys.executable, 'main.py', '--send-at', 'tomorrow'], capture_output=True, text=True,
+                            cwd=scheduler.os.path.dirname(scheduler.__file__), timeout=60)
+    assert result.returncode == 1 and "--send-at expects a time" in result.stderr
+
+
+def test_scheduler_retries_a_failed_run(monkeypatch):
+    sleeps, sends, outcomes = [], [], [False, True]
+
+    def sleep_until(when):
+        if not outcomes:
+            raise KeyboardInterrupt
+        sleeps.append(when)
+
+    def run(send_at, profiles):
+        sends.append((send_at, datetime.now()))
+        return outcomes.pop(0)
+
+    monkeypatch.setattr(scheduler, 'sleep_until', sleep_until)
+    monkeypatch.setattr(scheduler, 'run_newsletter', run)
+    monkeypatch.setattr(scheduler, 'get_last_run', lambda: None)
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.start_scheduler()
+    (first_send, failed_at), (retry_send, _) = sends
+    # No last run: prepared SCHEDULE_LEAD_MINUTES before the next 08:00
+    assert first_send.strftime('%H:%M') == '08:00' and (first_send - sleeps[0]).total_seconds() == 3600
+    # The retry waits SCHEDULE_RETRY_MINUTES and never sends before it starts
+    assert (sleeps[1] - failed_at).total_seconds() >= 30 * 60 and retry_send >= sleeps[1]
@@ -0,0 +1,43 @@
+"""
+Tests for the charset handling of scraper._stream_parse.
+
+    python -m pytest test_scraper.py
+"""
+import pytest
+
+import scraper
+
+HEADLINE = '<a href="/a">Café chain raises a new round</a>'
+
+
+class Response:
+    def __init__(self, body: bytes, content_type: str = 'text/html'):
+        self.body = body
+        self.headers = {'Content-Type': content_type}
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+@pytest.mark.parametrize('content_type, head, expected', [
+    ('text/html; charset=ISO-8859-1', b'', 'ISO-8859-1'),
+    ('text/html', b'<meta charset="windows-1252">', 'windows-1252'),
+    ('text/html', b'', 'utf-8'),
+    ('text/html; charset=bogus-charset', b'', 'utf-8'),
+    ('text/html', b'<meta charset="x-user-defined-bogus">', 'utf-8'),
+])
+def test_declared_charset(content_type, head, expected):
+    assert scraper._declared_charset(Response(b'', content_type), head) == expected
+
+
+def test_unknown_meta_charset_falls_back_to_utf8():
+    body = f'<html><head><meta charset="x-user-defined-bogus"></head><body>{HEADLINE}</body></html>'
+    result = scraper._stream_parse(Response(body.encode('utf-8')), 'https://example.com/')
+    assert result['articles'][0]['title'] == 'Café chain raises a new round'
+
+
+def test_meta_charset_is_used():
+    body = f'<html><head><meta charset="windows-1252"></head><body>{HEADLINE}</body></html>'
+    result = scraper._stream_parse(Response(body.encode('windows-1252')), 'https://example.com/')
+    assert result['articles'][0]['title'] == 'Café chain raises a new round'
@@ -0,0 +1,162 @@
+"""
+Tests for smtp_delivery.py: the resumable delivery journal, retries of failed
+recipients and the per-recipient To header and slots of message_for.
+SMTP sessions are fakes recording what they were asked to send.
+
+    python -m pytest test_smtp_delivery.py
+"""
+import email
+import smtplib
+from email import policy
+
+import pytest
+
+import smtp_delivery
+from email_sender import render_message
+from smtp_delivery import DeliveryError, DeliveryJournal, deliver, issue_id_for, message_for
+
+RENDERED = render_message("**A Story Title Here**\n\nSome text.", "MBT Newsletter - Test")
+
+
+class FakeSMTP:
+    """Records sendmail() calls; `failures` maps a recipient to the errors its next sends raise."""
+
+    def __init__(self, sent: list, failures: dict):
+        self.sent = sent
+        self.failures = failures
+
+    def sendmail(self, sender, recipients, message, mail_options=()):
+        self.mail_options = mail_options
+        errors = self.failures.get(recipients[0])
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((recipients[0], message))
+
+    def noop(self):
+        return 250, b'OK'
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    """(connect_fn, sent, failures, connections) for deliver(); retries do not sleep."""
+    monkeypatch.setattr(smtp_delivery, 'RETRY_BACKOFF_MAX_SEC', 0)
+    sent, failures, connections = [], {}, []
+
+    def connect():
+        connections.append(1)
+        return FakeSMTP(sent, failures)
+
+    return connect, sent, failures, connections
+
+
+def run(connect, tmp_path, recipients, **kwargs):
+    return deliver(RENDERED, recipients, 'issue', connect_fn=connect, concurrency=2, max_per_minute=0,
+                   journal_dir=str(tmp_path), **kwargs)
+
+
+def test_resume_skips_recipients_already_journaled(smtp, tmp_path):
+    connect, sent, _, _ = smtp
+    (tmp_path / 'issue.log').write_text('a@example.com\n', encoding='utf-8')
+    report = run(connect, tmp_path, ['a@example.com', 'b@example.com', 'c@example.com', 'b@example.com'])
+    assert report['skipped'] == 1 and report['sent'] == 2 and report['failed'] == {}
+    assert sorted(r for r, _ in sent) == ['b@example.com', 'c@example.com']
+    assert DeliveryJournal('issue', str(tmp_path)).delivered() == {'a@example.com', 'b@example.com', 'c@example.com'}
+    # Everything delivered: a rerun sends nothing
+    assert run(connect, tmp_path, ['a@example.com', 'b@example.com'])['sent'] == 0
+    assert len(sent) == 2
+
+
+def test_transient_failure_is_retried_on_a_new_connection(smtp, tmp_path):
+    connect, sent, failures, connections = smtp
+    failures['b@example.com'] = [smtplib.SMTPServerDisconnected('dropped'),
+                                 smtplib.SMTPRecipientsRefused({'b@example.com': (451, b'try later')})]
+    report = run(connect, tmp_path, ['a@example.com', 'b@example.com'], max_messages_per_connection=0)
+    assert report['sent'] == 2 and report['failed'] == {}
+    assert sorted(r for r, _ in sent) == ['a@example.com', 'b@example.com']
+    # b's session reconnected after each error
+    assert report['connections'] == len(connections) >= 3
+
+
+def test_failed_recipient_is_retried_by_the_next_run(smtp, tmp_path):
+    connect, sent, failures, _ = smtp
+    failures['b@example.com'] = [smtplib.SMTPRecipientsRefused({'b@example.com': (550, b'no such user')})]
+    with pytest.raises(DeliveryError) as raised:
+        run(connect, tmp_path, ['a@example.com', 'b@example.com', 'c@example.com'])
+    assert list(raised.value.report['failed']) == ['b@example.com']
+    assert 'b@example.com' not in DeliveryJournal('issue', str(tmp_path)).delivered()
+
+    sent.clear()
+    report = run(connect, tmp_path, ['a@example.com', 'b@example.com', 'c@example.com'])
+    assert report['skipped'] == 2 and report['sent'] == 1
+    assert [r for r, _ in sent] == ['b@example.com']
+
+
+def test_authentication_error_stops_the_delivery(smtp, tmp_path):
+    def connect():
+        raise smtplib.SMTPAuthenticationError(535, b'bad credentials')
+
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        run(connect, tmp_path, ['a@example.com', 'b@example.com'])
+    assert DeliveryJournal('issue', str(tmp_path)).delivered() == set()
+
+
+def test_connections_are_recycled_after_the_cap(smtp, tmp_path):
+    connect, sent, _, connections = smtp
+    recipients = [f"user{i}@example.com" for i in range(10)]
+    report = deliver(RENDERED, recipients, 'issue', connect_fn=connect, concurrency=1, max_per_minute=0,
+                     max_messages_per_connection=3, journal_dir=str(tmp_path))
+    assert report['sent'] == 10 and len(connections) == 4
+
+
+def parts(message: bytes):
+    """(To header as sent, Subject, text part, HTML part)."""
+    head = message.split(b'\r\n\r\n', 1)[0].decode('utf-8')
+    to = head.split('\r\n', 1)[0] if head.startswith('To:') else None
+    msg = email.message_from_bytes(message, policy=policy.SMTP)
+    text, page = (part.get_content() for part in msg.iter_parts())
+    return to, msg['Subject'], text, page
+
+
+@pytest.mark.parametrize('recipient', [
+    'ana@example.com',
+    'josé.müller@exämple.de',
+    'o\'brien&co@example.com',
+    'a.very.long.local.part.' * 8 + 'end@subdomain.of.a.rather.long.example-domain.com',
+])
+def test_message_for_fills_to_header_and_slots(recipient):
+    message = message_for(recipient, RENDERED)
+    to, subject, text, page = parts(message)
+    # A long address is one token: it is never split across lines
+    assert to == f"To: {recipient}"
+    assert subject == 'MBT Newsletter - Test'
+    assert text.rstrip().endswith(f"Sent to {recipient}")
+    assert recipient.replace('&', '&amp;').replace("'", '&#x27;') in page
+    assert b'{{recipient' not in message
+    # Header folding and quoted-printable keep every line within the SMTP limit
+    assert max(len(line) for line in message.split(b'\r\n')) <= 998
+
+
+def test_non_ascii_recipient_is_sent_with_smtputf8(smtp, tmp_path):
+    connect, sent, _, _ = smtp
+    servers = []
+    report = run(lambda: servers.append(connect()) or servers[-1], tmp_path, ['josé@exämple.de'])
+    assert report['sent'] == 1 and servers[0].mail_options == ('SMTPUTF8',)
+    assert sent[0][1].startswith('To: josé@exämple.de\r\n'.encode('utf-8'))
+
+
+def test_message_for_does_not_change_the_rendered_message():
+    first = message_for('a@example.com', RENDERED)
+    second = message_for('b@example.com', RENDERED)
+    assert b'a@example.com' not in second and b'b@example.com' not in first
+    assert RENDERED.count(b'{{recipient}}') == 1
+
+
+def test_issue_id_for():
+    assert issue_id_for('MBT Newsletter - January 05, 2026') == 'mbt-newsletter-january-05-2026'
+    assert issue_id_for('!!!') == 'issue'